@@ -0,0 +1,91 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.auth import require_admin_key
+from app.api.v1.schemas import DeviceTokensResponse, GrantReport
+from app.database import get_db
+from app.models.ledger import TokenLedgerEntry
+from app.models.token import GenerationToken, device_key
+from app.services.grant_service import apply_grants, iter_lines
+from app.services.vision_archive import get_archived
+from app.services.vision_cache import normalize_concept
+
+router = APIRouter(dependencies=[Depends(require_admin_key)])
+
+
+@router.post("/admin/grants", response_model=GrantReport, response_class=ORJSONResponse)
+async def grant_tokens(
+    request: Request,
+    batch_id: str = Query(..., min_length=1, max_length=100),
+    content_type: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Grant tokens to many devices from a CSV (text/csv) or NDJSON body.
+    
+    Lines are device_id,amount[,reason] or {"device_id", "amount", "reason"}.
+    The body is applied as it streams in, in chunked transactions; sending
+    the same batch_id again only grants what the earlier attempt didn't.
+    """
+    format = "csv" if content_type and content_type.startswith("text/csv") else "ndjson"
+    return await apply_grants(db, batch_id, iter_lines(request.stream()), format)
+
+
+@router.get("/admin/tokens/{device_id}", response_model=DeviceTokensResponse, response_class=ORJSONResponse)
+async def get_device_tokens(
+    device_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """A device's balance and its latest ledger entries."""
+    key = device_key(device_id)
+    token = (await db.execute(
+        select(GenerationToken).where(GenerationToken.device_key == key)
+    )).scalar_one_or_none()
+    if token is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    
+    entries = await db.execute(
+        select(TokenLedgerEntry)
+        .where(TokenLedgerEntry.device_key == key)
+        .order_by(TokenLedgerEntry.id.desc())
+        .limit(limit)
+    )
+    return {
+        "device_id": token.device_id,
+        "tokens_remaining": token.tokens_remaining,
+        "tokens_purchased": token.tokens_purchased,
+        "free_trial_used": token.free_trial_used,
+        "free_trial_available": not token.free_trial_used,
+        "ledger": [
+            {
+                "kind": entry.kind,
+                "account": entry.account,
+                "amount": entry.amount,
+                "reason": entry.reason,
+                "batch_id": entry.batch_id,
+                "created_at": entry.created_at,
+            }
+            for entry in entries.scalars()
+        ],
+    }
+
+
+@router.get("/admin/archive/visions", response_class=ORJSONResponse)
+async def get_archived_vision(
+    concept: str = Query(..., min_length=1, max_length=200),
+    language: str = Query("en", max_length=8),
+):
+    """The latest archived vision of a concept, with when it was archived."""
+    try:
+        record = await asyncio.to_thread(get_archived, normalize_concept(concept), language)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if record is None:
+        raise HTTPException(status_code=404, detail="Not archived")
+    return record
@@ -0,0 +1,13 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.config import get_settings
+
+
+async def require_admin_key(x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """Dependency for admin endpoints: X-Admin-Key must match ADMIN_API_KEY, which must be set."""
+    admin_key = get_settings().admin_api_key
+    if not admin_key or not x_admin_key or not hmac.compare_digest(x_admin_key, admin_key):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
@@ -4,13 +4,13 @@ import json
 from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import httpx
 from typing import Optional
 
 from app.database import get_db
 from app.config import get_settings
 from app.api.v1.schemas import CheckoutRequest, CheckoutResponse
 from app.models.payment import PaymentTransaction
+from app.services.reconciliation import settle_pending
 from app.services.token_service import add_tokens
 from app.metrics import payment_success, payment_revenue, TOOL_NAME
 
@@ -50,10 +50,11 @@ async def create_checkout(
     product = PRODUCTS[request.product_sku]
     creem_product_id = product_ids[request.product_sku]
     
-    # Create checkout with Creem API
+    # Create checkout with Creem API (httpx imported lazily to keep startup fast)
+    import httpx
     async with httpx.AsyncClient() as client:
         response = await client.post(
-            "https://api.creem.io/v1/checkouts",
+            f"{settings.creem_api_url}/v1/checkouts",
             headers={
                 "Authorization": f"Bearer {settings.creem_api_key}",
                 "Content-Type": "application/json",
@@ -127,16 +128,14 @@ async def handle_webhook(
         result = await db.execute(stmt)
         transaction = result.scalar_one_or_none()
         
-        if transaction and transaction.status == "pending":
-            # Update transaction
-            transaction.status = "completed"
-            from datetime import datetime
-            transaction.completed_at = datetime.utcnow()
-            
+        # Settle only if still pending; reconciliation may have got there first
+        settled = await settle_pending(db, [transaction.id], "completed") if transaction else []
+        
+        if settled:
             # Add tokens
             device_id = metadata.get("device_id", transaction.device_id)
             tokens = int(metadata.get("tokens", transaction.tokens_granted))
-            await add_tokens(db, device_id, tokens)
+            await add_tokens(db, device_id, tokens, checkout_id=checkout_id)
             
             await db.commit()
             
@@ -1,11 +1,26 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 
+from app.services.response_fields import FieldName
+
 
 class VisualizeRequest(BaseModel):
     concept: str = Field(..., min_length=1, max_length=500, description="Product/website/concept to visualize")
     language: str = Field(default="en", pattern="^(en|zh|ja|de|fr|ko|es)$")
+    fields: Optional[List[FieldName]] = Field(
+        default=None,
+        description="Parts to generate and return (title and year always are); the rest are left out. "
+        "Default all. The token cost depends on the tier: brief (no sections), sections, or full",
+    )
+
+
+class BatchVisualizeRequest(BaseModel):
+    items: List[VisualizeRequest] = Field(..., min_length=1, description="Concepts to visualize, each with its language")
+    format: Literal["full", "lite"] = Field(
+        default="full",
+        description="lite drops the long sections and packs several concepts into one generation",
+    )
 
 
 class SectionContent(BaseModel):
@@ -13,14 +28,19 @@ class SectionContent(BaseModel):
     content: str
 
 
-class VisualizeResponse(BaseModel):
+class VisionBody(BaseModel):
+    """The generated part of a vision, cached and shared between requests."""
     title: str
     year: int
     summary: str
     sections: dict[str, SectionContent]
     key_changes: List[str]
+
+
+class VisualizeResponse(VisionBody):
     is_free_trial: bool
     remaining_tokens: int
+    degraded: bool = Field(default=False, description="Served without the LLM (cached or template vision), free of charge")
 
 
 class TokenStatusResponse(BaseModel):
@@ -47,3 +67,34 @@ class ErrorResponse(BaseModel):
     error: str
     code: str
     payment_required: bool = False
+
+
+class GrantError(BaseModel):
+    line: int
+    error: str
+
+
+class GrantReport(BaseModel):
+    batch_id: str
+    lines: int
+    granted: int = Field(description="Devices granted by this request")
+    tokens: int
+    already_granted: int = Field(description="Devices an earlier request with this batch id already granted")
+    duplicates: int = Field(description="Repeated lines for a device; only its first line counts")
+    invalid: int
+    errors: List[GrantError] = Field(description="The first lines that could not be parsed")
+    seconds: float
+    devices_per_second: Optional[int] = None
+
+
+class LedgerEntry(BaseModel):
+    kind: str
+    account: str = Field(description="Counter account: sales, promotions, usage or trials")
+    amount: int
+    reason: Optional[str] = None
+    batch_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class DeviceTokensResponse(TokenStatusResponse):
+    ledger: List[LedgerEntry] = Field(description="Latest balance changes, newest first")
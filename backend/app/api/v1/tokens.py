@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
@@ -9,7 +10,7 @@ from app.services.token_service import get_token_status
 router = APIRouter()
 
 
-@router.get("/tokens/status", response_model=TokenStatusResponse)
+@router.get("/tokens/status", response_model=TokenStatusResponse, response_class=ORJSONResponse)
 async def get_status(
     x_device_id: Optional[str] = Header(None, alias="X-Device-Id"),
     db: AsyncSession = Depends(get_db),
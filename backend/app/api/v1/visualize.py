@@ -1,38 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.ext.asyncio import AsyncSession
+import time
+from functools import partial
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from typing import Optional
 
-from app.database import get_db
-from app.api.v1.schemas import VisualizeRequest, VisualizeResponse, ErrorResponse
+from app.config import get_settings
+from app.database import get_db, get_sessionmaker
+from app.api.v1.schemas import BatchVisualizeRequest, VisualizeRequest, VisualizeResponse, ErrorResponse
+from app.services.batch_service import item_costs, stream_batch
+from app.services.cancellation import RequestAbandoned, parse_deadline, until_abandoned
+from app.services.circuit_breaker import get_llm_breaker
+from app.services.degraded import get_degraded_vision
 from app.services.llm_service import generate_future_vision
-from app.services.token_service import can_use_generation, use_generation
+from app.services.response_fields import Fields, generation_cost, normalize_fields
+from app.services.token_service import can_use_generation, refund_generations, reserve_generations, use_generation
+from app.services.vision_cache import get_or_generate, project, render_response
 from app.metrics import (
     core_function_calls,
+    generations_abandoned,
     tokens_consumed,
     free_trial_used,
     TOOL_NAME,
 )
 
 router = APIRouter()
+settings = get_settings()
+
+
+def upstream_down() -> bool:
+    return settings.degraded_mode_enabled and get_llm_breaker().is_open
+
+
+async def degraded_response(request: VisualizeRequest, remaining: int, fields: Fields = None) -> Response:
+    """Respond from the cache or a template, in milliseconds and without charging a token."""
+    body = project(await get_degraded_vision(request.concept, request.language), fields)
+    return Response(
+        content=render_response(body, False, remaining, degraded=True),
+        media_type="application/json",
+    )
 
 
 @router.post(
     "/visualize",
     response_model=VisualizeResponse,
-    responses={402: {"model": ErrorResponse}},
+    response_class=ORJSONResponse,
+    responses={402: {"model": ErrorResponse}, 504: {"description": "X-Deadline-Ms passed"}},
 )
 async def visualize_future(
     request: VisualizeRequest,
+    http_request: Request,
     x_device_id: Optional[str] = Header(None, alias="X-Device-Id"),
+    x_deadline_ms: Optional[str] = Header(None, alias="X-Deadline-Ms"),
     db: AsyncSession = Depends(get_db),
 ):
-    """Generate a vision of what a concept will look like in 10 years."""
+    """
+    Generate a vision of what a concept will look like in 10 years.
+    
+    X-Deadline-Ms is the client's remaining time budget; the tokens are
+    refunded if it passes, or if the client disconnects, before the vision is
+    ready. `fields` selects the parts to generate, and sets the token cost.
+    """
     
     if not x_device_id:
         raise HTTPException(status_code=400, detail="X-Device-Id header required")
     
+    try:
+        deadline = parse_deadline(x_deadline_ms)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Deadline-Ms must be a positive integer")
+    
+    fields = normalize_fields(request.fields)
+    cost = generation_cost(fields)
+    
     # Check if can use generation
-    can_use, is_free_trial, remaining = await can_use_generation(db, x_device_id)
+    can_use, _, remaining = await can_use_generation(db, x_device_id, cost)
     
     if not can_use:
         raise HTTPException(
@@ -44,8 +87,14 @@ async def visualize_future(
             },
         )
     
+    if upstream_down():
+        return await degraded_response(request, remaining, fields)
+    
+    if deadline is not None and time.monotonic() >= deadline:
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+    
     # Consume token
-    success, remaining = await use_generation(db, x_device_id)
+    success, is_free_trial, remaining = await use_generation(db, x_device_id, cost)
     if not success:
         raise HTTPException(
             status_code=402,
@@ -61,23 +110,88 @@ async def visualize_future(
     if is_free_trial:
         free_trial_used.labels(tool=TOOL_NAME).inc()
     else:
-        tokens_consumed.labels(tool=TOOL_NAME).inc()
+        tokens_consumed.labels(tool=TOOL_NAME).inc(cost)
+    refund = 1 if is_free_trial else cost
+    generate = generate_future_vision if fields is None else partial(generate_future_vision, fields=fields)
     
-    # Generate vision
+    # Generate vision; a departed client stops waiting, and the upstream call
+    # is cancelled unless another request is waiting on the same generation
     try:
-        vision = await generate_future_vision(request.concept, request.language)
+        body = await until_abandoned(
+            http_request,
+            get_or_generate(request.concept, request.language, generate, fields),
+            deadline,
+        )
+    except RequestAbandoned as e:
+        await refund_generations(db, x_device_id, refund, free_trial=is_free_trial)
+        generations_abandoned.labels(tool=TOOL_NAME, reason=e.reason).inc()
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="Deadline exceeded")
+        return Response(status_code=499)  # Client Closed Request; nobody reads it
     except Exception as e:
         # Refund token on error
-        from app.services.token_service import add_tokens
-        await add_tokens(db, x_device_id, 1)
+        remaining = await refund_generations(db, x_device_id, refund, free_trial=is_free_trial)
+        if upstream_down():
+            return await degraded_response(request, remaining, fields)
         raise HTTPException(status_code=500, detail=f"Failed to generate vision: {str(e)}")
     
-    return VisualizeResponse(
-        title=vision.get("title", f"The Future of {request.concept}"),
-        year=vision.get("year", 2036),
-        summary=vision.get("summary", ""),
-        sections=vision.get("sections", {}),
-        key_changes=vision.get("key_changes", []),
-        is_free_trial=is_free_trial,
-        remaining_tokens=remaining,
+    # The vision was validated and serialized once when generated; only the
+    # per-request fields are added here, so no pydantic work per response
+    return Response(
+        content=render_response(body, is_free_trial, remaining),
+        media_type="application/json",
+    )
+
+
+@router.post(
+    "/visualize/batch",
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        402: {"model": ErrorResponse},
+    },
+)
+async def visualize_batch(
+    request: BatchVisualizeRequest,
+    x_device_id: Optional[str] = Header(None, alias="X-Device-Id"),
+    db: AsyncSession = Depends(get_db),
+    sessionmaker: async_sessionmaker = Depends(get_sessionmaker),
+):
+    """
+    Generate visions for many concepts in one call.
+    
+    Tokens for the whole batch are reserved up front; results stream back as
+    NDJSON in completion order, followed by a summary line. Failed items, and
+    items not delivered before the client disconnects, are refunded.
+    """
+    
+    if not x_device_id:
+        raise HTTPException(status_code=400, detail="X-Device-Id header required")
+    
+    count = len(request.items)
+    if count > settings.batch_max_items:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_items} items per batch")
+    
+    costs = item_costs(request.items, request.format == "lite")
+    success, is_free_trial, remaining = await reserve_generations(db, x_device_id, count, costs)
+    if not success:
+        raise HTTPException(
+            status_code=402,
+            detail={
+                "error": f"Not enough tokens for {count} generations. Please purchase more.",
+                "code": "payment_required",
+                "payment_required": True,
+            },
+        )
+    
+    # Track metrics
+    core_function_calls.labels(tool=TOOL_NAME).inc(count)
+    if is_free_trial:
+        free_trial_used.labels(tool=TOOL_NAME).inc()
+    paid = sum(costs[1:]) if is_free_trial else sum(costs)
+    if paid:
+        tokens_consumed.labels(tool=TOOL_NAME).inc(paid)
+    
+    return StreamingResponse(
+        stream_batch(sessionmaker, x_device_id, request.items, request.format == "lite", costs, is_free_trial, remaining),
+        media_type="application/x-ndjson",
     )
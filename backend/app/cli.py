@@ -0,0 +1,199 @@
+"""
+Operational commands.
+
+Usage:
+    python -m app.cli maintenance [--full-vacuum]
+    python -m app.cli reconcile-payments [--older-than-minutes 60]
+    python -m app.cli profile-startup [--top 20]
+    python -m app.cli grant-tokens FILE|- --batch-id ID [--format csv|ndjson]
+    python -m app.cli verify-ledger [--repair]
+    python -m app.cli export-visions OUT [--format ndjson|parquet]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from app.database import get_sessionmaker, init_db
+from app.config import get_settings
+from app.services.creem_client import close_creem_client, get_creem_client
+from app.services.grant_service import FORMATS, apply_grants, iter_lines
+from app.services.ledger_service import verify_balances
+from app.services.maintenance import run_maintenance
+from app.services.reconciliation import reconcile_pending_payments
+from app.services.vision_archive import EXPORT_FORMATS, VisionArchive, export
+
+
+async def maintenance(args: argparse.Namespace) -> dict:
+    await init_db()
+    try:
+        async with get_sessionmaker()() as db:
+            return await run_maintenance(db, full_vacuum=args.full_vacuum)
+    finally:
+        await close_creem_client()
+
+
+async def reconcile_payments(args: argparse.Namespace) -> dict:
+    await init_db()
+    older_than = args.older_than_minutes
+    if older_than is None:
+        older_than = get_settings().payment_reconcile_after_minutes
+    try:
+        async with get_sessionmaker()() as db:
+            return await reconcile_pending_payments(
+                db, get_creem_client(), older_than, get_settings().payment_pending_expire_hours
+            )
+    finally:
+        await close_creem_client()
+
+
+async def read_chunks(path: str, size: int = 1 << 16):
+    """Read a file (or stdin for "-") in binary chunks."""
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := f.read(size):
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def grant_tokens(args: argparse.Namespace) -> dict:
+    await init_db()
+    format = args.format or ("csv" if args.file.endswith(".csv") else "ndjson")
+    async with get_sessionmaker()() as db:
+        return await apply_grants(db, args.batch_id, iter_lines(read_chunks(args.file)), format)
+
+
+async def verify_ledger(args: argparse.Namespace) -> dict:
+    await init_db()
+    async with get_sessionmaker()() as db:
+        return await verify_balances(db, repair=args.repair)
+
+
+async def export_visions(args: argparse.Namespace) -> dict:
+    settings = get_settings()
+    if not settings.vision_archive_dir:
+        sys.exit("VISION_ARCHIVE_DIR is not set")
+    format = args.format or ("parquet" if args.out.endswith(".parquet") else "ndjson")
+    archive = VisionArchive(settings.vision_archive_dir, codec=settings.vision_archive_codec)
+    started = time.perf_counter()
+    try:
+        count = await asyncio.to_thread(export, archive, args.out, format)
+    finally:
+        archive.close()
+    return {"visions": count, "format": format, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Parse `python -X importtime` output into per-module timings."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return modules
+
+
+async def profile_startup(args: argparse.Namespace) -> dict:
+    """Report per-module import time for app.main and the time init_db takes."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        cwd=backend_dir,
+    )
+    modules = parse_importtime(proc.stderr)
+    total = next((m["cumulative_ms"] for m in modules if m["module"] == "app.main"), None)
+
+    started = time.perf_counter()
+    await init_db()
+    init_db_ms = (time.perf_counter() - started) * 1000
+
+    # Direct imports of app.main, plus every app module wherever it was first imported
+    interesting = [m for m in modules if m["depth"] <= 1 or m["module"].startswith("app.")]
+    interesting.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return {
+        "import_app_main_ms": total,
+        "init_db_ms": round(init_db_ms, 1),
+        "modules": [
+            {"module": m["module"], "cumulative_ms": m["cumulative_ms"], "self_ms": m["self_ms"]}
+            for m in interesting[:args.top]
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    maintenance_parser = commands.add_parser(
+        "maintenance",
+        help="Prune idle token rows, archive old payments and compact the database",
+    )
+    maintenance_parser.add_argument(
+        "--full-vacuum",
+        action="store_true",
+        help="Run a full VACUUM (switches old databases to incremental auto-vacuum)",
+    )
+    maintenance_parser.set_defaults(handler=maintenance)
+
+    reconcile_parser = commands.add_parser(
+        "reconcile-payments",
+        help="Settle pending checkouts against Creem when their webhook never arrived",
+    )
+    reconcile_parser.add_argument(
+        "--older-than-minutes",
+        type=int,
+        default=None,
+        help="Only check checkouts older than this (default PAYMENT_RECONCILE_AFTER_MINUTES)",
+    )
+    reconcile_parser.set_defaults(handler=reconcile_payments)
+
+    profile_parser = commands.add_parser(
+        "profile-startup",
+        help="Report per-module import time and init_db time",
+    )
+    profile_parser.add_argument("--top", type=int, default=20, help="Number of modules to list")
+    profile_parser.set_defaults(handler=profile_startup)
+
+    grant_parser = commands.add_parser(
+        "grant-tokens",
+        help="Grant tokens to the devices listed in a CSV or NDJSON file",
+    )
+    grant_parser.add_argument("file", help="device_id,amount[,reason] lines, or - for stdin")
+    grant_parser.add_argument("--batch-id", required=True, help="Re-running a batch id only grants what is missing")
+    grant_parser.add_argument("--format", choices=FORMATS, help="Default: csv for .csv files, else ndjson")
+    grant_parser.set_defaults(handler=grant_tokens)
+
+    verify_parser = commands.add_parser(
+        "verify-ledger",
+        help="Check every token balance against the ledger and report account totals",
+    )
+    verify_parser.add_argument("--repair", action="store_true", help="Overwrite mismatched balances with the ledger's")
+    verify_parser.set_defaults(handler=verify_ledger)
+
+    export_parser = commands.add_parser(
+        "export-visions",
+        help="Stream every archived vision to NDJSON, or Parquet with pyarrow installed",
+    )
+    export_parser.add_argument("out", help="Output file")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, help="Default: parquet for .parquet files, else ndjson")
+    export_parser.set_defaults(handler=export_visions)
+
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(args.handler(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
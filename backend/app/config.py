@@ -1,3 +1,4 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -13,16 +14,110 @@ class Settings(BaseSettings):
     llm_proxy_url: str = "https://llm-proxy.densematrix.ai"
     llm_proxy_key: str = ""
     
-    # Database
+    # Database: SQLite only. Upserts use its ON CONFLICT dialect, and ledger
+    # snapshots rely on ids being assigned under its single write lock
     database_url: str = "sqlite+aiosqlite:///./data/app.db"
     
     # Creem Payment
     creem_api_key: str = ""
     creem_webhook_secret: str = ""
     creem_product_ids: str = "{}"  # JSON string
+    creem_api_url: str = "https://api.creem.io"
+    creem_max_connections: int = 10
     
     # Tool name for metrics
     tool_name: str = "future-visualizer"
+
+    # Server
+    workers: int = 1
+    host: str = "0.0.0.0"
+    port: int = 8000
+    init_db_on_startup: bool = True  # app.server runs init_db once before forking workers
+    prometheus_multiproc_dir: str = "./data/prometheus"  # Used when workers > 1
+
+    # Event loop monitor (lag, tasks, pools, slow callback stacks)
+    loop_monitor_enabled: bool = False
+    loop_monitor_interval_seconds: float = 0.5
+    slow_callback_threshold_seconds: float = 0.25  # Blocked longer than this logs the loop thread's stack
+
+    # CPU offload for parsing and validating large completions
+    cpu_offload_executor: str = "thread"  # "thread", "process", or "none" (always on the event loop)
+    cpu_offload_workers: int = 2
+    cpu_offload_min_bytes: int = 64 * 1024  # Smaller payloads parse faster than an executor hop
+
+    # Traffic capture for benchmarks/replay.py; empty path disables
+    traffic_capture_path: str = ""
+    traffic_capture_salt: str = ""  # Key for device/IP hashes; set it when workers share the log
+    traffic_capture_concepts: bool = False  # Record concept text instead of a hash of it
+
+    # /metrics exposition, rendered in a background thread and served from cache
+    metrics_render_interval_seconds: float = 5.0  # 0 renders on every scrape (still off the event loop)
+
+    # Shared key-value store (caches, single-flight locks, rate limits)
+    kv_backend: str = "auto"  # "memory", "sqlite", or "auto" (sqlite when workers > 1)
+    kv_sqlite_path: str = "./data/kv.db"
+    kv_memory_max_keys: int = 50000
+
+    # Vision cache
+    vision_cache_enabled: bool = True
+    vision_cache_ttl_seconds: int = 7 * 24 * 3600
+    single_flight_timeout_seconds: float = 130.0  # How long to wait on another worker's generation
+
+    # Vision archive: every generated vision, compressed into segment files; empty dir disables
+    vision_archive_dir: str = ""
+    vision_archive_segment_mb: int = 64  # Segments are sealed and indexed at this size
+    vision_archive_codec: str = "auto"  # "zstd" (needs the zstandard package), "zlib", or "auto"
+
+    # Tokens per generation by the `fields` a request selects: brief (no
+    # sections), sections (some) or full. JSON string. Every tier costs one
+    # token, as a full vision always has, until prices per tier are set
+    generation_tier_costs: str = '{"brief": 1, "sections": 1, "full": 1}'
+
+    translate_cached_visions: bool = True  # Translate a vision cached in another language instead of regenerating
+
+    # Degraded mode: when the LLM proxy is down, serve cached or template visions for free
+    degraded_mode_enabled: bool = True
+    circuit_breaker_failure_threshold: int = 5  # Consecutive upstream failures that trip the breaker
+    circuit_breaker_cooldown_seconds: float = 30.0  # How long to stay degraded before probing upstream again
+
+    # Near-duplicate concept matching ("tiktok app" reuses "TikTok")
+    similar_concept_enabled: bool = True
+    similar_concept_threshold: float = 0.75  # Jaccard similarity of character trigrams
+    similar_concept_max_entries: int = 100000
+
+    # Batch visualize
+    batch_max_items: int = 200
+    batch_concurrency: int = 8  # Upstream calls in flight per batch
+    batch_pack_size: int = 5  # Lite concepts per LLM call
+
+    # Rate limiting
+    rate_limit_enabled: bool = True
+    rate_limit_routes: str = (
+        '{"/api/v1/visualize": {"device": "10/minute", "ip": "30/minute"},'
+        ' "/api/v1/visualize/batch": {"device": "2/minute", "ip": "10/minute"},'
+        ' "/api/v1/tokens/status": {"device": "60/minute", "ip": "300/minute"}}'
+    )  # JSON string
+    # Take the client IP from nginx's X-Real-IP / X-Forwarded-For. Only safe when
+    # the backend can't be reached except through the proxy: clients set these too
+    rate_limit_trust_proxy: bool = False
+
+    # Maintenance
+    token_retention_days: int = 30  # Untouched zero-balance token rows older than this are pruned
+    payment_archive_days: int = 90  # Completed payments older than this are archived
+    payment_archive_path: str = "./data/payments-archive.ndjson.gz"
+    maintenance_interval_hours: float = 0  # 0 disables the background task
+    payment_reconcile_after_minutes: int = 60  # Pending checkouts older than this are checked against Creem
+    payment_pending_expire_hours: int = 48  # Pending checkouts older than this that Creem hasn't settled expire
+
+    # Admin endpoints (X-Admin-Key header); empty disables them
+    admin_api_key: str = ""
+    
+    @field_validator("database_url")
+    @classmethod
+    def require_sqlite(cls, url: str) -> str:
+        if not url.startswith("sqlite"):
+            raise ValueError("DATABASE_URL must be a SQLite URL, e.g. sqlite+aiosqlite:///./data/app.db")
+        return url
     
     class Config:
         env_file = ".env"
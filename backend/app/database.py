@@ -1,34 +1,107 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import Column, Integer, Table, delete, event, inspect, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import DeclarativeBase
+from functools import partial
+from typing import Optional
 import os
 
 from app.config import get_settings
 
-settings = get_settings()
+# Bump when the models change, with a migration in app.migrations for existing
+# databases; init_db skips all schema work while the stored version matches
+SCHEMA_VERSION = 5
 
-# Ensure data directory exists
-os.makedirs("data", exist_ok=True)
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker] = None
+
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.debug,
-)
 
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+def count_writes(counter, tool, conn, cursor, statement, parameters, context, executemany):
+    """Count write statements by kind, so replays of the same traffic can compare builds."""
+    verb = statement.lstrip()[:7].upper().split(" ", 1)[0]
+    if verb in WRITE_STATEMENTS:
+        counter.labels(tool=tool, statement=verb.lower()).inc()
 
 
 class Base(DeclarativeBase):
     pass
 
 
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, nullable=False),
+)
+
+
+def get_engine() -> AsyncEngine:
+    """Create the engine (and the SQLite data directory) on first use."""
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        url = make_url(settings.database_url)
+        if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        _engine = create_async_engine(url, echo=settings.debug)
+        # app.metrics imports FastAPI; load it with the first engine, not with this module
+        from app.metrics import db_writes, TOOL_NAME
+        event.listen(_engine.sync_engine, "before_cursor_execute", partial(count_writes, db_writes, TOOL_NAME))
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker:
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _sessionmaker
+
+
 async def get_db():
-    async with async_session() as session:
+    async with get_sessionmaker()() as session:
         try:
             yield session
         finally:
             await session.close()
 
 
+def _stored_schema_version(sync_conn) -> Optional[int]:
+    tables = inspect(sync_conn)
+    if not tables.has_table("schema_version"):
+        # Databases created before versioning started at version 1
+        return 1 if tables.has_table("generation_tokens") else None
+    return sync_conn.execute(select(schema_version.c.version)).scalar()
+
+
+async def get_schema_version(conn) -> Optional[int]:
+    """Schema version recorded in the database, or None if it was never stamped."""
+    return await conn.run_sync(_stored_schema_version)
+
+
+async def stamp_schema_version(conn):
+    await conn.execute(delete(schema_version))
+    await conn.execute(insert(schema_version).values(version=SCHEMA_VERSION))
+
+
 async def init_db():
+    import app.models  # noqa: F401  Register every table on Base.metadata
+    from app.migrations import MIGRATIONS
+
+    engine = get_engine()
     async with engine.begin() as conn:
+        version = await get_schema_version(conn)
+        if version == SCHEMA_VERSION:
+            return
+        if engine.dialect.name == "sqlite":
+            # Only takes effect on a new file; lets maintenance reclaim space incrementally
+            await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            # pysqlite commits DDL as it runs unless a transaction is open; with
+            # one, a failed migration rolls back to the old schema
+            await conn.exec_driver_sql("BEGIN")
+        if version is not None:
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                await conn.run_sync(MIGRATIONS[target])
         await conn.run_sync(Base.metadata.create_all)
+        await stamp_schema_version(conn)
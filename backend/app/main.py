@@ -1,34 +1,81 @@
+import asyncio
+import logging
 import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from typing import Optional
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import get_settings
-from app.database import init_db
-from app.api.v1 import visualize, tokens, payment
+from app.database import SCHEMA_VERSION, get_db, get_engine, get_schema_version, get_sessionmaker, init_db
+from app.services.creem_client import close_creem_client
+from app.services.llm_service import close_http_client
+from app.services.loop_monitor import LoopMonitor
+from app.services.maintenance import maintenance_loop
+from app.services.offload import shutdown_executor
+from app.services.traffic_capture import CAPTURED_BODIES, close_traffic_recorder, get_traffic_recorder
+from app.services.vision_archive import close_vision_archive, get_vision_archive
+from app.api.v1 import admin, visualize, tokens, payment
+from app.services.rate_limiter import get_rate_limiter, retry_after_header
 from app.metrics import (
+    BOT_PATTERNS,
+    LabelAllowlist,
+    bot_labels,
+    mark_worker_stopped,
     metrics_router,
+    stop_metrics_cache,
     http_requests,
     http_request_duration,
+    http_requests_in_flight,
     crawler_visits,
+    rate_limited_requests,
     TOOL_NAME,
 )
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Bot patterns for crawler detection
-BOT_PATTERNS = [
-    "Googlebot", "bingbot", "Baiduspider", "YandexBot", 
-    "DuckDuckBot", "Slurp", "facebookexternalhit", "Twitterbot",
-]
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
-    await init_db()
+    if settings.init_db_on_startup:
+        await init_db()
+    
+    if settings.vision_archive_dir:
+        # Recovering unsealed segments reads them whole; keep it off the event loop
+        await asyncio.to_thread(get_vision_archive)
+    
+    monitor = None
+    if settings.loop_monitor_enabled:
+        monitor = LoopMonitor(
+            get_engine(),
+            interval=settings.loop_monitor_interval_seconds,
+            slow_threshold=settings.slow_callback_threshold_seconds,
+        )
+        monitor.start()
+    
+    maintenance_task = None
+    if settings.maintenance_interval_hours > 0:
+        maintenance_task = asyncio.create_task(
+            maintenance_loop(get_sessionmaker(), settings.maintenance_interval_hours)
+        )
+    
     yield
+    
+    if maintenance_task:
+        maintenance_task.cancel()
+    if monitor:
+        await monitor.stop()
+    await close_http_client()
+    await close_creem_client()
+    shutdown_executor()
+    close_traffic_recorder()
+    close_vision_archive()
+    stop_metrics_cache()
+    mark_worker_stopped()
 
 
 app = FastAPI(
@@ -48,25 +95,90 @@ app.add_middleware(
 )
 
 
+def crawler_name(user_agent: str) -> Optional[str]:
+    ua = user_agent.lower()
+    for bot in BOT_PATTERNS:
+        if bot.lower() in ua:
+            return bot
+    return None
+
+
+def client_ip(request: Request) -> str:
+    """
+    Client IP, taken from the nginx proxy headers when trusted.
+
+    nginx overwrites X-Real-IP with the address it saw, and appends that
+    address to X-Forwarded-For; anything left of it came from the client.
+    """
+    if settings.rate_limit_trust_proxy:
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else ""
+
+
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    """Reject requests over the per-device / per-IP limits with 429."""
+    if not settings.rate_limit_enabled or request.method == "OPTIONS":
+        return await call_next(request)
+    
+    scope, retry_after = await get_rate_limiter().check(
+        request.url.path,
+        {
+            "device": request.headers.get("x-device-id"),
+            "ip": client_ip(request),
+        },
+    )
+    if scope:
+        rate_limited_requests.labels(tool=TOOL_NAME, endpoint=request.url.path, scope=scope).inc()
+        return JSONResponse(
+            status_code=429,
+            content={
+                "detail": {
+                    "error": "Too many requests. Please slow down.",
+                    "code": "rate_limited",
+                    "payment_required": False,
+                }
+            },
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
+    
+    return await call_next(request)
+
+
 @app.middleware("http")
 async def metrics_middleware(request: Request, call_next):
     """Track HTTP metrics and detect crawlers."""
     start_time = time.time()
     
     # Detect crawlers
-    ua = request.headers.get("user-agent", "")
-    for bot in BOT_PATTERNS:
-        if bot.lower() in ua.lower():
-            crawler_visits.labels(tool=TOOL_NAME, bot=bot).inc()
-            break
+    bot = crawler_name(request.headers.get("user-agent", ""))
+    if bot:
+        crawler_visits.labels(tool=TOOL_NAME, bot=bot_labels(bot)).inc()
     
-    response = await call_next(request)
+    # Unknown paths (scanners, typos) share one label instead of a series each
+    endpoint = endpoint_labels(request.url.path)
+    if settings.loop_monitor_enabled:
+        in_flight = http_requests_in_flight.labels(tool=TOOL_NAME, endpoint=endpoint)
+        in_flight.inc()
+        try:
+            response = await call_next(request)
+        finally:
+            in_flight.dec()
+    else:
+        response = await call_next(request)
     
     # Track metrics
     duration = time.time() - start_time
-    endpoint = request.url.path
     method = request.method
     status = response.status_code
+    route = request.scope.get("route")
+    if route is not None:
+        endpoint = route.path  # The template, for routes with path parameters
     
     http_requests.labels(
         tool=TOOL_NAME,
@@ -84,11 +196,61 @@ async def metrics_middleware(request: Request, call_next):
     return response
 
 
+@app.middleware("http")
+async def traffic_capture_middleware(request: Request, call_next):
+    """Record sanitized request metadata and timing for replay (TRAFFIC_CAPTURE_PATH)."""
+    recorder = get_traffic_recorder()
+    if recorder is None:
+        return await call_next(request)
+    
+    started = time.time()
+    path = request.url.path
+    body = None
+    if request.method == "POST" and path in CAPTURED_BODIES:
+        body = await request.body()
+    
+    response = await call_next(request)
+    
+    ua = request.headers.get("user-agent", "")
+    agent = crawler_name(ua) or ("browser" if "mozilla" in ua.lower() else "other" if ua else "")
+    
+    def record():
+        try:
+            recorder.record(
+                started,
+                request.method,
+                path,
+                response.status_code,
+                time.time() - started,
+                device_id=request.headers.get("x-device-id"),
+                ip=client_ip(request),
+                agent=agent,
+                body=body,
+            )
+        except OSError:
+            # A full disk or a rotated-away log loses the line, not the request
+            logger.exception("Writing the traffic capture failed")
+    
+    # Recorded once the body is sent, so streamed responses (batches) are timed in full
+    body_iterator = response.body_iterator
+    
+    async def recorded_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            record()
+    
+    response.body_iterator = recorded_body()
+    return response
+
+
 # Routes
 app.include_router(metrics_router)
 app.include_router(visualize.router, prefix="/api/v1", tags=["visualize"])
 app.include_router(tokens.router, prefix="/api/v1", tags=["tokens"])
 app.include_router(payment.router, prefix="/api/v1", tags=["payment"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
 
 
 @app.get("/health")
@@ -97,6 +259,22 @@ async def health():
     return {"status": "healthy", "tool": TOOL_NAME}
 
 
+@app.get("/ready")
+async def ready(db: AsyncSession = Depends(get_db)):
+    """Readiness check: the database answers and its schema is current."""
+    try:
+        version = await get_schema_version(await db.connection())
+    except Exception:
+        version = None
+    
+    if version != SCHEMA_VERSION:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "schema_version": version},
+        )
+    return {"status": "ready", "schema_version": version}
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -105,3 +283,7 @@ async def root():
         "version": "1.0.0",
         "docs": "/docs",
     }
+
+
+# Label values for the endpoint label of the HTTP metrics: the app's routes
+endpoint_labels = LabelAllowlist(route.path for route in app.routes)
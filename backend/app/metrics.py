@@ -1,10 +1,53 @@
+import asyncio
+import gzip
 import os
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import APIRouter
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    Gauge,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+    CONTENT_TYPE_LATEST,
+)
+from fastapi import APIRouter, Depends, Request
 from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from app.api.v1.auth import require_admin_key
+from app.config import get_settings
 
 TOOL_NAME = os.getenv("TOOL_NAME", "future-visualizer")
 
+OTHER = "other"
+
+
+class LabelAllowlist:
+    """
+    Bounds the values a label can take: `values`, plus the first `limit`
+    other values seen in this process. Anything past that is counted as "other".
+    """
+
+    def __init__(self, values: Iterable[str] = (), limit: int = 0):
+        self.values = set(values)
+        self.limit = limit
+        self._admitted: set[str] = set()
+
+    def __call__(self, value: str) -> str:
+        if value in self.values or value in self._admitted:
+            return value
+        if len(self._admitted) < self.limit:
+            self._admitted.add(value)
+            return value
+        return OTHER
+
+
 # HTTP metrics
 http_requests = Counter(
     "http_requests_total",
@@ -18,6 +61,110 @@ http_request_duration = Histogram(
     ["tool", "endpoint", "method"]
 )
 
+# Event loop metrics (LOOP_MONITOR_ENABLED)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a scheduled wakeup",
+    ["tool"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+event_loop_tasks = Gauge(
+    "event_loop_tasks",
+    "asyncio tasks alive on the event loop",
+    ["tool"],
+    multiprocess_mode="livesum",
+)
+
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled, per route",
+    ["tool", "endpoint"],
+    multiprocess_mode="livesum",
+)
+
+slow_callbacks = Counter(
+    "event_loop_slow_callbacks_total",
+    "Times the event loop was blocked longer than the slow callback threshold",
+    ["tool"]
+)
+
+db_statements_in_flight = Gauge(
+    "db_statements_in_flight",
+    "Database statements waiting for or running on aiosqlite connection threads",
+    ["tool"],
+    multiprocess_mode="livesum",
+)
+
+http_client_requests_in_flight = Gauge(
+    "http_client_requests_in_flight",
+    "Requests in progress on a shared HTTP client",
+    ["tool", "client"],
+    multiprocess_mode="livesum",
+)
+
+http_client_pool_utilization = Gauge(
+    "http_client_pool_utilization",
+    "Requests in flight over the client's connection limit; above 1, requests wait for a connection",
+    ["tool", "client"],
+    multiprocess_mode="livemax",
+)
+
+
+class InFlight:
+    """
+    Requests in progress on a shared HTTP client, counted by its callers.
+
+    Counted here rather than read from the client's connection pool, whose
+    internals change between httpx releases.
+    """
+
+    def __init__(self, client: str, limit: int):
+        self.limit = limit
+        self.count = 0
+        self._in_flight = http_client_requests_in_flight.labels(tool=TOOL_NAME, client=client)
+        self._utilization = http_client_pool_utilization.labels(tool=TOOL_NAME, client=client)
+
+    @contextmanager
+    def track(self):
+        self._set(self.count + 1)
+        try:
+            yield
+        finally:
+            self._set(self.count - 1)
+
+    def _set(self, count: int):
+        self.count = count
+        self._in_flight.set(count)
+        self._utilization.set(count / self.limit)
+
+
+cpu_offloaded = Counter(
+    "cpu_offloaded_total",
+    "Parse and validation calls run off the event loop, by executor",
+    ["tool", "executor"]
+)
+
+# Vision archive metrics
+visions_archived = Counter(
+    "visions_archived_total",
+    "Generated visions written to the vision archive",
+    ["tool"]
+)
+
+vision_archive_bytes = Counter(
+    "vision_archive_bytes_total",
+    "Bytes of archived visions, before (raw) and after (compressed) compression",
+    ["tool", "stage"]
+)
+
+# Database metrics
+db_writes = Counter(
+    "db_writes_total",
+    "Write statements sent to the database, by kind",
+    ["tool", "statement"]
+)
+
 # Payment metrics
 payment_success = Counter(
     "payment_success_total",
@@ -44,6 +191,12 @@ free_trial_used = Counter(
     ["tool"]
 )
 
+admin_tokens_granted = Counter(
+    "admin_tokens_granted_total",
+    "Tokens granted through admin batches",
+    ["tool"]
+)
+
 # Core function metrics
 core_function_calls = Counter(
     "core_function_calls_total",
@@ -51,7 +204,59 @@ core_function_calls = Counter(
     ["tool"]
 )
 
+# Cache metrics
+similar_concept_hits = Counter(
+    "similar_concept_hits_total",
+    "Visions served from a near-duplicate concept",
+    ["tool"]
+)
+
+vision_translations = Counter(
+    "vision_translations_total",
+    "Visions produced by translating a cached vision from another language",
+    ["tool", "status"]
+)
+
+# Cancellation metrics
+upstream_seconds_wasted = Counter(
+    "upstream_seconds_wasted_total",
+    "Seconds spent on generations cancelled because every caller had gone",
+    ["tool"]
+)
+
+generations_abandoned = Counter(
+    "generations_abandoned_total",
+    "Visualize requests that stopped waiting on their generation",
+    ["tool", "reason"]
+)
+
+# Degraded mode metrics
+degraded_responses = Counter(
+    "degraded_responses_total",
+    "Visions served without the LLM while it was down",
+    ["tool", "source"]
+)
+
+llm_circuit_open = Gauge(
+    "llm_circuit_open",
+    "1 while the circuit breaker refuses calls to an upstream",
+    ["tool", "upstream"],
+    multiprocess_mode="livemax",  # Stopped workers don't hold it open
+)
+
+# Rate limit metrics
+rate_limited_requests = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected by the rate limiter",
+    ["tool", "endpoint", "scope"]
+)
+
 # SEO metrics
+BOT_PATTERNS = [
+    "Googlebot", "bingbot", "Baiduspider", "YandexBot", 
+    "DuckDuckBot", "Slurp", "facebookexternalhit", "Twitterbot",
+]
+
 page_views = Counter(
     "page_views_total",
     "Page views",
@@ -67,17 +272,152 @@ crawler_visits = Counter(
 programmatic_pages = Gauge(
     "programmatic_pages_count",
     "Number of programmatic SEO pages",
-    ["tool"]
+    ["tool"],
+    multiprocess_mode="mostrecent",  # The last count reported, whichever worker took it
+)
+
+# Label values crawler_visits may use
+bot_labels = LabelAllowlist(BOT_PATTERNS)
+
+# Exposition metrics
+metrics_render_seconds = Histogram(
+    "metrics_render_seconds",
+    "Time to render the /metrics exposition, off the event loop",
+    ["tool", "format"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
 )
 
+
+def _openmetrics(registry) -> bytes:
+    from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+
+    return generate_openmetrics(registry)
+
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=0.0.1; charset=utf-8"
+
+# Exposition formats: renderer and content type
+FORMATS = {
+    "prometheus": (generate_latest, CONTENT_TYPE_LATEST),
+    "openmetrics": (_openmetrics, OPENMETRICS_CONTENT_TYPE),
+}
+
+
+def metrics_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Multi-worker mode: aggregate every worker's samples from the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def mark_worker_stopped():
+    """Drop this worker's samples from the live* gauges of the other workers' /metrics."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsCache:
+    """
+    Serves the /metrics exposition from bytes rendered in a background thread.
+
+    Each format is rendered (and gzipped) every `interval` seconds while it
+    is being scraped; a worker nobody has scraped for a while stops
+    rendering. With `interval` 0 every scrape renders, still off the event loop.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._rendered: dict[str, tuple[bytes, bytes]] = {}  # format -> (plain, gzipped)
+        self._last_scraped: dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def idle_after(self) -> float:
+        return max(60.0, 3 * self.interval)
+
+    def render(self, format: str) -> tuple[bytes, bytes]:
+        started = time.perf_counter()
+        generate, _ = FORMATS[format]
+        content = generate(metrics_registry())
+        rendered = (content, gzip.compress(content, compresslevel=5))
+        metrics_render_seconds.labels(tool=TOOL_NAME, format=format).observe(time.perf_counter() - started)
+        self._rendered[format] = rendered
+        return rendered
+
+    async def get(self, format: str) -> tuple[bytes, bytes]:
+        """The latest rendering of `format` (plain, gzipped); rendered now if there is none yet."""
+        self._last_scraped[format] = time.monotonic()
+        rendered = self._rendered.get(format)
+        if rendered is None or self.interval <= 0:
+            rendered = await asyncio.to_thread(self.render, format)
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-render", daemon=True)
+            self._thread.start()
+        return rendered
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            for format, scraped in list(self._last_scraped.items()):
+                if now - scraped < self.idle_after:
+                    self.render(format)
+                else:
+                    self._rendered.pop(format, None)  # Stale; the next scrape renders fresh
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+_metrics_cache: Optional[MetricsCache] = None
+
+
+def get_metrics_cache() -> MetricsCache:
+    global _metrics_cache
+    if _metrics_cache is None:
+        _metrics_cache = MetricsCache(get_settings().metrics_render_interval_seconds)
+    return _metrics_cache
+
+
+def stop_metrics_cache():
+    global _metrics_cache
+    if _metrics_cache is not None:
+        _metrics_cache.stop()
+        _metrics_cache = None
+
 # Router
 metrics_router = APIRouter()
 
 
 @metrics_router.get("/metrics")
-async def metrics():
-    """Prometheus metrics endpoint."""
-    return Response(
-        content=generate_latest(),
-        media_type=CONTENT_TYPE_LATEST,
-    )
+async def metrics(request: Request):
+    """
+    Prometheus metrics endpoint.
+    
+    Serves a rendering at most METRICS_RENDER_INTERVAL_SECONDS old, as
+    OpenMetrics when the scraper asks for it and gzipped when it accepts that.
+    """
+    format = "openmetrics" if "application/openmetrics-text" in request.headers.get("accept", "") else "prometheus"
+    content, gzipped = await get_metrics_cache().get(format)
+    # Content-Type set directly: media_type would get a second charset appended
+    headers = {"Content-Type": FORMATS[format][1], "Vary": "Accept, Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        content = gzipped
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=content, headers=headers)
+
+
+class ProgrammaticPagesUpdate(BaseModel):
+    count: int = Field(..., ge=0)
+
+
+@metrics_router.put("/metrics/programmatic-pages", dependencies=[Depends(require_admin_key)])
+async def set_programmatic_pages(update: ProgrammaticPagesUpdate):
+    """Record the page count reported by the programmatic SEO generator."""
+    programmatic_pages.labels(tool=TOOL_NAME).set(update.count)
+    return {"count": update.count}
@@ -0,0 +1,129 @@
+"""
+Schema migrations, keyed by the schema version they upgrade to.
+
+init_db runs the ones between the stored version and SCHEMA_VERSION, in
+order and in its own transaction, before create_all adds any new tables.
+"""
+from typing import Callable
+
+from sqlalchemy import Connection, DateTime, Integer, column, func, insert, inspect, select, table, text
+
+from app.models.ledger import TokenBalanceSnapshot, TokenLedgerEntry
+from app.models.payment import PaymentTransaction
+from app.models.token import GenerationToken, device_key
+
+# Devices copied per statement, so memory stays flat on large tables
+CHUNK_SIZE = 5000
+
+
+def unique_device_keys(conn: Connection):
+    """
+    Version 2: key token records by a hashed device id with a unique constraint.
+
+    Devices that raced into several rows are merged into one: balances and
+    purchases add up, and the free trial counts as used if any row used it.
+
+    If a previous attempt stopped after the rename, the copy resumes after
+    the last device it wrote.
+    """
+    if not inspect(conn).has_table("generation_tokens_v1"):
+        conn.execute(text("ALTER TABLE generation_tokens RENAME TO generation_tokens_v1"))
+    GenerationToken.__table__.create(conn, checkfirst=True)
+
+    old = table(
+        "generation_tokens_v1",
+        column("device_id"),
+        column("tokens_remaining"),
+        column("tokens_purchased"),
+        column("free_trial_used"),
+        column("created_at", DateTime),
+        column("updated_at", DateTime),
+    )
+    merged = (
+        select(
+            old.c.device_id,
+            func.coalesce(func.sum(old.c.tokens_remaining), 0),
+            func.coalesce(func.sum(old.c.tokens_purchased), 0),
+            func.coalesce(func.max(old.c.free_trial_used), False),
+            func.min(old.c.created_at),
+            func.max(old.c.updated_at),
+        )
+        .group_by(old.c.device_id)
+        .order_by(old.c.device_id)
+        .limit(CHUNK_SIZE)
+    )
+
+    tokens = GenerationToken.__table__
+    last = conn.execute(select(func.max(tokens.c.device_id))).scalar()
+    while True:
+        # Keyset paging on the old device_id index
+        page = merged if last is None else merged.where(old.c.device_id > last)
+        rows = conn.execute(page).all()
+        if not rows:
+            break
+        conn.execute(insert(tokens), [
+            {
+                "device_key": device_key(device_id),
+                "device_id": device_id,
+                "tokens_remaining": remaining,
+                "tokens_purchased": purchased,
+                "free_trial_used": bool(trial_used),
+                "created_at": created_at,
+                "updated_at": updated_at,
+            }
+            for device_id, remaining, purchased, trial_used, created_at, updated_at in rows
+        ])
+        last = rows[-1][0]
+
+    conn.execute(text("DROP TABLE generation_tokens_v1"))
+
+
+def payment_status_index(conn: Connection):
+    """Version 3: index payment transactions on (status, created_at) for reconciliation."""
+    if not inspect(conn).has_table("payment_transactions"):
+        return  # create_all makes the table with its indexes
+    for index in PaymentTransaction.__table__.indexes:
+        if index.name == "ix_payment_transactions_status_created_at":
+            index.create(conn, checkfirst=True)
+
+
+def token_ledger(conn: Connection):
+    """Version 4: add the token ledger (admin grants and their batch ids)."""
+    TokenLedgerEntry.__table__.create(conn, checkfirst=True)
+
+
+def ledger_snapshots(conn: Connection):
+    """
+    Version 5: counter accounts on ledger entries, and balance snapshots.
+
+    Balances from before the ledger become each device's opening snapshot,
+    as of the latest entry, so rebuilding a balance never needs older history.
+    """
+    if "account" not in {c["name"] for c in inspect(conn).get_columns("token_ledger")}:
+        # Only admin grants were recorded before
+        conn.execute(text(
+            "ALTER TABLE token_ledger ADD COLUMN account VARCHAR(20) NOT NULL DEFAULT 'promotions'"
+        ))
+    TokenBalanceSnapshot.__table__.create(conn, checkfirst=True)
+
+    tokens = GenerationToken.__table__
+    latest = select(func.coalesce(func.max(TokenLedgerEntry.id), 0)).scalar_subquery()
+    conn.execute(insert(TokenBalanceSnapshot.__table__).from_select(
+        ["device_key", "device_id", "entry_id", "tokens_remaining", "tokens_purchased", "trials_used"],
+        select(
+            tokens.c.device_key,
+            tokens.c.device_id,
+            latest,
+            func.coalesce(tokens.c.tokens_remaining, 0),
+            func.coalesce(tokens.c.tokens_purchased, 0),
+            func.coalesce(tokens.c.free_trial_used, False).cast(Integer),
+        ),
+    ))
+
+
+MIGRATIONS: dict[int, Callable[[Connection], None]] = {
+    2: unique_device_keys,
+    3: payment_status_index,
+    4: token_ledger,
+    5: ledger_snapshots,
+}
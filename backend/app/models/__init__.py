@@ -1,4 +1,5 @@
 from app.models.token import GenerationToken
 from app.models.payment import PaymentTransaction
+from app.models.ledger import TokenBalanceSnapshot, TokenLedgerEntry
 
-__all__ = ["GenerationToken", "PaymentTransaction"]
+__all__ = ["GenerationToken", "PaymentTransaction", "TokenLedgerEntry", "TokenBalanceSnapshot"]
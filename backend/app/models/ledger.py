@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index, LargeBinary
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class TokenLedgerEntry(Base):
+    """
+    One change to a device's token balance, kept for audits and disputes.
+
+    Entries are double-entry postings: `amount` moves from the counter
+    `account` (sales, promotions, usage, trials) to the device, so every
+    account's balance is minus the sum of its amounts. Trial entries count
+    free trials (1 used, -1 returned); all others count tokens.
+    """
+    __tablename__ = "token_ledger"
+    __table_args__ = (
+        # Per-device history, newest first
+        Index("ix_token_ledger_device_key_id", "device_key", "id"),
+        # A device is credited at most once per admin batch or checkout, so re-sent batches are no-ops
+        Index("uq_token_ledger_batch_id_device_key", "batch_id", "device_key", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_key = Column(LargeBinary(16), nullable=False)
+    device_id = Column(String(255), nullable=False)
+    kind = Column(String(20), nullable=False)  # grant, consume, refund or trial
+    account = Column(String(20), nullable=False)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String(255), nullable=True)
+    batch_id = Column(String(100), nullable=True)  # Admin batch id or checkout id
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class TokenBalanceSnapshot(Base):
+    """
+    A device's balance as of ledger entry `entry_id`.
+
+    Snapshots are rolled forward by maintenance; a balance is rebuilt from
+    the snapshot plus the entries after it, without replaying all history.
+    """
+    __tablename__ = "token_balance_snapshots"
+
+    device_key = Column(LargeBinary(16), primary_key=True)
+    device_id = Column(String(255), nullable=False)
+    entry_id = Column(Integer, nullable=False, index=True)
+    tokens_remaining = Column(Integer, nullable=False, default=0)
+    tokens_purchased = Column(Integer, nullable=False, default=0)
+    trials_used = Column(Integer, nullable=False, default=0)
+    taken_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
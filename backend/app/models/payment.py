@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
 
 class PaymentTransaction(Base):
     __tablename__ = "payment_transactions"
+    __table_args__ = (
+        # Reconciliation pages through stale pending checkouts in creation order
+        Index("ix_payment_transactions_status_created_at", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     checkout_id = Column(String(255), unique=True, nullable=False)
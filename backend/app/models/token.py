@@ -1,13 +1,25 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+import hashlib
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, LargeBinary
 from sqlalchemy.sql import func
 from app.database import Base
 
 
+def device_key(device_id: str) -> bytes:
+    """Fixed-width lookup key for a device id; the raw id is kept alongside for display."""
+    return hashlib.blake2b(device_id.encode(), digest_size=16).digest()
+
+
+def _default_device_key(context) -> bytes:
+    return device_key(context.get_current_parameters()["device_id"])
+
+
 class GenerationToken(Base):
     __tablename__ = "generation_tokens"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    device_id = Column(String(255), nullable=False, index=True)
+    device_key = Column(LargeBinary(16), nullable=False, unique=True, default=_default_device_key)
+    device_id = Column(String(255), nullable=False)
     tokens_remaining = Column(Integer, default=0)
     tokens_purchased = Column(Integer, default=0)
     free_trial_used = Column(Boolean, default=False)
@@ -0,0 +1,55 @@
+"""
+Production entrypoint.
+
+Usage:
+    WORKERS=4 python -m app.server
+
+Runs init_db once in the parent process, prepares the shared Prometheus
+directory when running several workers, then hands over to uvicorn.
+Workers inherit the environment set here, so they skip init_db and write
+their metrics where /metrics can aggregate them.
+"""
+import asyncio
+import glob
+import os
+
+import uvicorn
+
+from app.config import get_settings
+from app.database import get_engine, init_db
+
+
+def prepare_multiprocess_metrics(directory: str):
+    """Create the Prometheus multiprocess directory and drop samples from earlier runs."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.abspath(directory)
+
+
+async def init_schema():
+    await init_db()
+    # Pooled connections belong to this event loop, not the server's
+    await get_engine().dispose()
+
+
+def main():
+    settings = get_settings()
+
+    if settings.workers > 1:
+        prepare_multiprocess_metrics(settings.prometheus_multiproc_dir)
+
+    asyncio.run(init_schema())
+    os.environ["INIT_DB_ON_STARTUP"] = "false"
+    get_settings.cache_clear()
+
+    uvicorn.run(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import asyncio
+from functools import partial
+from typing import AsyncIterator, Callable, Optional
+
+import orjson
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.v1.schemas import VisualizeRequest
+from app.config import get_settings
+from app.services.llm_service import generate_future_vision, generate_lite_visions
+from app.services.response_fields import generation_cost, normalize_fields
+from app.services.token_service import refund_generations
+from app.services.vision_cache import get_or_generate
+
+# (index, item) pairs handled by one upstream call
+Job = list[tuple[int, VisualizeRequest]]
+
+# Refunds of abandoned streams, referenced until they finish
+_refunds: set[asyncio.Task] = set()
+
+
+def _line(index: int, item: VisualizeRequest, vision: Optional[bytes] = None, error: Optional[str] = None) -> bytes:
+    head = orjson.dumps({"index": index, "concept": item.concept, "language": item.language})
+    if vision is not None:
+        return head[:-1] + b',"vision":' + vision + b"}\n"
+    return head[:-1] + b',"error":' + orjson.dumps(error) + b"}\n"
+
+
+def plan_jobs(items: list[VisualizeRequest], lite: bool, pack_size: int) -> list[Job]:
+    """Full visions get one job each; lite concepts are packed per language."""
+    indexed = list(enumerate(items))
+    if not lite:
+        return [[pair] for pair in indexed]
+
+    by_language: dict[str, Job] = {}
+    for index, item in indexed:
+        by_language.setdefault(item.language, []).append((index, item))
+    return [
+        pairs[start:start + pack_size]
+        for pairs in by_language.values()
+        for start in range(0, len(pairs), pack_size)
+    ]
+
+
+def item_costs(items: list[VisualizeRequest], lite: bool) -> list[int]:
+    """Token cost of each item; lite visions cost the brief tier."""
+    if lite:
+        return [generation_cost(())] * len(items)
+    return [generation_cost(normalize_fields(item.fields)) for item in items]
+
+
+async def _run_full(job: Job) -> tuple[bytes, list[int]]:
+    index, item = job[0]
+    fields = normalize_fields(item.fields)
+    generate = generate_future_vision if fields is None else partial(generate_future_vision, fields=fields)
+    try:
+        vision = await get_or_generate(item.concept, item.language, generate, fields)
+    except Exception as e:
+        return _line(index, item, error=str(e)), []
+    return _line(index, item, vision=vision), [index]
+
+
+async def _run_lite(job: Job) -> tuple[bytes, list[int]]:
+    language = job[0][1].language
+    try:
+        visions = await generate_lite_visions([item.concept for _, item in job], language)
+    except Exception as e:
+        return b"".join(_line(index, item, error=str(e)) for index, item in job), []
+    return b"".join(
+        _line(index, item, vision=orjson.dumps(vision))
+        for (index, item), vision in zip(job, visions)
+    ), [index for index, _ in job]
+
+
+def undelivered_refund(costs: list[int], delivered: set[int], is_free_trial: bool) -> tuple[int, bool]:
+    """Tokens to refund for the items not delivered, and whether the free trial (item 0) is one."""
+    undelivered = [index for index in range(len(costs)) if index not in delivered]
+    trial = is_free_trial and 0 in undelivered
+    tokens = sum(costs[index] for index in undelivered if not (index == 0 and is_free_trial))
+    return tokens, trial
+
+
+async def _refund(sessionmaker: async_sessionmaker, device_id: str, tokens: int, free_trial: bool) -> int:
+    # Its own session: the request's has been closed by the time the body streams
+    async with sessionmaker() as db:
+        return await refund_generations(db, device_id, tokens + free_trial, free_trial=free_trial)
+
+
+async def stream_batch(
+    sessionmaker: async_sessionmaker,
+    device_id: str,
+    items: list[VisualizeRequest],
+    lite: bool,
+    costs: list[int],
+    is_free_trial: bool,
+    remaining: int,
+) -> AsyncIterator[bytes]:
+    """
+    Run a reserved batch and yield NDJSON lines in completion order.
+
+    Every concept gets one line with either `vision` or `error`. Failed
+    concepts are refunded (their `costs`, or the free trial) in one write at
+    the end, and a final summary line reports the balance. If the client
+    goes away mid-stream, everything not yet delivered is refunded.
+    """
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    run: Callable = _run_lite if lite else _run_full
+
+    async def bounded(job: Job) -> tuple[bytes, list[int]]:
+        async with semaphore:
+            return await run(job)
+
+    tasks = [
+        asyncio.create_task(bounded(job))
+        for job in plan_jobs(items, lite, settings.batch_pack_size)
+    ]
+    delivered: set[int] = set()
+    refunded = False
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            lines, job_succeeded = await next_done
+            delivered.update(job_succeeded)  # Handed to the response once yielded
+            yield lines
+
+        tokens, trial = undelivered_refund(costs, delivered, is_free_trial)
+        refunded = True
+        if tokens or trial:
+            remaining = await _refund(sessionmaker, device_id, tokens, trial)
+        yield orjson.dumps({
+            "done": True,
+            "succeeded": len(delivered),
+            "failed": len(items) - len(delivered),
+            "is_free_trial": is_free_trial,
+            "remaining_tokens": remaining,
+        }) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        if not refunded:
+            tokens, trial = undelivered_refund(costs, delivered, is_free_trial)
+            if tokens or trial:
+                # Shielded: a cancelled stream still finishes the refund
+                refund = asyncio.ensure_future(_refund(sessionmaker, device_id, tokens, trial))
+                _refunds.add(refund)
+                refund.add_done_callback(_refunds.discard)
+                await asyncio.shield(refund)
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from contextlib import suppress
+from typing import Awaitable, Optional, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+
+class RequestAbandoned(Exception):
+    """The client went away, or its deadline passed, before the work finished."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason  # "disconnect" or "deadline"
+
+
+def parse_deadline(header: Optional[str]) -> Optional[float]:
+    """
+    Turn an X-Deadline-Ms header (the client's remaining budget) into a monotonic deadline.
+
+    Raises:
+        ValueError: if the header is not a positive integer
+    """
+    if header is None:
+        return None
+    budget_ms = int(header)
+    if budget_ms <= 0:
+        raise ValueError("X-Deadline-Ms must be positive")
+    return time.monotonic() + budget_ms / 1000
+
+
+async def wait_for_disconnect(request: Request):
+    # The body has already been read, so the next message is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_abandoned(request: Request, work: Awaitable[T], deadline: Optional[float] = None) -> T:
+    """
+    Await `work`, cancelling it if the client disconnects or the deadline passes.
+
+    Raises:
+        RequestAbandoned: with the reason, after `work` has been cancelled
+    """
+    task = asyncio.ensure_future(work)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        done, _ = await asyncio.wait({task, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+
+    if task in done:
+        return task.result()
+    task.cancel()
+    with suppress(asyncio.CancelledError, Exception):
+        await task
+    raise RequestAbandoned("disconnect" if disconnect in done else "deadline")
@@ -0,0 +1,69 @@
+import time
+from typing import Optional
+
+from app.config import get_settings
+from app.metrics import llm_circuit_open, TOOL_NAME
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be down."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `failure_threshold` consecutive failures.
+
+    While open, calls are refused for `cooldown` seconds. Each cooldown after
+    that lets one probe call through; a success closes the circuit, a failure
+    keeps it open for another cooldown. A probe that never reports back (its
+    request was cancelled) just lets the next cooldown's probe through.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently refused, i.e. the upstream should be treated as down."""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Whether to attempt a call now. Past the cooldown, the caller becomes the probe."""
+        if self.opened_at is None:
+            return True
+        if self.is_open:
+            return False
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.opened_at is not None:
+            self.opened_at = None
+            llm_circuit_open.labels(tool=TOOL_NAME, upstream=self.name).set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            llm_circuit_open.labels(tool=TOOL_NAME, upstream=self.name).set(1)
+
+
+_llm_breaker: Optional[CircuitBreaker] = None
+
+
+def get_llm_breaker() -> CircuitBreaker:
+    """Breaker for the LLM proxy, one per worker process."""
+    global _llm_breaker
+    if _llm_breaker is None:
+        settings = get_settings()
+        _llm_breaker = CircuitBreaker(
+            "llm_proxy",
+            failure_threshold=settings.circuit_breaker_failure_threshold,
+            cooldown=settings.circuit_breaker_cooldown_seconds,
+        )
+    return _llm_breaker
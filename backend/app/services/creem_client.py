@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Optional, TYPE_CHECKING
+
+from app.config import get_settings
+from app.metrics import InFlight
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CreemClient:
+    """
+    Creem API client that reuses one connection pool across calls.
+
+    Creem has no bulk checkout lookup, so `get_checkout_statuses` fans single
+    lookups out over the pool, at most `max_connections` at a time.
+    """
+
+    def __init__(self, api_url: str, api_key: str, max_connections: int = 10, timeout: float = 15.0):
+        import httpx
+
+        self.max_connections = max_connections
+        self.in_flight = InFlight("creem", max_connections)
+        self._client = httpx.AsyncClient(
+            base_url=api_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def get_checkout_status(self, checkout_id: str) -> Optional[str]:
+        """Creem's status for a checkout ("pending", "completed", "expired", ...), or None if unknown."""
+        with self.in_flight.track():
+            response = await self._client.get("/v1/checkouts", params={"checkout_id": checkout_id})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(f"Creem API error: {response.status_code} - {response.text}")
+        return response.json().get("status")
+
+    async def get_checkout_statuses(self, checkout_ids: list[str]) -> dict[str, Optional[str]]:
+        """
+        Look up many checkouts concurrently.
+
+        Returns:
+            dict of checkout_id to status (None when Creem answered 404);
+            checkouts whose lookup failed are left out
+        """
+        semaphore = asyncio.Semaphore(self.max_connections)
+
+        async def lookup(checkout_id: str) -> Optional[str]:
+            async with semaphore:
+                return await self.get_checkout_status(checkout_id)
+
+        results = await asyncio.gather(*map(lookup, checkout_ids), return_exceptions=True)
+        statuses = {}
+        for checkout_id, result in zip(checkout_ids, results):
+            if isinstance(result, Exception):
+                logger.warning("Creem lookup for checkout %s failed: %s", checkout_id, result)
+            else:
+                statuses[checkout_id] = result
+        return statuses
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_creem_client: Optional[CreemClient] = None
+
+
+def get_creem_client() -> CreemClient:
+    global _creem_client
+    if _creem_client is None:
+        settings = get_settings()
+        _creem_client = CreemClient(
+            settings.creem_api_url,
+            settings.creem_api_key,
+            max_connections=settings.creem_max_connections,
+        )
+    return _creem_client
+
+
+async def close_creem_client():
+    global _creem_client
+    if _creem_client is not None:
+        await _creem_client.aclose()
+        _creem_client = None
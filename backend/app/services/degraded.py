@@ -0,0 +1,111 @@
+"""
+Visions served while the LLM proxy is down.
+
+A cached vision of the concept (or a near-duplicate) is served when there is
+one; otherwise a template vision is built from the same copy the
+programmatic SEO pages use. Template text is English only.
+"""
+import re
+
+from app.metrics import degraded_responses, TOOL_NAME
+from app.services.vision_cache import encode_vision, get_cached_vision, get_similar_vision
+
+# From programmatic-seo/generate-pages.js (focusAreaContent)
+FOCUS_AREA_CONTENT = {
+    "technology": "Explore the cutting-edge technological advancements that will transform {product}. From AI integration to quantum computing, discover the innovations that will reshape how we interact with technology.",
+    "user-experience": "Discover how {product} will revolutionize user interaction in the future. Seamless interfaces, intuitive design, and personalized experiences will define the next generation.",
+    "social-impact": "Examine the profound social implications of {product}'s evolution. From changing work patterns to new forms of community, explore how society will adapt.",
+    "business-model": "Analyze the economic transformation of {product}. New revenue streams, subscription models, and decentralized ownership will reshape the business landscape.",
+    "ai-integration": "See how artificial intelligence will be deeply woven into {product}. Smart automation, predictive capabilities, and conversational interfaces will become standard.",
+    "sustainability": "Explore the green revolution in {product}. Carbon neutrality, circular economy principles, and eco-friendly design will drive the future.",
+    "privacy": "Understand how {product} will balance innovation with privacy. Decentralized data, encryption, and user sovereignty will be paramount.",
+    "accessibility": "Discover how {product} will become universally accessible. Inclusive design, multi-modal interfaces, and adaptive technologies will serve everyone.",
+}
+
+# From programmatic-seo/generate-pages.js (industryContent)
+INDUSTRY_CONTENT = {
+    "tech": "The technology sector continues to push boundaries with exponential innovation.",
+    "healthcare": "Healthcare is being revolutionized by AI diagnostics, telemedicine, and personalized treatments.",
+    "finance": "Finance is transforming with blockchain, DeFi, and AI-powered investment strategies.",
+    "education": "Education is becoming more personalized, accessible, and AI-enhanced.",
+    "retail": "Retail is evolving with immersive shopping, automated logistics, and hyper-personalization.",
+    "entertainment": "Entertainment is merging reality with virtual worlds in unprecedented ways.",
+    "manufacturing": "Manufacturing is becoming smarter with IoT, 3D printing, and robotic automation.",
+    "agriculture": "Agriculture is being transformed by precision farming and sustainable practices.",
+    "energy": "Energy is transitioning to clean, distributed, and smart grid systems.",
+    "real-estate": "Real estate is evolving with smart buildings and virtual property.",
+    "travel": "Travel is being reimagined with sustainable transport and seamless experiences.",
+    "food": "Food systems are being revolutionized by lab-grown proteins and AI nutrition.",
+    "fashion": "Fashion is embracing sustainability, personalization, and digital wearables.",
+    "sports": "Sports are integrating AR/VR, analytics, and new forms of competition.",
+    "media": "Media is becoming immersive, interactive, and AI-generated.",
+}
+
+# Words in a concept that point at an industry; "tech" is the fallback
+INDUSTRY_KEYWORDS = {
+    "healthcare": ("health", "medic", "doctor", "hospital", "fitness", "peloton"),
+    "finance": ("bank", "pay", "financ", "crypto", "coin", "stock", "stripe", "robinhood", "invest"),
+    "education": ("edu", "learn", "school", "course", "duolingo"),
+    "retail": ("shop", "commerce", "store", "amazon", "retail"),
+    "entertainment": ("game", "gaming", "stream", "netflix", "spotify", "music", "movie", "steam"),
+    "manufacturing": ("factory", "manufactur", "robot", "3d print"),
+    "agriculture": ("farm", "agri", "crop"),
+    "energy": ("energy", "solar", "battery", "grid", "tesla"),
+    "real-estate": ("home", "house", "real estate", "airbnb", "property"),
+    "travel": ("travel", "uber", "flight", "hotel", "transport", "maps"),
+    "food": ("food", "delivery", "doordash", "instacart", "restaurant"),
+    "fashion": ("fashion", "cloth", "wear", "watch"),
+    "sports": ("sport", "football", "soccer"),
+    "media": ("news", "media", "tiktok", "instagram", "youtube", "twitter", "social", "reddit"),
+}
+
+# Template sections, each built from focus areas of the SEO copy
+SECTIONS = {
+    "technology": ("Technology Evolution", ("technology", "ai-integration")),
+    "experience": ("User Experience", ("user-experience", "accessibility")),
+    "society": ("Social Impact", ("social-impact", "sustainability", "privacy")),
+    "wildcard": ("The Unexpected", ("business-model",)),
+}
+
+
+def match_industry(concept: str) -> str:
+    text = concept.casefold()
+    for industry, keywords in INDUSTRY_KEYWORDS.items():
+        if any(re.search(rf"\b{re.escape(keyword)}", text) for keyword in keywords):
+            return industry
+    return "tech"
+
+
+def template_vision(concept: str) -> dict:
+    """Build a generic vision for `concept` without calling the LLM."""
+    product = concept.strip()
+    industry = INDUSTRY_CONTENT[match_industry(concept)]
+    return {
+        "title": f"The Future of {product}",
+        "year": 2036,
+        "summary": f"{FOCUS_AREA_CONTENT['technology'].format(product=product)} {industry}",
+        "sections": {
+            key: {
+                "title": title,
+                "content": "\n\n".join(FOCUS_AREA_CONTENT[area].format(product=product) for area in areas),
+            }
+            for key, (title, areas) in SECTIONS.items()
+        },
+        "key_changes": [
+            industry,
+            f"AI woven into every part of {product}",
+            f"Interfaces for {product} that adapt to each person",
+            f"Privacy and sustainability as defaults for {product}",
+        ],
+    }
+
+
+async def get_degraded_vision(concept: str, language: str) -> bytes:
+    """Get a serialized vision without calling the LLM: cached if possible, else from the template."""
+    body = await get_cached_vision(concept, language) or await get_similar_vision(concept, language)
+    if body:
+        degraded_responses.labels(tool=TOOL_NAME, source="cache").inc()
+        return body
+    degraded_responses.labels(tool=TOOL_NAME, source="template").inc()
+    # Not cached: it would shadow the real vision once the LLM is back
+    return encode_vision(template_vision(concept), concept)
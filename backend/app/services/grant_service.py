@@ -0,0 +1,163 @@
+"""
+Bulk token grants for support and marketing campaigns.
+
+A batch is a stream of (device_id, amount, reason) lines, CSV or NDJSON.
+It is applied a chunk at a time: each chunk's ledger entries and balance
+upserts commit together. The ledger allows one grant per device per batch
+id, so a batch that is sent again (after a timeout, say) grants nothing new.
+"""
+import csv
+import time
+from typing import AsyncIterable, AsyncIterator, NamedTuple, Optional
+
+import orjson
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.metrics import admin_tokens_granted, TOOL_NAME
+from app.models.ledger import TokenLedgerEntry
+from app.services.ledger_service import entry
+from app.services.token_service import add_tokens_bulk
+
+# Devices per transaction; keeps each INSERT well under SQLite's variable limit
+CHUNK_SIZE = 2000
+
+MAX_AMOUNT = 10000
+MAX_ERRORS_REPORTED = 20
+FORMATS = ("csv", "ndjson")
+
+
+class Grant(NamedTuple):
+    device_id: str
+    amount: int
+    reason: Optional[str]
+
+
+def parse_grant(line: str, format: str) -> Grant:
+    """Parse one line of a batch. Raises ValueError with a message for the report."""
+    if format == "csv":
+        fields = next(csv.reader([line]))
+        if len(fields) < 2:
+            raise ValueError("expected device_id,amount[,reason]")
+        device_id, amount, reason = fields[0].strip(), fields[1].strip(), ",".join(fields[2:]).strip()
+        try:
+            amount = int(amount)
+        except ValueError:
+            raise ValueError(f"amount is not an integer: {amount!r}")
+    else:
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise ValueError("not valid JSON")
+        if not isinstance(data, dict):
+            raise ValueError("expected an object")
+        device_id, amount, reason = data.get("device_id"), data.get("amount"), data.get("reason")
+        if not isinstance(device_id, str):
+            raise ValueError("device_id is missing")
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            raise ValueError("amount is not an integer")
+        if reason is not None and not isinstance(reason, str):
+            raise ValueError("reason is not a string")
+        device_id = device_id.strip()
+
+    if not device_id or len(device_id) > 255:
+        raise ValueError("device_id must be 1-255 characters")
+    if not 1 <= amount <= MAX_AMOUNT:
+        raise ValueError(f"amount must be between 1 and {MAX_AMOUNT}")
+    return Grant(device_id, amount, reason[:255] if reason else None)
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into lines as it arrives."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode(errors="replace")
+    if pending:
+        yield pending.decode(errors="replace")
+
+
+async def _apply_chunk(db: AsyncSession, batch_id: str, grants: dict[str, Grant]) -> tuple[int, int]:
+    """Grant a chunk in one transaction. Returns (devices granted, tokens granted)."""
+    table = TokenLedgerEntry.__table__
+    stmt = (
+        insert(table)
+        # Devices this batch already granted (in an earlier attempt) come back empty
+        .on_conflict_do_nothing(index_elements=[table.c.batch_id, table.c.device_key])
+        .returning(table.c.device_id, table.c.amount)
+    )
+    result = await db.execute(stmt, [
+        entry(grant.device_id, "grant", grant.amount, account="promotions", reason=grant.reason, batch_id=batch_id)
+        for grant in grants.values()
+    ])
+    granted = dict(result.all())
+    await add_tokens_bulk(db, granted, purchased=False)  # Commits the ledger entries with it
+    return len(granted), sum(granted.values())
+
+
+async def apply_grants(db: AsyncSession, batch_id: str, lines: AsyncIterable[str], format: str) -> dict:
+    """
+    Apply a batch of grants, CHUNK_SIZE devices per transaction.
+
+    A device listed twice in a batch is granted once (its first line); lines
+    that don't parse are skipped and reported. A CSV header row is allowed.
+
+    Returns:
+        dict with line, device and token counts, the first errors, and throughput
+    """
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    started = time.perf_counter()
+    report = {
+        "batch_id": batch_id,
+        "lines": 0,
+        "granted": 0,
+        "tokens": 0,
+        "already_granted": 0,
+        "duplicates": 0,
+        "invalid": 0,
+        "errors": [],
+    }
+    seen: set[str] = set()
+    chunk: dict[str, Grant] = {}
+
+    async def flush():
+        granted, tokens = await _apply_chunk(db, batch_id, chunk)
+        report["granted"] += granted
+        report["tokens"] += tokens
+        report["already_granted"] += len(chunk) - granted
+        chunk.clear()
+
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        if number == 1 and format == "csv" and line.lstrip().lower().startswith("device_id"):
+            continue
+        report["lines"] += 1
+        try:
+            grant = parse_grant(line, format)
+        except ValueError as e:
+            report["invalid"] += 1
+            if len(report["errors"]) < MAX_ERRORS_REPORTED:
+                report["errors"].append({"line": number, "error": str(e)})
+            continue
+        if grant.device_id in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(grant.device_id)
+        chunk[grant.device_id] = grant
+        if len(chunk) >= CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    admin_tokens_granted.labels(tool=TOOL_NAME).inc(report["tokens"])
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["devices_per_second"] = round(report["granted"] / seconds) if seconds else None
+    return report
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, TypeVar
+
+from app.config import get_settings
+
+T = TypeVar("T")
+
+# update() callbacks get the current value (None if missing) and return (new_value, result)
+Updater = Callable[[Optional[bytes]], tuple[bytes, T]]
+
+
+def _expires_at(ttl: Optional[float], now: float) -> Optional[float]:
+    return now + ttl if ttl else None
+
+
+class MemoryKVStore:
+    """
+    Per-process key-value store.
+
+    The default for single-worker deployments and the stand-in used by
+    tests. Bounded LRU with per-key expiry. Every method runs without
+    awaiting, so each call is atomic on the event loop.
+    """
+
+    def __init__(self, max_keys: int = 50_000):
+        self.max_keys = max_keys
+        self._data: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+
+    def _live(self, key: str, now: float) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _put(self, key: str, value: bytes, ttl: Optional[float], now: float):
+        self._data[key] = (value, _expires_at(ttl, now))
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._live(key, time.time())
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._put(key, value, ttl, time.time())
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """Set `key` only if it is missing. Returns True if it was set."""
+        now = time.time()
+        if self._live(key, now) is not None:
+            return False
+        self._put(key, value, ttl, now)
+        return True
+
+    async def update(self, key: str, updater: Updater, ttl: Optional[float] = None) -> T:
+        """Atomically replace a value with `updater(current)`."""
+        now = time.time()
+        value, result = updater(self._live(key, now))
+        self._put(key, value, ttl, now)
+        return result
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def clear(self):
+        self._data.clear()
+
+
+class SQLiteKVStore:
+    """
+    Key-value store shared by every worker on the host through one SQLite file.
+
+    Writes run in IMMEDIATE transactions, so update() and add() are atomic
+    across processes. Calls run in a thread to keep the event loop free.
+    """
+
+    # Expired rows are swept after this many writes
+    SWEEP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+        )
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, now),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _put(self, key: str, value: bytes, ttl: Optional[float], now: float):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, _expires_at(ttl, now)),
+        )
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+
+    def _write(self, fn: Callable[[float], T]) -> T:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(time.time())
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    async def get(self, key: str) -> Optional[bytes]:
+        def _read():
+            with self._lock:
+                return self._get(key, time.time())
+        return await asyncio.to_thread(_read)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await asyncio.to_thread(self._write, lambda now: self._put(key, value, ttl, now))
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        def _add(now: float) -> bool:
+            if self._get(key, now) is not None:
+                return False
+            self._put(key, value, ttl, now)
+            return True
+        return await asyncio.to_thread(self._write, _add)
+
+    async def update(self, key: str, updater: Updater, ttl: Optional[float] = None) -> T:
+        def _update(now: float):
+            value, result = updater(self._get(key, now))
+            self._put(key, value, ttl, now)
+            return result
+        return await asyncio.to_thread(self._write, _update)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._write, lambda now: self._conn.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def clear(self):
+        await asyncio.to_thread(self._write, lambda now: self._conn.execute("DELETE FROM kv"))
+
+
+_store = None
+
+
+def get_kv_store():
+    """
+    Build the shared store from settings on first use.
+
+    With kv_backend="auto" a single worker keeps everything in memory and
+    multiple workers share the SQLite file.
+    """
+    global _store
+    if _store is None:
+        settings = get_settings()
+        backend = settings.kv_backend
+        if backend == "auto":
+            backend = "sqlite" if settings.workers > 1 else "memory"
+        if backend == "sqlite":
+            _store = SQLiteKVStore(settings.kv_sqlite_path)
+        else:
+            _store = MemoryKVStore(settings.kv_memory_max_keys)
+    return _store
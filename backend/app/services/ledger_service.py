@@ -0,0 +1,206 @@
+"""
+The token ledger: an append-only record of every balance change.
+
+generation_tokens holds the materialized balance that requests read in one
+lookup; every write to it records its ledger entries in the same
+transaction. Snapshots fold the ledger into per-device balances now and
+then, so a balance is rebuilt (or checked) from its snapshot plus the
+entries after it instead of from the whole history.
+"""
+from typing import Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.ledger import TokenBalanceSnapshot, TokenLedgerEntry
+from app.models.token import GenerationToken, device_key
+
+# Counter account of each kind of entry; grants come from "sales" (purchases)
+# or "promotions" (admin grants)
+ACCOUNTS = {
+    "grant": "sales",
+    "consume": "usage",
+    "refund": "usage",
+    "trial": "trials",
+}
+
+# Ledger ids folded into snapshots per transaction
+SNAPSHOT_CHUNK = 20000
+
+# The balance of a device with no record, e.g. one pruned by maintenance
+UNUSED = {"tokens_remaining": 0, "tokens_purchased": 0, "free_trial_used": False}
+
+
+def entry(
+    device_id: str,
+    kind: str,
+    amount: int,
+    account: Optional[str] = None,
+    reason: Optional[str] = None,
+    batch_id: Optional[str] = None,
+) -> dict:
+    """Row values for one ledger entry, crediting `amount` to the device."""
+    return {
+        "device_key": device_key(device_id),
+        "device_id": device_id,
+        "kind": kind,
+        "account": account or ACCOUNTS[kind],
+        "amount": amount,
+        "reason": reason,
+        "batch_id": batch_id,
+    }
+
+
+async def record_entries(db: AsyncSession, entries: list[dict]):
+    """Add entries to the caller's transaction; they commit with its balance update."""
+    if entries:
+        await db.execute(insert(TokenLedgerEntry.__table__), entries)
+
+
+def _totals(entries):
+    """Balance columns summed over ledger rows: (tokens, purchased, trials)."""
+    is_trial = entries.c.kind == "trial"
+    return (
+        func.coalesce(func.sum(case((is_trial, 0), else_=entries.c.amount)), 0),
+        func.coalesce(func.sum(case((entries.c.account == "sales", entries.c.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((is_trial, entries.c.amount), else_=0)), 0),
+    )
+
+
+async def take_snapshots(db: AsyncSession) -> int:
+    """
+    Roll every device's snapshot forward to the latest ledger entry.
+
+    Each snapshot covers all entries up to the highest snapshotted entry id,
+    so only entries after it are read, SNAPSHOT_CHUNK ids per transaction.
+
+    Returns:
+        Number of ledger entries folded in
+    """
+    ledger = TokenLedgerEntry.__table__
+    snapshots = TokenBalanceSnapshot.__table__
+    done = await db.scalar(select(func.max(snapshots.c.entry_id))) or 0
+    # Ids are assigned under SQLite's write lock, so everything up to the
+    # highest committed id is committed too and can't appear later
+    last = await db.scalar(select(func.max(ledger.c.id))) or 0
+
+    folded = 0
+    while done < last:
+        upto = min(done + SNAPSHOT_CHUNK, last)
+        tokens, purchased, trials = _totals(ledger)
+        rows = (await db.execute(
+            select(ledger.c.device_key, func.min(ledger.c.device_id), tokens, purchased, trials, func.count())
+            .where(ledger.c.id > done, ledger.c.id <= upto)
+            .group_by(ledger.c.device_key)
+        )).all()
+        if rows:
+            stmt = insert(snapshots)
+            await db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[snapshots.c.device_key],
+                    set_={
+                        "entry_id": stmt.excluded.entry_id,
+                        "tokens_remaining": snapshots.c.tokens_remaining + stmt.excluded.tokens_remaining,
+                        "tokens_purchased": snapshots.c.tokens_purchased + stmt.excluded.tokens_purchased,
+                        "trials_used": snapshots.c.trials_used + stmt.excluded.trials_used,
+                        "taken_at": func.now(),
+                    },
+                ),
+                [
+                    {
+                        "device_key": key,
+                        "device_id": device_id,
+                        "entry_id": upto,
+                        "tokens_remaining": row_tokens,
+                        "tokens_purchased": row_purchased,
+                        "trials_used": row_trials,
+                    }
+                    for key, device_id, row_tokens, row_purchased, row_trials, _ in rows
+                ],
+            )
+            await db.commit()
+            folded += sum(row[-1] for row in rows)
+        done = upto
+    return folded
+
+
+async def rebuild_balance(db: AsyncSession, device_id: str) -> dict:
+    """A device's balance from its snapshot and the ledger entries after it."""
+    key = device_key(device_id)
+    snapshot = (await db.execute(
+        select(TokenBalanceSnapshot).where(TokenBalanceSnapshot.device_key == key)
+    )).scalar_one_or_none()
+    after = snapshot.entry_id if snapshot else 0
+
+    ledger = TokenLedgerEntry.__table__
+    tokens, purchased, trials = (await db.execute(
+        select(*_totals(ledger)).where(ledger.c.device_key == key, ledger.c.id > after)
+    )).one()
+    if snapshot:
+        tokens += snapshot.tokens_remaining
+        purchased += snapshot.tokens_purchased
+        trials += snapshot.trials_used
+    return {
+        "tokens_remaining": tokens,
+        "tokens_purchased": purchased,
+        "free_trial_used": trials > 0,
+    }
+
+
+async def verify_balances(db: AsyncSession, repair: bool = False) -> dict:
+    """
+    Compare every materialized balance with the ledger.
+
+    Snapshots are rolled forward first, so the comparison is one join.
+    With `repair`, mismatched balances are overwritten with the ledger's.
+
+    Returns:
+        dict with the mismatched devices and every counter account's balance
+    """
+    folded = await take_snapshots(db)
+
+    tokens = GenerationToken.__table__
+    snapshots = TokenBalanceSnapshot.__table__
+    trial_used = func.coalesce(snapshots.c.trials_used, 0) > 0
+    candidates = (await db.execute(
+        select(func.coalesce(tokens.c.device_id, snapshots.c.device_id))
+        .select_from(tokens.join(snapshots, tokens.c.device_key == snapshots.c.device_key, full=True))
+        .where(
+            (func.coalesce(tokens.c.tokens_remaining, 0) != func.coalesce(snapshots.c.tokens_remaining, 0))
+            | (func.coalesce(tokens.c.tokens_purchased, 0) != func.coalesce(snapshots.c.tokens_purchased, 0))
+            | (func.coalesce(tokens.c.free_trial_used, False) != trial_used)
+        )
+    )).scalars().all()
+
+    # Entries written since the snapshots are counted when each candidate is rebuilt
+    mismatched = []
+    for device_id in candidates:
+        ledger = await rebuild_balance(db, device_id)
+        row = (await db.execute(
+            select(tokens.c.tokens_remaining, tokens.c.tokens_purchased, tokens.c.free_trial_used)
+            .where(tokens.c.device_key == device_key(device_id))
+        )).one_or_none()
+        materialized = dict(row._mapping) if row else None
+        if materialized != ledger and not (materialized is None and ledger == UNUSED):
+            mismatched.append({"device_id": device_id, "materialized": materialized, "ledger": ledger})
+            if repair:
+                await _overwrite_balance(db, device_id, ledger)
+
+    balance = (-func.sum(TokenLedgerEntry.amount)).label("balance")
+    accounts = dict((await db.execute(
+        select(TokenLedgerEntry.account, balance).group_by(TokenLedgerEntry.account)
+    )).all())
+    return {
+        "entries_snapshotted": folded,
+        "mismatched": len(mismatched),
+        "devices": mismatched[:100],
+        "repaired": len(mismatched) if repair else 0,
+        "accounts": accounts,
+    }
+
+
+async def _overwrite_balance(db: AsyncSession, device_id: str, balance: dict):
+    stmt = insert(GenerationToken).values(device_key=device_key(device_id), device_id=device_id, **balance)
+    await db.execute(stmt.on_conflict_do_update(index_elements=[GenerationToken.device_key], set_=balance))
+    await db.commit()
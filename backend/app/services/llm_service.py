@@ -1,121 +1,293 @@
-import httpx
-from typing import Optional
+import json
+from typing import Optional, TYPE_CHECKING
 from app.config import get_settings
+from app.metrics import InFlight
+from app.services.circuit_breaker import CircuitOpenError, get_llm_breaker
+from app.services.offload import offload
+from app.services.response_fields import PARTS, SECTIONS, Fields
+
+if TYPE_CHECKING:
+    import httpx
 
 settings = get_settings()
 
+_http_client: Optional["httpx.AsyncClient"] = None
+
+# httpx's default connection limit, set explicitly so utilization has a denominator
+MAX_CONNECTIONS = 100
+in_flight = InFlight("llm_proxy", MAX_CONNECTIONS)
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Shared LLM proxy client, created (and httpx imported) on first use."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=MAX_CONNECTIONS))
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+LANGUAGE_PROMPTS = {
+    "en": "Respond in English.",
+    "zh": "用中文回答。",
+    "ja": "日本語で回答してください。",
+    "de": "Antworte auf Deutsch.",
+    "fr": "Répondez en français.",
+    "ko": "한국어로 답변해 주세요.",
+    "es": "Responde en español.",
+}
+
+LANGUAGE_NAMES = {
+    "en": "English",
+    "zh": "Simplified Chinese",
+    "ja": "Japanese",
+    "de": "German",
+    "fr": "French",
+    "ko": "Korean",
+    "es": "Spanish",
+}
+
+FUTURIST_BRIEF = """You are a futurist and technology analyst with deep expertise in predicting technological evolution.
+Your task is to envision what a given product, website, or concept will look like in 10 years (around 2035-2036).
+
+Be creative, imaginative, and grounded in current technological trends. Consider:
+- AI integration and automation
+- Hardware miniaturization and new form factors
+- Social and cultural shifts
+- Environmental and sustainability factors
+- Economic and business model evolution"""
+
+
+async def chat_completion(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int = 4000,
+    temperature: float = 0.8,
+) -> str:
+    """
+    Send one chat completion to the LLM proxy and return the message content.
+    
+    Transport errors and 5xx responses count against the circuit breaker;
+    while it is open this raises CircuitOpenError without calling the proxy.
+    """
+    breaker = get_llm_breaker()
+    if not breaker.allow():
+        raise CircuitOpenError("LLM proxy is unavailable")
+    
+    client = get_http_client()
+    try:
+        with in_flight.track():
+            response = await client.post(
+                f"{settings.llm_proxy_url}/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.llm_proxy_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": "gemini-2.5-flash",
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+            )
+    except Exception:
+        breaker.record_failure()
+        raise
+    
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    
+    if response.status_code != 200:
+        raise Exception(f"LLM API error: {response.status_code} - {response.text}")
+    
+    data = await offload(json.loads, response.content, size=len(response.content))
+    return data["choices"][0]["message"]["content"]
+
+
+def extract_json(content: str):
+    """Parse JSON from a completion, unwrapping markdown code blocks. Raises JSONDecodeError."""
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+    return json.loads(content.strip())
+
+
+def parse_vision(content: str, concept: str) -> dict:
+    """Parse a full vision completion, falling back to the raw text if it isn't JSON."""
+    try:
+        return extract_json(content)
+    except json.JSONDecodeError:
+        return {
+            "title": f"The Future of {concept}",
+            "year": 2036,
+            "summary": content[:500],
+            "sections": {
+                "technology": {"title": "Technology", "content": content},
+                "experience": {"title": "Experience", "content": ""},
+                "society": {"title": "Society", "content": ""},
+                "wildcard": {"title": "Wildcard", "content": ""},
+            },
+            "key_changes": [],
+        }
+
+
+# The JSON a full vision is asked for, part by part, so a request that
+# selects fields only asks for those (see response_fields)
+VISION_PARTS = {
+    "summary": '  "summary": "A 2-3 sentence overview of the transformation"',
+    "technology": """    "technology": {
+      "title": "Technology Evolution",
+      "content": "3-4 paragraphs about technical changes"
+    }""",
+    "experience": """    "experience": {
+      "title": "User Experience",
+      "content": "3-4 paragraphs about how people will interact with it"
+    }""",
+    "society": """    "society": {
+      "title": "Social Impact",
+      "content": "3-4 paragraphs about societal implications"
+    }""",
+    "wildcard": """    "wildcard": {
+      "title": "The Unexpected",
+      "content": "1-2 paragraphs with a surprising or unconventional prediction"
+    }""",
+    "key_changes": '  "key_changes": ["change 1", "change 2", "change 3", "change 4", "change 5"]',
+}
+
+# Completion tokens budgeted per part; a full vision gets the 4000 it always had
+MAX_TOKENS_BASE = 300
+MAX_TOKENS_PER_PART = {"summary": 150, "key_changes": 150, "wildcard": 500}
+MAX_TOKENS_PER_SECTION = 1000
+
+
+def vision_structure(fields: Fields = None) -> str:
+    """The JSON structure in the prompt, with only the selected parts."""
+    selected = [part for part in PARTS if fields is None or part in fields]
+    lines = ['  "title": "A catchy headline about the future of [concept]"', '  "year": 2036']
+    if "summary" in selected:
+        lines.append(VISION_PARTS["summary"])
+    sections = [section for section in SECTIONS if section in selected]
+    if sections:
+        lines.append('  "sections": {\n' + ",\n".join(VISION_PARTS[s] for s in sections) + "\n  }")
+    if "key_changes" in selected:
+        lines.append(VISION_PARTS["key_changes"])
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
+def vision_max_tokens(fields: Fields = None) -> int:
+    if fields is None:
+        return 4000
+    return min(4000, MAX_TOKENS_BASE + sum(
+        MAX_TOKENS_PER_PART.get(part, MAX_TOKENS_PER_SECTION) for part in fields
+    ))
+
 
-async def generate_future_vision(concept: str, language: str = "en") -> dict:
+async def generate_future_vision(concept: str, language: str = "en", fields: Fields = None) -> dict:
     """
     Call LLM to generate a vision of what a concept will look like in 10 years.
     
     Args:
         concept: The product/website/concept to visualize
         language: Target language for the response
+        fields: The parts to generate (response_fields); None for all of them
         
     Returns:
         dict with title, summary, sections (technology, experience, society, wildcard)
     """
     
-    language_prompts = {
-        "en": "Respond in English.",
-        "zh": "用中文回答。",
-        "ja": "日本語で回答してください。",
-        "de": "Antworte auf Deutsch.",
-        "fr": "Répondez en français.",
-        "ko": "한국어로 답변해 주세요.",
-        "es": "Responde en español.",
-    }
+    lang_instruction = LANGUAGE_PROMPTS.get(language, LANGUAGE_PROMPTS["en"])
     
-    lang_instruction = language_prompts.get(language, language_prompts["en"])
-    
-    system_prompt = f"""You are a futurist and technology analyst with deep expertise in predicting technological evolution.
-Your task is to envision what a given product, website, or concept will look like in 10 years (around 2035-2036).
-
-Be creative, imaginative, and grounded in current technological trends. Consider:
-- AI integration and automation
-- Hardware miniaturization and new form factors
-- Social and cultural shifts
-- Environmental and sustainability factors
-- Economic and business model evolution
+    system_prompt = f"""{FUTURIST_BRIEF}
 
 {lang_instruction}
 
 Respond in valid JSON format with this structure:
+{vision_structure(fields)}"""
+
+    user_prompt = f"Imagine what '{concept}' will look like in 10 years. Provide a detailed, creative, and insightful vision of its future evolution."
+
+    content = await chat_completion(system_prompt, user_prompt, max_tokens=vision_max_tokens(fields))
+    return await offload(parse_vision, content, concept, size=len(content))
+
+
+async def generate_lite_visions(concepts: list[str], language: str = "en") -> list[dict]:
+    """
+    Generate short visions for several concepts in a single LLM call.
+    
+    The lite schema drops the long sections, so a handful of concepts fit in
+    one completion.
+    
+    Returns:
+        list of dicts with title, year, summary, key_changes, in the order of `concepts`
+    """
+    lang_instruction = LANGUAGE_PROMPTS.get(language, LANGUAGE_PROMPTS["en"])
+    
+    system_prompt = f"""{FUTURIST_BRIEF}
+
+{lang_instruction}
+
+You will receive a numbered list of concepts. Respond in valid JSON: an array with
+exactly one object per concept, in the same order, each with this structure:
 {{
   "title": "A catchy headline about the future of [concept]",
   "year": 2036,
   "summary": "A 2-3 sentence overview of the transformation",
-  "sections": {{
-    "technology": {{
-      "title": "Technology Evolution",
-      "content": "3-4 paragraphs about technical changes"
-    }},
-    "experience": {{
-      "title": "User Experience",
-      "content": "3-4 paragraphs about how people will interact with it"
-    }},
-    "society": {{
-      "title": "Social Impact",
-      "content": "3-4 paragraphs about societal implications"
-    }},
-    "wildcard": {{
-      "title": "The Unexpected",
-      "content": "1-2 paragraphs with a surprising or unconventional prediction"
-    }}
-  }},
-  "key_changes": ["change 1", "change 2", "change 3", "change 4", "change 5"]
+  "key_changes": ["change 1", "change 2", "change 3"]
 }}"""
 
-    user_prompt = f"Imagine what '{concept}' will look like in 10 years. Provide a detailed, creative, and insightful vision of its future evolution."
+    numbered = "\n".join(f"{i + 1}. {concept}" for i, concept in enumerate(concepts))
+    user_prompt = f"Imagine what each of these will look like in 10 years:\n{numbered}"
+    
+    content = await chat_completion(system_prompt, user_prompt, max_tokens=400 * len(concepts) + 200)
+    results = await offload(extract_json, content, size=len(content))
+    if not isinstance(results, list) or len(results) != len(concepts):
+        raise Exception("LLM returned a malformed batch")
+    
+    return [
+        {
+            "title": result.get("title", f"The Future of {concept}"),
+            "year": result.get("year", 2036),
+            "summary": result.get("summary", ""),
+            "key_changes": result.get("key_changes", []),
+        }
+        for concept, result in zip(concepts, results)
+    ]
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(
-            f"{settings.llm_proxy_url}/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.llm_proxy_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "gemini-2.5-flash",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "max_tokens": 4000,
-                "temperature": 0.8,
-            },
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"LLM API error: {response.status_code} - {response.text}")
-        
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON from response
-        import json
-        # Handle potential markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        try:
-            result = json.loads(content.strip())
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
-            result = {
-                "title": f"The Future of {concept}",
-                "year": 2036,
-                "summary": content[:500],
-                "sections": {
-                    "technology": {"title": "Technology", "content": content},
-                    "experience": {"title": "Experience", "content": ""},
-                    "society": {"title": "Society", "content": ""},
-                    "wildcard": {"title": "Wildcard", "content": ""},
-                },
-                "key_changes": [],
-            }
-        
-        return result
+
+async def translate_vision(vision: dict, language: str) -> dict:
+    """
+    Translate an existing vision instead of generating a new one.
+    
+    Keeps the title/summary/sections/key_changes structure. Runs cooler and
+    with a budget sized to the source rather than the full 4000 tokens.
+    
+    Returns:
+        dict with the same structure as `vision`, in `language`
+    """
+    source = json.dumps(vision, ensure_ascii=False)
+    system_prompt = f"""You are a professional translator.
+Translate every string value of the JSON document you receive into {LANGUAGE_NAMES.get(language, "English")}.
+Keep the JSON structure, keys, numbers and the order of list items exactly as they are.
+Respond with the translated JSON only."""
+    
+    # Roughly one token per three characters of source, with headroom for scripts that tokenize longer
+    max_tokens = min(4000, len(source) // 3 + 500)
+    content = await chat_completion(system_prompt, source, max_tokens=max_tokens, temperature=0.2)
+    result = await offload(extract_json, content, size=len(content))
+    
+    if not isinstance(result, dict) or set(result.get("sections", {})) != set(vision.get("sections", {})):
+        raise Exception("Translation changed the vision structure")
+    return result
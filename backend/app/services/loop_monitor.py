@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from contextlib import suppress
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.metrics import (
+    db_statements_in_flight,
+    event_loop_lag,
+    event_loop_tasks,
+    slow_callbacks,
+    TOOL_NAME,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Samples event loop health while the app runs (opt-in, LOOP_MONITOR_ENABLED).
+
+    A sampler task measures how late its own wakeups are (loop lag) and
+    refreshes the task and database statement gauges; HTTP clients count
+    their own requests in flight. A watchdog thread checks the sampler's
+    heartbeat; when the loop has been stuck for longer than
+    `slow_threshold`, it logs the stack of whatever is running on the loop
+    thread.
+    """
+
+    def __init__(self, engine: AsyncEngine, interval: float = 0.5, slow_threshold: float = 0.25):
+        self.engine = engine
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        # Execution contexts of statements between their cursor events
+        self._statements: weakref.WeakSet = weakref.WeakSet()
+        self._heartbeat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    # A statement waits for, then runs on, its aiosqlite connection thread
+    # between these events; contexts of statements that failed are dropped
+    def _statement_started(self, conn, cursor, statement, parameters, context, executemany):
+        self._statements.add(context)
+
+    def _statement_finished(self, conn, cursor, statement, parameters, context, executemany):
+        self._statements.discard(context)
+
+    def _statement_failed(self, exception_context):
+        if exception_context.execution_context is not None:
+            self._statements.discard(exception_context.execution_context)
+
+    def database_statements(self) -> int:
+        """Statements in flight on this engine."""
+        return len(self._statements)
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        for name, listener in self._listeners():
+            event.listen(self.engine.sync_engine, name, listener)
+        self._sampler = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._sampler:
+            self._sampler.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._sampler
+        for name, listener in self._listeners():
+            event.remove(self.engine.sync_engine, name, listener)
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+
+    def _listeners(self):
+        return (
+            ("before_cursor_execute", self._statement_started),
+            ("after_cursor_execute", self._statement_finished),
+            ("handle_error", self._statement_failed),
+        )
+
+    def sample(self):
+        """Refresh the gauges that aren't timing-based."""
+        event_loop_tasks.labels(tool=TOOL_NAME).set(len(asyncio.all_tasks()))
+        db_statements_in_flight.labels(tool=TOOL_NAME).set(self.database_statements())
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            event_loop_lag.labels(tool=TOOL_NAME).observe(max(0.0, now - expected))
+            self.sample()
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.slow_threshold or heartbeat == reported:
+                continue
+            # One report per stall, with the stack as it is now
+            reported = heartbeat
+            slow_callbacks.labels(tool=TOOL_NAME).inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)"
+            logger.warning("Event loop blocked for %.3f s so far in:\n%s", stalled, stack)
@@ -0,0 +1,188 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import get_settings
+from app.models.payment import PaymentTransaction
+from app.models.token import GenerationToken
+from app.services.creem_client import get_creem_client
+from app.services.kv_store import get_kv_store
+from app.services.ledger_service import take_snapshots
+from app.services.reconciliation import reconcile_pending_payments
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per statement, so a prune never holds the write lock for long
+CHUNK_SIZE = 5000
+
+
+async def prune_idle_token_records(db: AsyncSession, retention_days: int) -> int:
+    """
+    Delete token records that were never used and have nothing on them.
+
+    Only rows that never used the free trial and never bought tokens are
+    removed; deleting a row with a used trial would hand that device a new one.
+
+    Returns:
+        Number of rows removed
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    idle = (
+        select(GenerationToken.id)
+        .where(
+            GenerationToken.tokens_remaining == 0,
+            GenerationToken.tokens_purchased == 0,
+            GenerationToken.free_trial_used.is_(False),
+            GenerationToken.updated_at < cutoff,
+        )
+        .limit(CHUNK_SIZE)
+    )
+
+    removed = 0
+    while True:
+        result = await db.execute(delete(GenerationToken).where(GenerationToken.id.in_(idle)))
+        await db.commit()
+        removed += result.rowcount
+        if result.rowcount < CHUNK_SIZE:
+            return removed
+
+
+def _payment_record(transaction: PaymentTransaction) -> dict:
+    record = {}
+    for column in PaymentTransaction.__table__.columns:
+        value = getattr(transaction, column.name)
+        record[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+async def archive_completed_payments(db: AsyncSession, archive_path: str, older_than_days: int) -> int:
+    """
+    Move completed payment transactions into an append-only gzip NDJSON archive.
+
+    Each run appends one gzip member, so the file stays readable with a plain
+    `gzip.open`. Rows are written and synced before they are deleted; a crash in
+    between can leave a duplicate line in the archive but never loses a row.
+
+    Returns:
+        Number of rows archived
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    stmt = (
+        select(PaymentTransaction)
+        .where(
+            PaymentTransaction.status == "completed",
+            PaymentTransaction.completed_at < cutoff,
+        )
+        .order_by(PaymentTransaction.id)
+        .limit(CHUNK_SIZE)
+    )
+
+    directory = os.path.dirname(archive_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    archived = 0
+    while True:
+        transactions = (await db.execute(stmt)).scalars().all()
+        if not transactions:
+            return archived
+
+        with open(archive_path, "ab") as raw, gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            for transaction in transactions:
+                archive.write(json.dumps(_payment_record(transaction)).encode() + b"\n")
+            archive.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        await db.execute(
+            delete(PaymentTransaction).where(
+                PaymentTransaction.id.in_([transaction.id for transaction in transactions])
+            )
+        )
+        await db.commit()
+        archived += len(transactions)
+
+
+async def _database_size(conn) -> int:
+    page_count = (await conn.exec_driver_sql("PRAGMA page_count")).scalar()
+    page_size = (await conn.exec_driver_sql("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+async def compact_database(engine: AsyncEngine, full: bool = False) -> int:
+    """
+    Reclaim free pages and refresh planner statistics (SQLite only).
+
+    Databases created with auto_vacuum=INCREMENTAL are compacted in place.
+    Older files need `full=True` once, which switches them to incremental
+    mode with a full VACUUM.
+
+    Returns:
+        Bytes reclaimed
+    """
+    if engine.dialect.name != "sqlite":
+        return 0
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        size_before = await _database_size(conn)
+
+        if full:
+            await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.exec_driver_sql("VACUUM")
+        elif (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar() == 2:
+            await conn.exec_driver_sql("PRAGMA incremental_vacuum")
+
+        await conn.execute(text("ANALYZE"))
+        return max(0, size_before - await _database_size(conn))
+
+
+async def run_maintenance(db: AsyncSession, full_vacuum: bool = False) -> dict:
+    """Run every maintenance step and report what it did."""
+    settings = get_settings()
+    started = time.perf_counter()
+
+    tokens_pruned = await prune_idle_token_records(db, settings.token_retention_days)
+    payments_reconciled = None
+    if settings.creem_api_key:
+        payments_reconciled = await reconcile_pending_payments(
+            db, get_creem_client(), settings.payment_reconcile_after_minutes,
+            settings.payment_pending_expire_hours,
+        )
+    payments_archived = await archive_completed_payments(
+        db, settings.payment_archive_path, settings.payment_archive_days
+    )
+    ledger_entries_snapshotted = await take_snapshots(db)
+    bytes_reclaimed = await compact_database(db.bind, full=full_vacuum)
+
+    report = {
+        "tokens_pruned": tokens_pruned,
+        "payments_reconciled": payments_reconciled,
+        "payments_archived": payments_archived,
+        "ledger_entries_snapshotted": ledger_entries_snapshotted,
+        "bytes_reclaimed": bytes_reclaimed,
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info("Maintenance run: %s", report)
+    return report
+
+
+async def maintenance_loop(session_factory, interval_hours: float):
+    """Background task running maintenance every `interval_hours`, in one worker only."""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        # The lock outlives the run, so only the first worker to wake up does the work
+        if not await get_kv_store().add("lock:maintenance", b"1", ttl=interval_hours * 1800):
+            continue
+        try:
+            async with session_factory() as db:
+                await run_maintenance(db)
+        except Exception:
+            logger.exception("Maintenance run failed")
@@ -0,0 +1,80 @@
+"""
+CPU-bound work (parsing, repairing and validating completions) kept off the event loop.
+
+Typical completions parse in well under a millisecond, less than an executor
+hop costs, so they run inline. Payloads over `cpu_offload_min_bytes` go to a
+thread pool, or to a process pool when the GIL is the limit (functions sent
+there must be module-level so they can be pickled).
+"""
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Callable, Optional, TypeVar
+
+from app.config import get_settings
+from app.metrics import cpu_offloaded, TOOL_NAME
+
+T = TypeVar("T")
+
+EXECUTORS = ("thread", "process", "none")
+
+_executor: Optional[Executor] = None
+
+
+def get_executor() -> Optional[Executor]:
+    """The per-process CPU executor, created on first use; None when offloading is off."""
+    global _executor
+    settings = get_settings()
+    if _executor is None and settings.cpu_offload_executor != "none":
+        if settings.cpu_offload_executor not in EXECUTORS:
+            raise ValueError(f"CPU_OFFLOAD_EXECUTOR must be one of {', '.join(EXECUTORS)}")
+        if settings.cpu_offload_executor == "process":
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Not fork: the worker already has the event loop and aiosqlite threads running
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.cpu_offload_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.cpu_offload_workers,
+                thread_name_prefix="cpu-offload",
+            )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def text_size(value) -> int:
+    """Characters of text in a parsed JSON value, a cheap stand-in for its serialized size."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(map(text_size, value.values()))
+    if isinstance(value, list):
+        return sum(map(text_size, value))
+    return 0
+
+
+async def offload(fn: Callable[..., T], *args, size: int) -> T:
+    """
+    Run `fn(*args)` on the CPU executor if `size` (bytes, or an estimate) is
+    large enough to be worth the hop, otherwise right here on the event loop.
+    """
+    settings = get_settings()
+    if size < settings.cpu_offload_min_bytes:
+        return fn(*args)
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    cpu_offloaded.labels(tool=TOOL_NAME, executor=settings.cpu_offload_executor).inc()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
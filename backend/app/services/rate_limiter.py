@@ -0,0 +1,119 @@
+import json
+import math
+import struct
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import get_settings
+from app.services.kv_store import get_kv_store
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Token bucket parameters: `burst` tokens, refilled at `rate` per second."""
+    rate: float
+    burst: int
+
+
+def parse_limit(spec: str) -> Limit:
+    """Parse a limit like "10/minute" into a Limit."""
+    count, _, period = spec.partition("/")
+    seconds = PERIODS.get(period.strip().rstrip("s") or "second")
+    if seconds is None or int(count) <= 0:
+        raise ValueError(f"Invalid rate limit: {spec}")
+    return Limit(rate=int(count) / seconds, burst=int(count))
+
+
+def parse_route_limits(raw: str) -> dict[str, dict[str, Limit]]:
+    """
+    Parse the per-route limits JSON from settings.
+
+    Format: {"/api/v1/visualize": {"device": "10/minute", "ip": "30/minute"}}
+    """
+    try:
+        routes = json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    return {
+        path: {scope: parse_limit(spec) for scope, spec in scopes.items()}
+        for path, scopes in routes.items()
+    }
+
+
+def _take(state: Optional[tuple[float, float]], limit: Limit, now: float) -> tuple[tuple[float, float], float]:
+    """
+    Refill a bucket and try to take one token from it.
+
+    Returns:
+        tuple of (new_state, retry_after); retry_after is 0 when allowed
+    """
+    tokens, updated = state if state else (float(limit.burst), now)
+    tokens = min(float(limit.burst), tokens + max(0.0, now - updated) * limit.rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / limit.rate
+
+
+class BucketStore:
+    """Token buckets kept in the shared key-value store."""
+
+    def __init__(self, kv):
+        self.kv = kv
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take one token from the bucket. Returns seconds to wait, 0 if allowed."""
+        def updater(raw: Optional[bytes]):
+            state = struct.unpack("<dd", raw) if raw else None
+            # Wall clock, since monotonic clocks aren't comparable across workers
+            new_state, retry_after = _take(state, limit, time.time())
+            return struct.pack("<dd", *new_state), retry_after
+
+        # A bucket untouched for a full refill is the same as a missing one
+        return await self.kv.update(f"ratelimit:{key}", updater, ttl=limit.burst / limit.rate)
+
+
+class RateLimiter:
+    """Applies the configured per-route limits to device ids and client IPs."""
+
+    def __init__(self, store, routes: dict[str, dict[str, Limit]]):
+        self.store = store
+        self.routes = routes
+
+    async def check(self, path: str, identities: dict[str, Optional[str]]) -> tuple[Optional[str], float]:
+        """
+        Take a token from every bucket that applies to the request.
+
+        Args:
+            path: Request path, matched exactly against the configured routes
+            identities: scope name ("device", "ip") to identity value
+
+        Returns:
+            tuple of (limited_scope, retry_after); limited_scope is None when allowed
+        """
+        for scope, limit in self.routes.get(path, {}).items():
+            identity = identities.get(scope)
+            if not identity:
+                continue
+            retry_after = await self.store.take(f"{scope}:{path}:{identity}", limit)
+            if retry_after > 0:
+                return scope, retry_after
+        return None, 0.0
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Build the rate limiter from settings on first use."""
+    global _limiter
+    if _limiter is None:
+        settings = get_settings()
+        _limiter = RateLimiter(BucketStore(get_kv_store()), parse_route_limits(settings.rate_limit_routes))
+    return _limiter
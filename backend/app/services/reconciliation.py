@@ -0,0 +1,130 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.metrics import payment_success, payment_revenue, TOOL_NAME
+from app.models.payment import PaymentTransaction
+from app.services.creem_client import CreemClient
+from app.services.ledger_service import entry, record_entries
+from app.services.token_service import add_tokens_bulk
+
+logger = logging.getLogger(__name__)
+
+# Checkouts looked up per page
+PAGE_SIZE = 100
+
+# Creem checkout statuses that settle a pending transaction; anything else stays pending
+SETTLED_STATUSES = {"completed": "completed", "expired": "expired"}
+
+
+async def settle_pending(db: AsyncSession, ids: list[int], status: str) -> list:
+    """
+    Move still-pending transactions to `status` in one statement and return the ones that moved.
+
+    The webhook and reconciliation both settle through here, so whichever
+    gets to a transaction second finds nothing to move and grants nothing.
+    """
+    if not ids:
+        return []
+    stmt = (
+        update(PaymentTransaction)
+        .where(PaymentTransaction.id.in_(ids), PaymentTransaction.status == "pending")
+        .values(
+            status=status,
+            completed_at=datetime.utcnow() if status == "completed" else None,
+        )
+        .returning(
+            PaymentTransaction.checkout_id,
+            PaymentTransaction.device_id,
+            PaymentTransaction.product_sku,
+            PaymentTransaction.amount_cents,
+            PaymentTransaction.tokens_granted,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).all()
+
+
+async def reconcile_pending_payments(
+    db: AsyncSession,
+    client: CreemClient,
+    older_than_minutes: int,
+    expire_after_hours: int,
+) -> dict:
+    """
+    Settle pending checkouts whose webhook never arrived.
+
+    Pages through pending transactions older than the threshold on the
+    (status, created_at) index, looks each page up in Creem concurrently,
+    then applies the page's status changes and token grants in one commit.
+    The conditional update never settles a transaction twice, so a webhook
+    arriving mid-run can't double-grant. Checkouts older than
+    `expire_after_hours` that Creem still reports as unsettled, or answers
+    404 for, are settled as expired, so abandoned carts aren't looked up
+    forever. A failed lookup never settles anything.
+
+    Returns:
+        dict of checked, completed, expired and unchanged counts
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=older_than_minutes)
+    expire_cutoff = now - timedelta(hours=expire_after_hours)
+    stmt = (
+        select(PaymentTransaction.id, PaymentTransaction.checkout_id, PaymentTransaction.created_at)
+        .where(
+            PaymentTransaction.status == "pending",
+            PaymentTransaction.created_at < cutoff,
+        )
+        .order_by(PaymentTransaction.created_at, PaymentTransaction.id)
+        .limit(PAGE_SIZE)
+    )
+
+    report = {"checked": 0, "completed": 0, "expired": 0, "unchanged": 0}
+    last = None
+    while True:
+        page = stmt if last is None else stmt.where(
+            tuple_(PaymentTransaction.created_at, PaymentTransaction.id) > tuple_(*last)
+        )
+        rows = (await db.execute(page)).all()
+        if not rows:
+            break
+        last = (rows[-1].created_at, rows[-1].id)
+
+        statuses = await client.get_checkout_statuses([row.checkout_id for row in rows])
+        settled = defaultdict(list)
+        for row in rows:
+            if row.checkout_id not in statuses:
+                # The lookup failed: say nothing about the checkout until Creem answers
+                settled[None].append(row.id)
+                continue
+            status = SETTLED_STATUSES.get(statuses[row.checkout_id])
+            if status is None and row.created_at < expire_cutoff:
+                status = "expired"
+            settled[status].append(row.id)
+
+        completed = await settle_pending(db, settled["completed"], "completed")
+        expired = await settle_pending(db, settled["expired"], "expired")
+
+        grants = defaultdict(int)
+        for transaction in completed:
+            grants[transaction.device_id] += transaction.tokens_granted
+        await record_entries(db, [
+            entry(transaction.device_id, "grant", transaction.tokens_granted, batch_id=transaction.checkout_id)
+            for transaction in completed
+        ])
+        await add_tokens_bulk(db, grants)
+
+        for transaction in completed:
+            payment_success.labels(tool=TOOL_NAME, product_sku=transaction.product_sku).inc()
+            payment_revenue.labels(tool=TOOL_NAME).inc(transaction.amount_cents)
+
+        report["checked"] += len(rows)
+        report["completed"] += len(completed)
+        report["expired"] += len(expired)
+        report["unchanged"] += len(rows) - len(completed) - len(expired)
+
+    logger.info("Payment reconciliation: %s", report)
+    return report
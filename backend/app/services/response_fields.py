@@ -0,0 +1,83 @@
+"""
+Response shaping: which parts of a vision a request asks for.
+
+A request's `fields` name the parts it will use; title and year are always
+included. The selection is threaded through the prompt (so the model
+doesn't write what would be dropped), validation, caching and
+serialization, and it decides the token cost tier.
+"""
+import json
+from functools import lru_cache
+from typing import Iterable, Literal, Optional
+
+from app.config import get_settings
+
+SECTIONS = ("technology", "experience", "society", "wildcard")
+PARTS = ("summary", "key_changes") + SECTIONS
+
+# What a request may list: a part, "sections" for all four, or "sections.<name>"
+FieldName = Literal[
+    "summary",
+    "key_changes",
+    "sections",
+    "sections.technology",
+    "sections.experience",
+    "sections.society",
+    "sections.wildcard",
+]
+
+# A canonical selection: sorted part names, or None for the full vision
+Fields = Optional[tuple[str, ...]]
+
+TIERS = ("brief", "sections", "full")
+
+
+def normalize_fields(fields: Optional[Iterable[str]]) -> Fields:
+    """Canonical form of a request's `fields`; asking for everything is None."""
+    if fields is None:
+        return None
+    parts = set()
+    for field in fields:
+        if field == "sections":
+            parts.update(SECTIONS)
+        else:
+            parts.add(field.removeprefix("sections."))
+    if parts >= set(PARTS):
+        return None
+    return tuple(part for part in PARTS if part in parts)
+
+
+def shape(vision: dict, fields: Fields) -> dict:
+    """Drop the parts of a vision that weren't asked for."""
+    if fields is None:
+        return vision
+    shaped = {key: vision[key] for key in ("title", "year") if key in vision}
+    for key in ("summary", "key_changes"):
+        if key in fields and key in vision:
+            shaped[key] = vision[key]
+    sections = [section for section in SECTIONS if section in fields]
+    if sections:
+        available = vision.get("sections") or {}
+        shaped["sections"] = {section: available[section] for section in sections if section in available}
+    return shaped
+
+
+def tier(fields: Fields) -> str:
+    """brief (no sections), sections (some of them) or full."""
+    if fields is None:
+        return "full"
+    count = sum(section in fields for section in SECTIONS)
+    if count == 0:
+        return "brief"
+    return "full" if count == len(SECTIONS) else "sections"
+
+
+@lru_cache()
+def _tier_costs(raw: str) -> dict[str, int]:
+    costs = json.loads(raw)
+    return {name: int(costs.get(name, 1)) for name in TIERS}
+
+
+def generation_cost(fields: Fields) -> int:
+    """Tokens a generation with these fields costs (GENERATION_TIER_COSTS)."""
+    return _tier_costs(get_settings().generation_tier_costs)[tier(fields)]
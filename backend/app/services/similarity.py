@@ -0,0 +1,174 @@
+import hashlib
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import get_settings
+
+# MinHash signature length = BANDS * ROWS. Eight bands of four rows make
+# pairs above ~0.7 Jaccard near-certain candidates while keeping unrelated
+# concepts out of each other's buckets.
+BANDS = 8
+ROWS = 4
+NGRAM = 3
+
+# Entries per bucket. A crowded bucket means its band is shared by many
+# unrelated concepts; entries beyond this stay reachable through their other
+# bands, and lookups never verify more than BANDS * MAX_BUCKET candidates.
+MAX_BUCKET = 32
+
+# One 64-byte blake2b digest per trigram gives all 32 16-bit hash functions
+# at once; the signature is then a column-wise min, done in C.
+_SIGNATURE = struct.Struct(f"<{BANDS * ROWS}H")
+
+# Words that don't change which concept is meant ("TikTok app", "the future of TikTok")
+_FILLER_PHRASES = re.compile(
+    r"\b(?:in\s+(?:\d+|ten|a\s+decade)\s+years?|in\s+\d{4}|(?:the\s+)?future\s+of)\b"
+)
+_FILLER_WORDS = {"the", "a", "an", "app", "apps", "application", "website", "site", "platform", "service"}
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def canonical_concept(concept: str) -> str:
+    """Reduce a concept to the characters that identify it: "TikTok in 10 years" -> "tiktok"."""
+    text = _FILLER_PHRASES.sub(" ", concept.casefold())
+    words = [word for word in _NON_WORD.split(text) if word and word not in _FILLER_WORDS]
+    # Joined without spaces so "tik tok" and "tiktok" shingle the same way
+    return "".join(words) or _NON_WORD.sub("", concept.casefold())
+
+
+def trigrams(canonical: str) -> set[bytes]:
+    padded = f"^{canonical}$".encode()
+    return {padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1))}
+
+
+def shingles(grams: set[bytes]) -> int:
+    """Trigram set as a 4096-bit bitset, so Jaccard is two ANDs/ORs and popcounts."""
+    bits = 0
+    for gram in grams:
+        bits |= 1 << (zlib.crc32(gram) & 4095)
+    return bits
+
+
+def minhash(grams: set[bytes]) -> tuple[int, ...]:
+    rows = [_SIGNATURE.unpack(hashlib.blake2b(gram, digest_size=64).digest()) for gram in grams]
+    return tuple(map(min, zip(*rows)))
+
+
+def jaccard(a: int, b: int) -> float:
+    return (a & b).bit_count() / (a | b).bit_count()
+
+
+class ConceptIndex:
+    """
+    Locality-sensitive index of generated concepts, one per language.
+
+    Lookups hash the query into BANDS buckets and verify the few candidates
+    found there with exact Jaccard similarity on character trigrams, so cost
+    doesn't grow with the number of stored concepts. Past `max_entries`, the
+    concept stored (or re-stored) longest ago is evicted; its vision has
+    usually left the cache by then.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._next = 0
+        # entry id -> (concept, language, canonical, shingles, band keys), oldest first
+        self._entries: OrderedDict[int, tuple[str, str, str, int, list]] = OrderedDict()
+        self._canonical: dict[tuple[str, str], int] = {}
+        self._buckets: dict[tuple[str, int, tuple[int, ...]], list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, concept: str, language: str):
+        canonical = canonical_concept(concept)
+        existing = self._canonical.get((language, canonical))
+        if existing is not None:
+            self._entries.move_to_end(existing)  # Stored again, so cached again
+            return
+        while self._entries and len(self) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+        if self.max_entries <= 0:
+            return
+
+        entry = self._next
+        self._next += 1
+        grams = trigrams(canonical)
+        signature = minhash(grams)
+        keys = [(language, band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+        self._entries[entry] = (concept, language, canonical, shingles(grams), keys)
+        self._canonical[(language, canonical)] = entry
+        for key in keys:
+            bucket = self._buckets.setdefault(key, [])
+            if len(bucket) < MAX_BUCKET:
+                bucket.append(entry)
+
+    def discard(self, concept: str, language: str):
+        """Forget a concept, e.g. once its cached vision is gone."""
+        entry = self._canonical.get((language, canonical_concept(concept)))
+        if entry is not None:
+            self._remove(entry)
+
+    def _remove(self, entry: int):
+        _, language, canonical, _, keys = self._entries.pop(entry)
+        del self._canonical[(language, canonical)]
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket and entry in bucket:
+                bucket.remove(entry)
+                if not bucket:
+                    del self._buckets[key]
+
+    def matches(self, concept: str, language: str, threshold: float) -> list[tuple[str, float]]:
+        """
+        Stored concepts in the same language at least `threshold` similar, best first.
+
+        Returns:
+            list of (stored_concept, similarity)
+        """
+        canonical = canonical_concept(concept)
+        exact = self._canonical.get((language, canonical))
+        if exact is not None:
+            return [(self._entries[exact][0], 1.0)]
+
+        grams = trigrams(canonical)
+        hashes = shingles(grams)
+        signature = minhash(grams)
+        candidates = set()
+        for band in range(BANDS):
+            key = (language, band, tuple(signature[band * ROWS:(band + 1) * ROWS]))
+            candidates.update(self._buckets.get(key, ()))
+
+        found = []
+        for entry in candidates:
+            stored, _, _, stored_shingles, _ = self._entries[entry]
+            score = jaccard(hashes, stored_shingles)
+            if score >= threshold:
+                found.append((stored, score))
+        return sorted(found, key=lambda match: match[1], reverse=True)
+
+    def lookup(self, concept: str, language: str, threshold: float) -> Optional[tuple[str, float]]:
+        """
+        Find the most similar stored concept in the same language.
+
+        Returns:
+            tuple of (stored_concept, similarity), or None below `threshold`
+        """
+        found = self.matches(concept, language, threshold)
+        return found[0] if found else None
+
+    def clear(self):
+        self.__init__(self.max_entries)
+
+
+_index: Optional[ConceptIndex] = None
+
+
+def get_concept_index() -> ConceptIndex:
+    global _index
+    if _index is None:
+        _index = ConceptIndex(get_settings().similar_concept_max_entries)
+    return _index
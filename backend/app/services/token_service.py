@@ -1,26 +1,49 @@
-from sqlalchemy import select
+"""
+Token balances.
+
+Every function that changes a balance records the change in the token
+ledger (app.services.ledger_service) in the same transaction; balance
+reads stay a single row lookup.
+"""
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.token import GenerationToken
+from app.models.token import GenerationToken, device_key
+from app.services.ledger_service import entry, record_entries
 
 
 async def get_or_create_token_record(db: AsyncSession, device_id: str) -> GenerationToken:
-    """Get existing token record or create new one for device."""
-    stmt = select(GenerationToken).where(GenerationToken.device_id == device_id)
+    """
+    Get existing token record or create new one for device.
+    
+    Concurrent first requests from one device race to insert; the unique
+    device key turns every insert after the first into a no-op, and all of
+    them read back the same row.
+    """
+    key = device_key(device_id)
+    stmt = select(GenerationToken).where(GenerationToken.device_key == key)
     result = await db.execute(stmt)
     token = result.scalar_one_or_none()
     
     if not token:
-        token = GenerationToken(device_id=device_id, tokens_remaining=0)
-        db.add(token)
+        await db.execute(
+            insert(GenerationToken)
+            .values(device_key=key, device_id=device_id, tokens_remaining=0)
+            .on_conflict_do_nothing(index_elements=[GenerationToken.device_key])
+        )
         await db.commit()
-        await db.refresh(token)
+        token = (await db.execute(stmt)).scalar_one()
     
     return token
 
 
-async def can_use_generation(db: AsyncSession, device_id: str) -> tuple[bool, bool, int]:
+async def can_use_generation(db: AsyncSession, device_id: str, cost: int = 1) -> tuple[bool, bool, int]:
     """
-    Check if device can use a generation.
+    Check if device can use a generation costing `cost` tokens.
+    
+    The free trial covers one generation of any cost.
     
     Returns:
         tuple of (can_use, is_free_trial, remaining_tokens)
@@ -32,48 +55,166 @@ async def can_use_generation(db: AsyncSession, device_id: str) -> tuple[bool, bo
         return True, True, token.tokens_remaining
     
     # Check if has paid tokens
-    if token.tokens_remaining > 0:
+    if token.tokens_remaining >= cost:
         return True, False, token.tokens_remaining
     
     return False, False, 0
 
 
-async def use_generation(db: AsyncSession, device_id: str) -> tuple[bool, int]:
+async def use_generation(db: AsyncSession, device_id: str, cost: int = 1) -> tuple[bool, bool, int]:
+    """
+    Consume the free trial, or `cost` generation tokens.
+    
+    A single conditional write, like reserve_generations, so concurrent
+    requests from one device can't spend the same tokens. Whether the free
+    trial was used is decided by that write, not by an earlier
+    can_use_generation read.
+    
+    Returns:
+        tuple of (success, used_free_trial, remaining_tokens)
+    """
+    success, used_free_trial, remaining = await reserve_generations(db, device_id, 1, [cost])
+    if not success:
+        return False, False, 0
+    return True, used_free_trial, remaining
+
+
+async def reserve_generations(
+    db: AsyncSession, device_id: str, count: int, costs: Optional[list[int]] = None
+) -> tuple[bool, bool, int]:
     """
-    Consume one generation token.
+    Reserve several generations in a single write: the free trial first, then paid tokens.
+    
+    `costs` are the token costs of the generations, one each by default; the
+    free trial covers the first. The reservation is all or nothing, and the
+    conditional UPDATE keeps two concurrent reservations from spending the
+    same tokens.
     
     Returns:
-        tuple of (success, remaining_tokens)
+        tuple of (success, used_free_trial, remaining_tokens)
     """
     token = await get_or_create_token_record(db, device_id)
+    use_trial = not token.free_trial_used
+    costs = costs or [1] * count
+    paid = sum(costs[1:]) if use_trial else sum(costs)
     
-    # Use free trial first
-    if not token.free_trial_used:
-        token.free_trial_used = True
+    stmt = (
+        update(GenerationToken)
+        .where(
+            GenerationToken.id == token.id,
+            GenerationToken.free_trial_used == token.free_trial_used,
+            GenerationToken.tokens_remaining >= paid,
+        )
+        .values(
+            free_trial_used=True,
+            tokens_remaining=GenerationToken.tokens_remaining - paid,
+        )
+        .returning(GenerationToken.tokens_remaining)
+        .execution_options(synchronize_session="fetch")
+    )
+    remaining = (await db.execute(stmt)).scalar_one_or_none()
+    if remaining is None:
         await db.commit()
-        return True, token.tokens_remaining
+        return False, False, token.tokens_remaining
     
-    # Use paid tokens
-    if token.tokens_remaining > 0:
-        token.tokens_remaining -= 1
-        await db.commit()
-        return True, token.tokens_remaining
+    entries = [entry(device_id, "trial", 1)] if use_trial else []
+    if paid:
+        entries.append(entry(device_id, "consume", -paid))
+    await record_entries(db, entries)
+    await db.commit()
+    return True, use_trial, remaining
+
+
+async def refund_generations(db: AsyncSession, device_id: str, count: int, free_trial: bool = False) -> int:
+    """
+    Return reserved generations that were not delivered, in a single write.
     
-    return False, 0
+    Unlike add_tokens, refunds don't count as purchases. With `free_trial`,
+    one of the generations was the free trial, which becomes available again.
+    
+    Returns:
+        New total tokens
+    """
+    values = {"tokens_remaining": GenerationToken.tokens_remaining + count - free_trial}
+    if free_trial:
+        values["free_trial_used"] = False
+    stmt = (
+        update(GenerationToken)
+        .where(GenerationToken.device_key == device_key(device_id))
+        .values(**values)
+        .returning(GenerationToken.tokens_remaining)
+        .execution_options(synchronize_session="fetch")
+    )
+    remaining = (await db.execute(stmt)).scalar_one()
+    entries = [entry(device_id, "trial", -1)] if free_trial else []
+    if count - free_trial:
+        entries.append(entry(device_id, "refund", count - free_trial))
+    await record_entries(db, entries)
+    await db.commit()
+    return remaining
 
 
-async def add_tokens(db: AsyncSession, device_id: str, amount: int) -> int:
+async def add_tokens(db: AsyncSession, device_id: str, amount: int, checkout_id: Optional[str] = None) -> int:
     """
-    Add tokens to a device's account.
+    Add purchased tokens to a device's account.
+    
+    A single relative UPDATE, like refund_generations, so a purchase racing
+    a reservation can't overwrite the tokens it spent.
     
     Returns:
         New total tokens
     """
     token = await get_or_create_token_record(db, device_id)
-    token.tokens_remaining += amount
-    token.tokens_purchased += amount
+    stmt = (
+        update(GenerationToken)
+        .where(GenerationToken.id == token.id)
+        .values(
+            tokens_remaining=GenerationToken.tokens_remaining + amount,
+            tokens_purchased=GenerationToken.tokens_purchased + amount,
+        )
+        .returning(GenerationToken.tokens_remaining)
+        .execution_options(synchronize_session="fetch")
+    )
+    remaining = (await db.execute(stmt)).scalar_one()
+    await record_entries(db, [entry(device_id, "grant", amount, batch_id=checkout_id)])
+    await db.commit()
+    return remaining
+
+
+async def add_tokens_bulk(db: AsyncSession, amounts: dict[str, int], purchased: bool = True):
+    """
+    Add tokens to many devices in one statement, creating missing records.
+    
+    Commits the caller's pending changes with it, so status updates and the
+    grants they pay for land together; callers record the ledger entries
+    first. Without `purchased`, the tokens are a gift and don't count as
+    purchases.
+    """
+    if amounts:
+        # One cached statement run over a parameter list (batched into multi-row
+        # VALUES by the driver layer); compiling a literal multi-row VALUES per
+        # call costs more than the inserts themselves for large batches
+        table = GenerationToken.__table__
+        stmt = insert(table)
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.device_key],
+                set_={
+                    "tokens_remaining": table.c.tokens_remaining + stmt.excluded.tokens_remaining,
+                    "tokens_purchased": table.c.tokens_purchased + stmt.excluded.tokens_purchased,
+                },
+            ),
+            [
+                {
+                    "device_key": device_key(device_id),
+                    "device_id": device_id,
+                    "tokens_remaining": amount,
+                    "tokens_purchased": amount if purchased else 0,
+                }
+                for device_id, amount in amounts.items()
+            ],
+        )
     await db.commit()
-    return token.tokens_remaining
 
 
 async def get_token_status(db: AsyncSession, device_id: str) -> dict:
@@ -0,0 +1,141 @@
+"""
+Sanitized traffic capture for replay (TRAFFIC_CAPTURE_PATH, benchmarks/replay.py).
+
+Each request becomes one NDJSON line: start time, method, path, status,
+duration (until the last byte of the body, streamed or not), salted hashes
+of the device id and client IP, a coarse user agent class, and the parts of
+the body that shape the work done (concepts and languages, product SKUs,
+webhook event types). Concepts are hashed unless TRAFFIC_CAPTURE_CONCEPTS is
+set. Nothing else from the request is kept.
+"""
+import hashlib
+import os
+import secrets
+from typing import Optional
+
+import orjson
+
+from app.config import get_settings
+from app.services.vision_cache import normalize_concept
+
+# Bodies worth keeping, by path
+VISUALIZE_PATH = "/api/v1/visualize"
+BATCH_PATH = "/api/v1/visualize/batch"
+CHECKOUT_PATH = "/api/v1/checkout"
+WEBHOOK_PATH = "/api/v1/webhook"
+CAPTURED_BODIES = (VISUALIZE_PATH, BATCH_PATH, CHECKOUT_PATH, WEBHOOK_PATH)
+
+
+class TrafficRecorder:
+    """
+    Appends one line per request to the capture log.
+
+    Lines are written with a single O_APPEND write each, so workers can share
+    one file. Hashes are keyed with `salt`; workers need the same salt for a
+    device to hash the same everywhere (a random one is used if it's empty).
+    """
+
+    def __init__(self, path: str, salt: str = "", keep_concepts: bool = False):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._salt = (salt or secrets.token_hex(16)).encode()
+        self.keep_concepts = keep_concepts
+
+    def pseudonym(self, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        return hashlib.blake2b(value.encode(), digest_size=8, key=self._salt).hexdigest()
+
+    def concept(self, concept) -> Optional[str]:
+        if not isinstance(concept, str):
+            return None
+        if self.keep_concepts:
+            return concept
+        # Same concept (as the cache sees it), same label
+        return "concept-" + self.pseudonym(normalize_concept(concept))
+
+    def sanitize_body(self, path: str, body: bytes) -> Optional[dict]:
+        """The work-shaping parts of a request body, with identifiers hashed."""
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        if path == VISUALIZE_PATH:
+            return {"concept": self.concept(data.get("concept")), "language": data.get("language")}
+        if path == BATCH_PATH:
+            items = data.get("items") if isinstance(data.get("items"), list) else []
+            return {
+                "format": data.get("format"),
+                "items": [
+                    {"concept": self.concept(item.get("concept")), "language": item.get("language")}
+                    for item in items
+                    if isinstance(item, dict)
+                ],
+            }
+        if path == CHECKOUT_PATH:
+            return {"product_sku": data.get("product_sku"), "device": self.pseudonym(data.get("device_id"))}
+        if path == WEBHOOK_PATH:
+            checkout = data.get("data") if isinstance(data.get("data"), dict) else {}
+            metadata = checkout.get("metadata") if isinstance(checkout.get("metadata"), dict) else {}
+            return {
+                "type": data.get("type"),
+                "device": self.pseudonym(metadata.get("device_id")),
+                "tokens": metadata.get("tokens"),
+            }
+        return None
+
+    def record(
+        self,
+        started: float,
+        method: str,
+        path: str,
+        status: int,
+        duration: float,
+        device_id: Optional[str],
+        ip: Optional[str],
+        agent: str,
+        body: Optional[bytes] = None,
+    ):
+        entry = {
+            "t": round(started, 3),
+            "m": method,
+            "p": path,
+            "s": status,
+            "ms": round(duration * 1000, 1),
+            "dev": self.pseudonym(device_id),
+            "ip": self.pseudonym(ip),
+            "ua": agent,
+        }
+        if body:
+            entry["body"] = self.sanitize_body(path, body)
+        os.write(self._fd, orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+
+    def close(self):
+        os.close(self._fd)
+
+
+_recorder: Optional[TrafficRecorder] = None
+
+
+def get_traffic_recorder() -> Optional[TrafficRecorder]:
+    """The capture log, opened on first use; None unless TRAFFIC_CAPTURE_PATH is set."""
+    global _recorder
+    if _recorder is None:
+        settings = get_settings()
+        if settings.traffic_capture_path:
+            _recorder = TrafficRecorder(
+                settings.traffic_capture_path,
+                salt=settings.traffic_capture_salt,
+                keep_concepts=settings.traffic_capture_concepts,
+            )
+    return _recorder
+
+
+def close_traffic_recorder():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
@@ -0,0 +1,532 @@
+"""
+Long-term archive of generated visions, kept outside the database.
+
+Each worker appends the visions it generates to its own segment file; a
+segment is sealed, and gets a sorted index by (concept hash, language),
+when it reaches VISION_ARCHIVE_SEGMENT_MB or the worker stops. Records are
+compressed one at a time against a dictionary shared by the whole archive,
+since every vision repeats the same keys and section titles, so a lookup
+binary-searches the memory-mapped index and decompresses a single record.
+
+The first segments use a built-in dictionary (the vision skeleton); when
+the first segment is sealed, a dictionary is trained from its records and
+used for every segment after it. zstd is used when the zstandard package is
+installed, zlib with a preset dictionary otherwise.
+
+Files in VISION_ARCHIVE_DIR:
+    <time_ns>-<pid>.seg   header, then records (length, crc32, concept hash, language, payload)
+    <time_ns>-<pid>.idx   sorted (concept hash, language, offset, length) entries, once sealed
+    dict-<id>.<codec>     trained dictionaries
+"""
+import asyncio
+import bisect
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+
+import orjson
+
+from app.config import get_settings
+from app.metrics import vision_archive_bytes, visions_archived, TOOL_NAME
+
+try:
+    import zstandard
+except ImportError:  # Optional; zlib with a preset dictionary is the fallback
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_HEADER = struct.Struct("<4sBI")  # magic, codec, dictionary id
+RECORD_HEADER = struct.Struct("<II16s8s")  # payload length, crc32 of payload, concept hash, language
+INDEX_HEADER = struct.Struct("<4sI")  # magic, entry count
+INDEX_ENTRY = struct.Struct("<16s8sQI")  # concept hash, language, record offset, record length
+SEGMENT_MAGIC = b"VSEG"
+INDEX_MAGIC = b"VIDX"
+
+CODECS = {"zstd": 1, "zlib": 2}
+LEVELS = {"zstd": 9, "zlib": 9}
+
+# Records kept from the first segment to train the shared dictionary
+TRAINING_SAMPLES = 1000
+MIN_TRAINING_SAMPLES = 20
+DICTIONARY_BYTES = 64 * 1024
+ZLIB_WINDOW = 32 * 1024  # zlib only looks this far back, so a longer preset dictionary is wasted
+
+# The section titles the generation prompt asks for
+SECTION_TITLES = {
+    "technology": "Technology Evolution",
+    "experience": "User Experience",
+    "society": "Social Impact",
+    "wildcard": "The Unexpected",
+}
+
+EXPORT_FORMATS = ("ndjson", "parquet")
+EXPORT_BATCH = 1000
+
+
+def concept_hash(concept: str) -> bytes:
+    """Index key of a normalized concept (see vision_cache.normalize_concept)."""
+    return hashlib.blake2b(concept.encode(), digest_size=16).digest()
+
+
+def payload(concept: str, language: str, archived_at: int, vision: bytes) -> bytes:
+    """A record's JSON document, built around the already serialized vision."""
+    return b'{"concept":%s,"language":%s,"archived_at":%d,"vision":%s}' % (
+        orjson.dumps(concept), orjson.dumps(language), archived_at, vision,
+    )
+
+
+def builtin_dictionary() -> bytes:
+    """Dictionary 0: the skeleton every vision shares."""
+    vision = orjson.dumps({
+        "title": "The Future of ",
+        "year": 2036,
+        "summary": "",
+        "sections": {key: {"title": title, "content": ""} for key, title in SECTION_TITLES.items()},
+        "key_changes": ["", "", "", "", ""],
+    })
+    # Must never change: every segment written with dictionary 0 depends on it
+    return payload("", "en", 1760000000, vision)
+
+
+def train_dictionary(codec: str, samples: list[bytes]) -> bytes:
+    if codec == "zstd":
+        return zstandard.train_dictionary(DICTIONARY_BYTES, samples).as_bytes()
+    # zlib has no trainer; recent real records make a good preset dictionary,
+    # most useful last since matches there are cheapest
+    return builtin_dictionary() + b"".join(samples[-8:])[-(ZLIB_WINDOW - 1024):]
+
+
+class Codec:
+    """Compresses records one by one against a dictionary."""
+
+    def __init__(self, codec: str, dictionary: bytes):
+        self.codec = codec
+        if codec == "zstd":
+            shared = zstandard.ZstdCompressionDict(dictionary)
+            self._compressor = zstandard.ZstdCompressor(level=LEVELS["zstd"], dict_data=shared)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=shared)
+            self._lock = threading.Lock()  # zstandard (de)compressors aren't thread safe
+        else:
+            self._zdict = dictionary[-ZLIB_WINDOW:]
+
+    def compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            with self._lock:
+                return self._compressor.compress(data)
+        compressor = zlib.compressobj(LEVELS["zlib"], zlib.DEFLATED, -15, zdict=self._zdict)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            with self._lock:
+                return self._decompressor.decompress(data)
+        decompressor = zlib.decompressobj(-15, zdict=self._zdict)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def iter_records(data, start: int = SEGMENT_HEADER.size) -> Iterator[tuple[int, int, bytes, bytes, bytes]]:
+    """
+    (offset, length, concept hash, language, compressed payload) of each record.
+
+    Stops at the first incomplete or corrupt record: the torn tail of a
+    segment whose writer died, or the one a live writer is appending.
+    """
+    offset = start
+    while offset + RECORD_HEADER.size <= len(data):
+        size, crc, key, language = RECORD_HEADER.unpack_from(data, offset)
+        end = offset + RECORD_HEADER.size + size
+        if end > len(data):
+            return
+        compressed = data[offset + RECORD_HEADER.size:end]
+        if zlib.crc32(compressed) != crc:
+            return
+        yield offset, end - offset, key, language, compressed
+        offset = end
+
+
+def _map(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+    """A sealed segment and its index, memory-mapped on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = _map(path)
+        self.index = _map(path[:-len(".seg")] + ".idx")
+        _, self.codec_id, self.dictionary_id = SEGMENT_HEADER.unpack_from(self.data)
+        self.count = INDEX_HEADER.unpack_from(self.index)[1]
+
+    def _key(self, i: int) -> bytes:
+        start = INDEX_HEADER.size + i * INDEX_ENTRY.size
+        return self.index[start:start + 24]
+
+    def find(self, key: bytes, language: bytes) -> Optional[tuple[int, int]]:
+        """Offset and length of the newest record for (concept hash, language)."""
+        target = key + language
+        # Entries are sorted by (key, language, offset): the last match is the newest
+        i = bisect.bisect_right(range(self.count), target, key=self._key) - 1
+        if i < 0 or self._key(i) != target:
+            return None
+        _, _, offset, length = INDEX_ENTRY.unpack_from(self.index, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+        return offset, length
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class VisionArchive:
+    """Appends this process's visions to its own segment and reads every sealed segment."""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 << 20, codec: str = "auto"):
+        if codec == "auto":
+            codec = "zstd" if zstandard is not None else "zlib"
+        if codec not in CODECS:
+            raise ValueError(f"Unknown archive codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("The zstd archive codec needs the zstandard package")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._codecs: dict[tuple[int, int], Codec] = {}
+        self._segments: dict[str, Segment] = {}
+
+        # The segment this process appends to
+        self._fd: Optional[int] = None
+        self._path = ""
+        self._size = 0
+        self._dictionary_id = 0
+        self._entries: list[tuple[bytes, bytes, int, int]] = []
+        self._samples: list[bytes] = []
+
+        self.recover()
+
+    # Dictionaries and codecs
+
+    def _dictionary_path(self, codec: str, dictionary_id: int) -> str:
+        return os.path.join(self.directory, f"dict-{dictionary_id}.{codec}")
+
+    def latest_dictionary(self, codec: str) -> int:
+        ids = [
+            int(name.split(".")[0][len("dict-"):])
+            for name in os.listdir(self.directory)
+            if name.startswith("dict-") and name.endswith(f".{codec}")
+        ]
+        return max(ids, default=0)
+
+    def codec_for(self, codec_id: int, dictionary_id: int) -> Codec:
+        codec = self._codecs.get((codec_id, dictionary_id))
+        if codec is None:
+            name = next(name for name, value in CODECS.items() if value == codec_id)
+            if dictionary_id == 0:
+                dictionary = builtin_dictionary()
+            else:
+                with open(self._dictionary_path(name, dictionary_id), "rb") as f:
+                    dictionary = f.read()
+            codec = self._codecs[(codec_id, dictionary_id)] = Codec(name, dictionary)
+        return codec
+
+    def _save_dictionary(self, dictionary: bytes):
+        """Store a trained dictionary under the next id, unless another worker just did."""
+        tmp = os.path.join(self.directory, f".dict-{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(dictionary)
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp, self._dictionary_path(self.codec, self.latest_dictionary(self.codec) + 1))
+        except FileExistsError:
+            pass  # Another worker saved its dictionary first; segments use the latest either way
+        finally:
+            os.unlink(tmp)
+
+    # Writing
+
+    def _open_segment(self):
+        self._path = os.path.join(self.directory, f"{time.time_ns()}-{os.getpid()}.seg")
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        # Held while this process writes; recover() leaves locked segments alone
+        fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._dictionary_id = self.latest_dictionary(self.codec)
+        os.write(self._fd, SEGMENT_HEADER.pack(SEGMENT_MAGIC, CODECS[self.codec], self._dictionary_id))
+        self._size = SEGMENT_HEADER.size
+
+    def append(self, concept: str, language: str, vision: bytes):
+        """Archive a serialized vision under its normalized concept. Blocking."""
+        document = payload(concept, language, int(time.time()), vision)
+        key, lang = concept_hash(concept), language.encode()[:8]
+        with self._lock:
+            if self._fd is None:
+                self._open_segment()
+            compressed = self.codec_for(CODECS[self.codec], self._dictionary_id).compress(document)
+            record = RECORD_HEADER.pack(len(compressed), zlib.crc32(compressed), key, lang) + compressed
+            os.write(self._fd, record)
+            self._entries.append((key, lang.ljust(8, b"\0"), self._size, len(record)))
+            self._size += len(record)
+            if self._dictionary_id == 0 and len(self._samples) < TRAINING_SAMPLES:
+                self._samples.append(document)
+            if self._size >= self.segment_bytes:
+                self._seal()
+        visions_archived.labels(tool=TOOL_NAME).inc()
+        vision_archive_bytes.labels(tool=TOOL_NAME, stage="raw").inc(len(document))
+        vision_archive_bytes.labels(tool=TOOL_NAME, stage="compressed").inc(len(record))
+
+    def _write_index(self, path: str, entries: list[tuple[bytes, bytes, int, int]]):
+        entries.sort()
+        tmp = path[:-len(".seg")] + ".idx.tmp"
+        with open(tmp, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(entries)))
+            f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            os.fsync(f.fileno())
+        os.replace(tmp, path[:-len(".seg")] + ".idx")
+
+    def _seal(self):
+        os.fsync(self._fd)
+        self._write_index(self._path, self._entries)
+        if (
+            self._dictionary_id == 0
+            and len(self._samples) >= MIN_TRAINING_SAMPLES
+            and self.latest_dictionary(self.codec) == 0
+        ):
+            try:
+                self._save_dictionary(train_dictionary(self.codec, self._samples))
+            except Exception:
+                logger.exception("Training the vision archive dictionary failed")
+        os.close(self._fd)
+        self._fd = None
+        self._entries, self._samples = [], []
+
+    def recover(self) -> int:
+        """
+        Seal the segments of workers that stopped without sealing.
+
+        Torn records at the end are cut off. Returns the number sealed.
+        """
+        sealed = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".seg") or os.path.exists(path[:-len(".seg")] + ".idx"):
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Its writer is still running
+                if os.path.exists(path[:-len(".seg")] + ".idx"):
+                    continue  # Another worker recovered it first
+                with open(path, "rb") as f:
+                    data = f.read()
+                if len(data) < SEGMENT_HEADER.size:
+                    os.unlink(path)  # Died before writing the header
+                    continue
+                entries = [(key, lang, offset, length) for offset, length, key, lang, _ in iter_records(data)]
+                os.truncate(fd, entries[-1][2] + entries[-1][3] if entries else SEGMENT_HEADER.size)
+                self._write_index(path, entries)
+                sealed += 1
+            finally:
+                os.close(fd)
+        return sealed
+
+    def close(self):
+        """Seal this process's segment and unmap everything."""
+        with self._lock:
+            if self._fd is not None:
+                self._seal()
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+    # Reading
+
+    def sealed_segments(self) -> list[Segment]:
+        """Sealed segments, oldest first."""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".idx"))
+        segments = []
+        for name in names:
+            path = os.path.join(self.directory, name[:-len(".idx")] + ".seg")
+            segment = self._segments.get(path)
+            if segment is None:
+                segment = self._segments[path] = Segment(path)
+            segments.append(segment)
+        return segments
+
+    def get(self, concept: str, language: str) -> Optional[dict]:
+        """The newest archived record for a normalized concept, or None. Blocking."""
+        key, lang = concept_hash(concept), language.encode()[:8].ljust(8, b"\0")
+        with self._lock:
+            # Records this process hasn't sealed yet are newest
+            for entry_key, entry_lang, offset, length in reversed(self._entries):
+                if entry_key == key and entry_lang == lang:
+                    with open(self._path, "rb") as f:
+                        f.seek(offset)
+                        record = f.read(length)
+                    codec = self.codec_for(CODECS[self.codec], self._dictionary_id)
+                    return orjson.loads(codec.decompress(record[RECORD_HEADER.size:]))
+            # Under the lock, so close() can't unmap a segment while it is read
+            for segment in reversed(self.sealed_segments()):
+                found = segment.find(key, lang)
+                if found:
+                    offset, length = found
+                    codec = self.codec_for(segment.codec_id, segment.dictionary_id)
+                    return orjson.loads(codec.decompress(segment.data[offset + RECORD_HEADER.size:offset + length]))
+        return None
+
+    def scan(self) -> Iterator[bytes]:
+        """
+        Every record's JSON document, segment by segment, oldest first.
+
+        Segments are mapped one at a time, so memory stays flat. Segments
+        still being written are read up to their last complete record.
+        """
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if os.path.getsize(path) <= SEGMENT_HEADER.size:
+                continue
+            data = _map(path)
+            try:
+                _, codec_id, dictionary_id = SEGMENT_HEADER.unpack_from(data)
+                codec = self.codec_for(codec_id, dictionary_id)
+                for _, _, _, _, compressed in iter_records(data):
+                    yield codec.decompress(compressed)
+            finally:
+                data.close()
+
+
+def _export_parquet(documents: Iterator[bytes], out: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("concept", pa.string()),
+        ("language", pa.string()),
+        ("archived_at", pa.timestamp("s")),
+        ("title", pa.string()),
+        ("year", pa.int32()),
+        ("summary", pa.string()),
+        ("key_changes", pa.list_(pa.string())),
+        ("sections", pa.string()),  # JSON; section keys differ between visions
+    ])
+    count = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        rows = []
+        for document in documents:
+            record = orjson.loads(document)
+            vision = record["vision"]
+            rows.append({
+                "concept": record["concept"],
+                "language": record["language"],
+                "archived_at": record["archived_at"],
+                "title": vision.get("title"),
+                "year": vision.get("year"),
+                "summary": vision.get("summary"),
+                "key_changes": vision.get("key_changes"),
+                "sections": orjson.dumps(vision.get("sections", {})).decode(),
+            })
+            if len(rows) >= EXPORT_BATCH:
+                writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+            count += len(rows)
+    return count
+
+
+def export(archive: VisionArchive, out: str, format: str = "ndjson") -> int:
+    """
+    Stream every archived vision to the file `out` as NDJSON, or as Parquet
+    when pyarrow is installed.
+
+    NDJSON lines are the decompressed records as stored, without re-encoding.
+    Returns the number of records written.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export needs the pyarrow package; use ndjson")
+        return _export_parquet(archive.scan(), out)
+
+    count = 0
+    with open(out, "wb") as f:
+        for document in archive.scan():
+            f.write(document + b"\n")
+            count += 1
+    return count
+
+
+_archive: Optional[VisionArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_vision_archive() -> Optional[VisionArchive]:
+    """
+    This process's archive, or None when VISION_ARCHIVE_DIR is unset.
+
+    Opening it recovers unsealed segments, reading them whole: blocking.
+    The app opens it in a thread at startup.
+    """
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            settings = get_settings()
+            if settings.vision_archive_dir:
+                _archive = VisionArchive(
+                    settings.vision_archive_dir,
+                    settings.vision_archive_segment_mb << 20,
+                    settings.vision_archive_codec,
+                )
+    return _archive
+
+
+def close_vision_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+
+def _append(concept: str, language: str, body: bytes):
+    archive = get_vision_archive()
+    if archive is not None:
+        archive.append(concept, language, body)
+
+
+def get_archived(concept: str, language: str) -> Optional[dict]:
+    """
+    The newest archived record of a normalized concept, or None. Blocking.
+
+    Raises:
+        LookupError: when the archive is disabled
+    """
+    archive = get_vision_archive()
+    if archive is None:
+        raise LookupError("Vision archive is disabled")
+    return archive.get(concept, language)
+
+
+async def archive_vision(concept: str, language: str, body: bytes):
+    """Archive a newly generated vision (normalized concept); failures are logged, never raised."""
+    if not get_settings().vision_archive_dir:
+        return
+    try:
+        await asyncio.to_thread(_append, concept, language, body)
+    except Exception:
+        logger.exception("Archiving a vision failed")
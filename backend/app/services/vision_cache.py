@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional
+
+import orjson
+
+from app.api.v1.schemas import VisionBody
+from app.config import get_settings
+from app.metrics import similar_concept_hits, upstream_seconds_wasted, vision_translations, TOOL_NAME
+from app.services.kv_store import get_kv_store
+from app.services.llm_service import LANGUAGE_NAMES, translate_vision
+from app.services.offload import offload, text_size
+from app.services.response_fields import Fields, shape
+from app.services.similarity import get_concept_index
+from app.services.vision_archive import archive_vision
+
+# How often a worker waiting on another worker's generation checks the cache
+POLL_INTERVAL = 0.25
+
+Generator = Callable[[str, str], Awaitable[dict]]
+
+
+class _Flight:
+    """A generation in flight in this process and the number of callers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        self.started = time.monotonic()
+
+
+# Generations in flight in this process, so concurrent identical requests share one
+_inflight: dict[str, _Flight] = {}
+
+
+def normalize_concept(concept: str) -> str:
+    return " ".join(concept.casefold().split())
+
+
+def cache_key(concept: str, language: str, fields: Fields = None) -> str:
+    name = f"{language}:{normalize_concept(concept)}"
+    if fields is not None:
+        name += ":" + ",".join(fields)
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return f"vision:{digest[:32]}"
+
+
+def encode_vision(vision: dict, concept: str, fields: Fields = None) -> bytes:
+    """
+    Validate a generated vision once and serialize it for the cache.
+
+    Missing fields get the same defaults the endpoint has always used; parts
+    outside `fields` are dropped, even if the model wrote them anyway.
+    """
+    body = VisionBody(
+        title=vision.get("title", f"The Future of {concept}"),
+        year=vision.get("year", 2036),
+        summary=vision.get("summary", ""),
+        sections=vision.get("sections", {}),
+        key_changes=vision.get("key_changes", []),
+    )
+    return orjson.dumps(shape(body.model_dump(), fields))
+
+
+def project(body: bytes, fields: Fields) -> bytes:
+    """A serialized vision cut down to `fields`."""
+    if fields is None:
+        return body
+    return orjson.dumps(shape(orjson.loads(body), fields))
+
+
+def render_response(body: bytes, is_free_trial: bool, remaining_tokens: int, degraded: bool = False) -> bytes:
+    """Splice the per-request fields into a serialized vision (a JSON object)."""
+    return b"%s,\"is_free_trial\":%s,\"remaining_tokens\":%d,\"degraded\":%s}" % (
+        body[:-1],
+        b"true" if is_free_trial else b"false",
+        remaining_tokens,
+        b"true" if degraded else b"false",
+    )
+
+
+async def get_cached_vision(concept: str, language: str, fields: Fields = None) -> Optional[bytes]:
+    """Get a previously generated vision, serialized, if it is still cached."""
+    return await get_kv_store().get(cache_key(concept, language, fields))
+
+
+async def store_vision(concept: str, language: str, body: bytes, fields: Fields = None):
+    settings = get_settings()
+    await get_kv_store().set(
+        cache_key(concept, language, fields),
+        body,
+        ttl=settings.vision_cache_ttl_seconds,
+    )
+    # Near-duplicate matching only looks for full visions
+    if settings.similar_concept_enabled and fields is None:
+        get_concept_index().add(concept, language)
+
+
+async def get_similar_vision(concept: str, language: str) -> Optional[bytes]:
+    """Get the cached vision of a near-duplicate concept ("TikTok app" for "tiktok")."""
+    settings = get_settings()
+    if not settings.similar_concept_enabled:
+        return None
+    index = get_concept_index()
+    for match, _ in index.matches(concept, language, settings.similar_concept_threshold):
+        body = await get_cached_vision(match, language)
+        if body:
+            similar_concept_hits.labels(tool=TOOL_NAME).inc()
+            return body
+        index.discard(match, language)  # Expired from the cache; try the next best
+    return None
+
+
+async def get_other_language_vision(concept: str, language: str) -> Optional[bytes]:
+    """Get a cached vision of the same concept in another language, English first."""
+    for other in LANGUAGE_NAMES:
+        if other != language:
+            body = await get_cached_vision(concept, other)
+            if body:
+                return body
+    return None
+
+
+def translating(source: bytes, generate: Generator) -> Generator:
+    """Wrap `generate` to translate `source` first, generating only if that fails."""
+    async def translate_or_generate(concept: str, language: str) -> dict:
+        try:
+            vision = await translate_vision(orjson.loads(source), language)
+        except Exception:
+            vision_translations.labels(tool=TOOL_NAME, status="fallback").inc()
+            return await generate(concept, language)
+        vision_translations.labels(tool=TOOL_NAME, status="success").inc()
+        return vision
+    return translate_or_generate
+
+
+async def _generate(concept: str, language: str, generate: Generator, fields: Fields = None) -> bytes:
+    vision = await generate(concept, language)
+    body = await offload(encode_vision, vision, concept, fields, size=text_size(vision))
+    if fields is None:
+        # The archive keeps full visions only; a partial one would hide the
+        # full one for its (concept, language) and export with parts missing
+        await archive_vision(normalize_concept(concept), language, body)
+    return body
+
+
+async def _fill(key: str, concept: str, language: str, generate: Generator, fields: Fields) -> bytes:
+    """Generate and cache a vision, unless another worker is already doing it."""
+    settings = get_settings()
+    kv = get_kv_store()
+    lock_key = f"{key}:lock"
+    timeout = settings.single_flight_timeout_seconds
+
+    if await kv.add(lock_key, b"1", ttl=timeout):
+        try:
+            body = await _generate(concept, language, generate, fields)
+            await store_vision(concept, language, body, fields)
+            return body
+        finally:
+            await kv.delete(lock_key)
+
+    # Another worker holds the lock: wait for its result instead of calling upstream again
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        body = await kv.get(key)
+        if body:
+            return body
+        if await kv.get(lock_key) is None:
+            break  # The other worker failed; generate ourselves
+    return await _generate(concept, language, generate, fields)
+
+
+async def _lead(key: str, concept: str, language: str, generate: Generator, fields: Fields) -> bytes:
+    if get_settings().translate_cached_visions:
+        source = await get_other_language_vision(concept, language)
+        if source:
+            # Only the selected parts are translated
+            generate = translating(project(source, fields), generate)
+    return await _fill(key, concept, language, generate, fields)
+
+
+def _landed(key: str, flight: _Flight):
+    if _inflight.get(key) is flight:
+        del _inflight[key]
+    if not flight.task.cancelled():
+        flight.task.exception()  # Mark retrieved; waiters (if any) still get it
+
+
+async def get_or_generate(concept: str, language: str, generate: Generator, fields: Fields = None) -> bytes:
+    """
+    Get a serialized vision from the cache, or generate it once for all concurrent callers.
+
+    Identical requests in this process wait on the same generation; identical
+    requests in other workers wait on a lock in the shared key-value store.
+    A caller that is cancelled stops waiting; the generation itself is only
+    cancelled when no caller is left waiting on it.
+
+    With `fields`, a cached full vision is cut down to them; otherwise only
+    those parts are generated, and cached separately.
+    """
+    if not get_settings().vision_cache_enabled:
+        started = time.monotonic()
+        try:
+            return await _generate(concept, language, generate, fields)
+        except asyncio.CancelledError:
+            upstream_seconds_wasted.labels(tool=TOOL_NAME).inc(time.monotonic() - started)
+            raise
+
+    cached = await get_cached_vision(concept, language) or await get_similar_vision(concept, language)
+    if cached:
+        if fields is not None:
+            cached = await offload(project, cached, fields, size=len(cached))
+        return cached
+    if fields is not None:
+        cached = await get_cached_vision(concept, language, fields)
+        if cached:
+            return cached
+
+    key = cache_key(concept, language, fields)
+    flight = _inflight.get(key)
+    if flight is None:
+        flight = _Flight(asyncio.create_task(_lead(key, concept, language, generate, fields)))
+        _inflight[key] = flight
+        flight.task.add_done_callback(lambda _: _landed(key, flight))
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        if flight.waiters == 1 and not flight.task.done():
+            # Last one waiting: stop the upstream call rather than finish it for nobody.
+            # Other workers polling the lock take over when it is released.
+            flight.task.cancel()
+            upstream_seconds_wasted.labels(tool=TOOL_NAME).inc(time.monotonic() - flight.started)
+        raise
+    finally:
+        flight.waiters -= 1
@@ -0,0 +1,46 @@
+"""
+Cold-start benchmark: time `import app.main` in fresh interpreters.
+
+Usage (from backend/):
+    python benchmarks/bench_import.py [--runs 10] [--budget-ms 1000]
+
+Exits non-zero when the median is over the budget, so it can gate CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=BACKEND_DIR, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    baseline = [time_import("sys") for _ in range(3)]
+    samples = sorted(time_import(args.module) for _ in range(args.runs))
+    median = statistics.median(samples)
+
+    print(f"interpreter startup: {statistics.median(baseline):.0f} ms")
+    print(f"import {args.module}: median {median:.0f} ms, "
+          f"min {samples[0]:.0f} ms, max {samples[-1]:.0f} ms over {args.runs} runs")
+
+    if median > args.budget_ms:
+        print(f"over budget ({args.budget_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
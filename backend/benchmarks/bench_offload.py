@@ -0,0 +1,169 @@
+"""
+Mixed-load benchmark: latency of cheap requests while large completions are parsed.
+
+Runs the app in-process (one worker, one event loop, a temporary SQLite
+database). Heavy clients keep /api/v1/visualize busy with a fake LLM proxy
+that answers with a large completion after a short delay; cheap clients
+poll /api/v1/tokens/status. Reports cheap-request latency, and how late
+the event loop ran a 1 ms timer, for each CPU_OFFLOAD_EXECUTOR mode:
+"none" parses every completion on the event loop.
+
+Usage (from backend/):
+    python benchmarks/bench_offload.py [--payload-kb 512] [--seconds 5] [--heavy 4] [--cheap 8]
+"""
+import argparse
+import asyncio
+import atexit
+import itertools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = tempfile.mkdtemp(prefix="bench-offload-")
+atexit.register(shutil.rmtree, DATA_DIR, True)
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{DATA_DIR}/app.db",
+    "VISION_CACHE_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "DEGRADED_MODE_ENABLED": "false",
+})
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app.config import get_settings  # noqa: E402
+from app.database import init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import llm_service, offload  # noqa: E402
+from app.services.llm_service import parse_vision  # noqa: E402
+from app.services.vision_cache import encode_vision  # noqa: E402
+
+PARAGRAPH = "In 2036 the product has dissolved into the \"ambient\" computing layer around us.\n"
+
+
+def completion(payload_kb: int) -> bytes:
+    """An LLM proxy response whose vision is about `payload_kb` KiB of JSON."""
+    repeats = max(1, payload_kb * 1024 // (len(PARAGRAPH) * 4 + 64))
+    vision = {
+        "title": "The Future of Smartphones",
+        "year": 2036,
+        "summary": PARAGRAPH * 3,
+        "sections": {
+            name: {"title": name.title(), "content": PARAGRAPH * repeats}
+            for name in ("technology", "experience", "society", "wildcard")
+        },
+        "key_changes": [PARAGRAPH] * 5,
+    }
+    content = "```json\n" + json.dumps(vision, ensure_ascii=False) + "\n```"
+    return json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.text = content.decode()
+
+
+class FakeProxy:
+    """Answers every completion with the same body after `delay` seconds."""
+
+    def __init__(self, body: bytes, delay: float):
+        self.body = body
+        self.delay = delay
+
+    async def post(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return FakeResponse(self.body)
+
+
+def parse_cost_ms(body: bytes) -> float:
+    started = time.perf_counter()
+    content = json.loads(body)["choices"][0]["message"]["content"]
+    encode_vision(parse_vision(content, "Smartphones"), "Smartphones")
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(mode: str, args, body: bytes) -> tuple[list[float], list[float], int]:
+    settings = get_settings()
+    offload.shutdown_executor()
+    settings.cpu_offload_executor = mode
+    if mode == "process":
+        # Start the workers outside the measurement
+        await asyncio.gather(*(offload.offload(len, "", size=1 << 30) for _ in range(settings.cpu_offload_workers)))
+
+    latencies: list[float] = []
+    lags: list[float] = []
+    generations = 0
+    devices = itertools.count()
+    stop_at = time.monotonic() + args.seconds
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        async def heavy():
+            nonlocal generations
+            while time.monotonic() < stop_at:
+                # A fresh device each time, so every request uses its free trial
+                response = await client.post(
+                    "/api/v1/visualize",
+                    headers={"X-Device-Id": f"{mode}-{next(devices)}"},
+                    json={"concept": "Smartphones", "language": "en"},
+                )
+                generations += response.status_code == 200
+
+        async def cheap(n: int):
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                await client.get("/api/v1/tokens/status", headers={"X-Device-Id": f"poller-{n}"})
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.poll_ms / 1000)
+
+        async def probe():
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append((time.perf_counter() - started) * 1000 - 1)
+
+        await asyncio.gather(
+            probe(), *(heavy() for _ in range(args.heavy)), *(cheap(n) for n in range(args.cheap))
+        )
+    offload.shutdown_executor()
+    return sorted(latencies), sorted(lags), generations
+
+
+def p99(samples: list[float]) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payload-kb", type=int, default=512)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--heavy", type=int, default=4, help="concurrent /visualize clients")
+    parser.add_argument("--cheap", type=int, default=4, help="concurrent /tokens/status clients")
+    parser.add_argument("--poll-ms", type=float, default=20.0, help="pause between one client's status requests")
+    parser.add_argument("--upstream-ms", type=float, default=50.0, help="fake LLM proxy latency")
+    parser.add_argument("--modes", default="none,thread,process")
+    args = parser.parse_args()
+
+    body = completion(args.payload_kb)
+    print(f"completion: {len(body) // 1024} KiB, parse + validate {parse_cost_ms(body):.1f} ms on one core")
+
+    await init_db()
+    llm_service.get_http_client = lambda: FakeProxy(body, args.upstream_ms / 1000)
+    get_settings().cpu_offload_min_bytes = 64 * 1024
+
+    for mode in args.modes.split(","):
+        latencies, lags, generations = await run(mode, args, body)
+        print(f"{mode:>8}: /tokens/status p50 {statistics.median(latencies):6.1f} ms, "
+              f"p99 {p99(latencies):6.1f} ms, max {latencies[-1]:6.1f} ms ({len(latencies)} requests); "
+              f"loop lag p99 {p99(lags):5.1f} ms, max {lags[-1]:5.1f} ms; {generations} visions")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Microbenchmark: serializing a /visualize response.
+
+Compares the previous path (build VisualizeResponse from a dict, then let
+FastAPI validate and encode it) with the cached fast path (splice the
+per-request fields into pre-serialized orjson bytes).
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--iterations 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.api.v1.schemas import VisualizeResponse  # noqa: E402
+from app.services.vision_cache import encode_vision, render_response  # noqa: E402
+
+PARAGRAPH = "In 2036 the product has dissolved into the ambient computing layer around us. " * 12
+
+VISION = {
+    "title": "The Future of Smartphones: Invisible, Ambient, Everywhere",
+    "year": 2036,
+    "summary": PARAGRAPH[:400],
+    "sections": {
+        name: {"title": name.title(), "content": PARAGRAPH * (1 if name == "wildcard" else 3)}
+        for name in ("technology", "experience", "society", "wildcard")
+    },
+    "key_changes": [f"Change {i}: {PARAGRAPH[:120]}" for i in range(5)],
+}
+
+
+def previous_path() -> bytes:
+    # What FastAPI did per request: model construction, validation of the
+    # returned model against response_model, jsonable_encoder, json.dumps
+    response = VisualizeResponse(
+        title=VISION.get("title", "The Future of x"),
+        year=VISION.get("year", 2036),
+        summary=VISION.get("summary", ""),
+        sections=VISION.get("sections", {}),
+        key_changes=VISION.get("key_changes", []),
+        is_free_trial=False,
+        remaining_tokens=4,
+    )
+    validated = VisualizeResponse.model_validate(response.model_dump())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+CACHED_BODY = encode_vision(VISION, "smartphones")
+
+
+def fast_path() -> bytes:
+    return render_response(CACHED_BODY, False, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    assert json.loads(previous_path()) == json.loads(fast_path())
+    print(f"payload: {len(fast_path())} bytes")
+
+    results = {}
+    for name, fn in (("previous", previous_path), ("cached fast path", fast_path)):
+        seconds = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        results[name] = seconds / args.iterations * 1e6
+        print(f"{name:>18}: {results[name]:8.2f} us/response")
+
+    print(f"speedup: {results['previous'] / results['cached fast path']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
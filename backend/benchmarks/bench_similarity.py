@@ -0,0 +1,103 @@
+"""
+Near-duplicate concept index: lookup latency, recall and precision.
+
+Builds an index of synthetic product names, then queries:
+  - variants of stored names (case, spacing, filler words, small edits),
+    which should match their source (recall)
+  - fresh names that were never stored, which should not match (precision)
+
+Usage (from backend/):
+    python benchmarks/bench_similarity.py [--size 100000] [--queries 2000]
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.similarity import ConceptIndex  # noqa: E402
+
+SYLLABLES = [
+    "ka", "zo", "mi", "tek", "lu", "ra", "vex", "no", "pi", "qua", "sol", "tri",
+    "gen", "bo", "lyn", "dex", "fi", "mo", "nex", "ori", "pla", "ser", "tu", "vo",
+]
+SUFFIXES = ["", "", "", " pro", " cloud", " ai", " pay", " hub", " go", " x"]
+
+
+def product_name(rng: random.Random) -> str:
+    word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return word.capitalize() + rng.choice(SUFFIXES)
+
+
+def variant(name: str, rng: random.Random) -> str:
+    """A rephrasing a user might type for the same concept."""
+    kind = rng.randrange(5)
+    if kind == 0:
+        return name.upper()
+    if kind == 1:
+        return f"{name} app"
+    if kind == 2:
+        return f"the future of {name} in 10 years"
+    if kind == 3:
+        # Split the first word in two: "Kazotek" -> "Kazo tek"
+        cut = max(2, len(name.split()[0]) // 2)
+        return f"{name[:cut]} {name[cut:]}"
+    # One character appended, a common typo on long names
+    return name + name[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    names = sorted({product_name(rng) for _ in range(args.size * 2)})[:args.size]
+    stored = set(names)
+
+    index = ConceptIndex(max_entries=args.size)
+    started = time.perf_counter()
+    for name in names:
+        index.add(name, "en")
+    print(f"indexed {len(index)} concepts in {time.perf_counter() - started:.1f} s")
+    # A long-running worker has long since moved the index into the oldest
+    # GC generation; freeze it so collections don't show up as lookup latency
+    gc.freeze()
+
+    latencies = []
+
+    def timed_lookup(query):
+        started = time.perf_counter()
+        result = index.lookup(query, "en", args.threshold)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        return result
+
+    hits = 0
+    sources = rng.sample(names, args.queries)
+    for name in sources:
+        match = timed_lookup(variant(name, rng))
+        hits += match is not None and match[0] == name
+
+    false_matches = 0
+    fresh = [name for name in (product_name(rng) for _ in range(args.queries * 3)) if name not in stored]
+    fresh = fresh[:args.queries]
+    for name in fresh:
+        false_matches += timed_lookup(name) is not None
+
+    latencies.sort()
+    print(f"lookup latency: p50 {statistics.median(latencies):.0f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.0f} us")
+    print(f"recall on variants: {hits / len(sources):.3f} "
+          "(misses are one-letter typos on short names, below the threshold by design)")
+    print(f"matches for unseen names: {false_matches / len(fresh):.3f} "
+          "(synthetic names share syllables, so some are true near-duplicates)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Token record lookups by device at scale: text device_id index vs hashed device key.
+
+Builds two SQLite files with the same devices:
+  - v1: the old generation_tokens table, a non-unique index on device_id text
+  - v2: the current table, a unique 16-byte blake2b device key
+then times point lookups for stored and unknown devices, and reports file
+sizes. Device ids look like FingerprintJS visitor ids (32 hex characters).
+
+Usage (from backend/):
+    python benchmarks/bench_token_lookup.py [--rows 10000000] [--lookups 20000] [--dir /tmp]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects import sqlite  # noqa: E402
+from sqlalchemy.schema import CreateIndex, CreateTable  # noqa: E402
+
+from app.models.token import GenerationToken, device_key  # noqa: E402
+
+BATCH = 100_000
+
+V1_SCHEMA = [
+    "CREATE TABLE generation_tokens (id INTEGER PRIMARY KEY, device_id VARCHAR(255) NOT NULL,"
+    " tokens_remaining INTEGER, tokens_purchased INTEGER, free_trial_used BOOLEAN,"
+    " created_at DATETIME, updated_at DATETIME)",
+    "CREATE INDEX ix_generation_tokens_device_id ON generation_tokens (device_id)",
+]
+
+
+def v2_schema() -> list[str]:
+    table = GenerationToken.__table__
+    dialect = sqlite.dialect()
+    return [str(CreateTable(table).compile(dialect=dialect))] + [
+        str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes
+    ]
+
+
+def device_id(n: int) -> str:
+    return random.Random(n).getrandbits(128).to_bytes(16, "big").hex()
+
+
+def build(path: str, schema: list[str], rows: int, keyed: bool) -> float:
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    for statement in schema:
+        conn.execute(statement)
+
+    if keyed:
+        sql = ("INSERT INTO generation_tokens (device_key, device_id, tokens_remaining, tokens_purchased,"
+               " free_trial_used) VALUES (?, ?, 0, 0, 1)")
+        row = lambda raw: (device_key(raw), raw)  # noqa: E731
+    else:
+        sql = ("INSERT INTO generation_tokens (device_id, tokens_remaining, tokens_purchased,"
+               " free_trial_used) VALUES (?, 0, 0, 1)")
+        row = lambda raw: (raw,)  # noqa: E731
+
+    started = time.perf_counter()
+    for start in range(0, rows, BATCH):
+        conn.executemany(sql, (row(device_id(n)) for n in range(start, min(rows, start + BATCH))))
+        conn.commit()
+    conn.close()
+    return time.perf_counter() - started
+
+
+def time_lookups(path: str, ids: list[str], keyed: bool) -> list[float]:
+    conn = sqlite3.connect(path)
+    if keyed:
+        sql = "SELECT * FROM generation_tokens WHERE device_key = ?"
+    else:
+        sql = "SELECT * FROM generation_tokens WHERE device_id = ?"
+
+    latencies = []
+    for raw in ids:
+        started = time.perf_counter()
+        # Hashing is part of the lookup cost on the keyed path
+        conn.execute(sql, (device_key(raw) if keyed else raw,)).fetchall()
+        latencies.append((time.perf_counter() - started) * 1e6)
+    conn.close()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--dir", default=".")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    hits = [device_id(rng.randrange(args.rows)) for _ in range(args.lookups)]
+    misses = [device_id(args.rows + n) for n in range(args.lookups)]
+
+    for name, schema, keyed in (("v1 device_id text", V1_SCHEMA, False), ("v2 device key", v2_schema(), True)):
+        path = os.path.join(args.dir, f"bench_tokens_{'v2' if keyed else 'v1'}.db")
+        build_seconds = build(path, schema, args.rows, keyed)
+        size = os.path.getsize(path) / 1e6
+        print(f"{name}: {args.rows:,} rows built in {build_seconds:.1f} s, {size:.0f} MB")
+        for kind, ids in (("hit", hits), ("miss", misses)):
+            latencies = time_lookups(path, ids, keyed)
+            print(f"  {kind:4} p50 {statistics.median(latencies):.1f} us, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)]:.1f} us")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
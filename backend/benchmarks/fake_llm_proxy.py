@@ -0,0 +1,116 @@
+"""
+Fake LLM proxy (and Creem API) for replays and load tests.
+
+Answers chat completions with canned visions after a configurable delay:
+full visions, lite batches (one object per numbered concept) and
+translations (the source document, unchanged). Creem checkouts are created
+and always report "pending", so payments settle only through replayed
+webhooks.
+
+Usage (from backend/):
+    python benchmarks/fake_llm_proxy.py [--port 9100] [--latency-ms 800] [--jitter-ms 400] [--error-rate 0]
+
+then start the app against it:
+    LLM_PROXY_URL=http://127.0.0.1:9100 CREEM_API_URL=http://127.0.0.1:9100 \\
+    CREEM_PRODUCT_IDS='{"starter": "prod_starter", "standard": "prod_standard", "pro": "prod_pro"}' \\
+    CREEM_WEBHOOK_SECRET=replay python -m app.server
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PARAGRAPH = (
+    "By 2036 {concept} has dissolved into the ambient computing layer: it anticipates what "
+    "people need, negotiates with other agents on their behalf and mostly goes unnoticed. "
+)
+
+
+def full_vision(concept: str) -> dict:
+    paragraphs = "\n\n".join([PARAGRAPH.format(concept=concept) * 3] * 3)
+    return {
+        "title": f"The Future of {concept}",
+        "year": 2036,
+        "summary": PARAGRAPH.format(concept=concept) * 2,
+        "sections": {
+            key: {"title": title, "content": paragraphs}
+            for key, title in (
+                ("technology", "Technology Evolution"),
+                ("experience", "User Experience"),
+                ("society", "Social Impact"),
+                ("wildcard", "The Unexpected"),
+            )
+        },
+        "key_changes": [f"{concept} change {i}" for i in range(1, 6)],
+    }
+
+
+def lite_vision(concept: str) -> dict:
+    return {
+        "title": f"The Future of {concept}",
+        "year": 2036,
+        "summary": PARAGRAPH.format(concept=concept),
+        "key_changes": [f"{concept} change {i}" for i in range(1, 4)],
+    }
+
+
+def completion_for(system_prompt: str, user_prompt: str):
+    """The JSON document a real model would be asked for by this prompt."""
+    if "professional translator" in system_prompt:
+        return json.loads(user_prompt)
+    if "numbered list of concepts" in system_prompt:
+        return [lite_vision(concept) for concept in re.findall(r"^\d+\. (.*)$", user_prompt, re.MULTILINE)]
+    match = re.search(r"Imagine what '(.*)' will look like", user_prompt, re.DOTALL)
+    return full_vision(match.group(1) if match else "it")
+
+
+def create_app(latency: float = 0.8, jitter: float = 0.4, error_rate: float = 0.0) -> FastAPI:
+    """The fake proxy as an ASGI app; latencies are in seconds."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = {message["role"]: message["content"] for message in body["messages"]}
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if random.random() < error_rate:
+            return JSONResponse({"error": "upstream overloaded"}, status_code=503)
+
+        document = completion_for(messages.get("system", ""), messages.get("user", ""))
+        content = "```json\n" + json.dumps(document, ensure_ascii=False) + "\n```"
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    @app.post("/v1/checkouts")
+    async def create_checkout(request: Request):
+        checkout_id = f"chk_{uuid.uuid4().hex}"
+        return {"id": checkout_id, "checkout_url": f"http://fake-creem.invalid/checkout/{checkout_id}"}
+
+    @app.get("/v1/checkouts")
+    async def get_checkout(checkout_id: str):
+        return {"id": checkout_id, "status": "pending"}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=400.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions answered with 503")
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Replay captured traffic (TRAFFIC_CAPTURE_PATH) against a local instance.
+
+Requests are sent at their original spacing, scaled by --speed (2 replays
+twice as fast; 0 sends as fast as --concurrency allows, so a device's
+requests may overtake each other). Devices, IPs and
+user agent classes are kept, so rate limits, free trials and crawler
+metrics see the same mix. Checkouts go to the fake Creem API, and replayed
+checkout.completed webhooks settle them, signed with --webhook-secret.
+
+The report has latency percentiles and status counts per endpoint, plus
+the database writes the instance made during the replay (from /metrics).
+Pass a previous build's report with --compare to see the difference.
+
+Usage (from backend/, with benchmarks/fake_llm_proxy.py and the app running):
+    python benchmarks/replay.py capture.ndjson --target http://127.0.0.1:8000 \\
+        [--speed 1] [--report new.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+USER_AGENTS = {
+    "browser": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "other": "python-httpx/replay",
+    "": "",
+}
+
+
+def load(path: str, limit: Optional[int] = None) -> list[dict]:
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # A torn last line from a worker that was killed mid-write
+    records.sort(key=lambda record: record["t"])
+    return records[:limit] if limit else records
+
+
+def replay_ip(pseudonym: Optional[str]) -> Optional[str]:
+    """A stable private address standing in for a hashed client IP."""
+    if not pseudonym:
+        return None
+    octets = bytes.fromhex(pseudonym)[:3]
+    return "10.{}.{}.{}".format(*octets)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def db_writes(client: httpx.AsyncClient) -> dict[str, float]:
+    response = await client.get("/metrics")
+    writes = {}
+    for family in text_string_to_metric_families(response.text):
+        if family.name == "db_writes":
+            for sample in family.samples:
+                if sample.name == "db_writes_total":
+                    statement = sample.labels["statement"]
+                    writes[statement] = writes.get(statement, 0) + sample.value
+    return writes
+
+
+class Replayer:
+    def __init__(self, client: httpx.AsyncClient, webhook_secret: str):
+        self.client = client
+        self.webhook_secret = webhook_secret
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # Checkouts created during the replay, per device, waiting for their webhook
+        self.checkouts: dict[str, list[str]] = defaultdict(list)
+
+    def build(self, record: dict) -> tuple[dict, Optional[bytes]]:
+        headers = {}
+        if record.get("dev"):
+            headers["X-Device-Id"] = f"replay-{record['dev']}"
+        ip = replay_ip(record.get("ip"))
+        if ip:
+            headers["X-Forwarded-For"] = ip
+        agent = record.get("ua", "")
+        headers["User-Agent"] = USER_AGENTS.get(agent, f"Mozilla/5.0 (compatible; {agent}/2.1)")
+
+        body = record.get("body")
+        if "body" not in record:
+            return headers, None
+        if body is None:
+            return headers, b"{}"  # Unparseable originally; still a request the app rejects
+
+        path = record["p"]
+        if path.endswith("/checkout"):
+            body = {"product_sku": body.get("product_sku"), "device_id": f"replay-{body.get('device')}"}
+        elif path.endswith("/webhook"):
+            device = body.get("device")
+            pending = self.checkouts.get(device)
+            checkout_id = pending.pop(0) if pending else "chk_unknown"
+            body = {
+                "type": body.get("type"),
+                "data": {
+                    "id": checkout_id,
+                    "metadata": {"device_id": f"replay-{device}", "tokens": body.get("tokens")},
+                },
+            }
+        content = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+        if path.endswith("/webhook") and self.webhook_secret:
+            headers["Creem-Signature"] = hmac.new(self.webhook_secret.encode(), content, hashlib.sha256).hexdigest()
+        return headers, content
+
+    async def send(self, record: dict):
+        headers, content = self.build(record)
+        path = record["p"]
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(record["m"], path, headers=headers, content=content)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies[path].append((time.perf_counter() - started) * 1000)
+        self.statuses[path][status] += 1
+
+        if response is not None and path.endswith("/checkout") and response.status_code == 200:
+            device = record["body"]["device"]
+            self.checkouts[device].append(response.json()["checkout_id"])
+
+    async def run(self, records: list[dict], speed: float, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+        origin = records[0]["t"]
+        started = time.monotonic()
+
+        async def bounded(record: dict):
+            async with semaphore:
+                await self.send(record)
+
+        tasks = []
+        for record in records:
+            if speed > 0:
+                delay = (record["t"] - origin) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(bounded(record)))
+        await asyncio.gather(*tasks)
+
+
+def summarize(latencies: dict[str, list[float]], statuses: dict[str, dict[str, int]]) -> dict:
+    endpoints = {}
+    for path, samples in sorted(latencies.items()):
+        samples = sorted(samples)
+        endpoints[path] = {
+            "count": len(samples),
+            "p50": round(statistics.median(samples), 1),
+            "p90": round(percentile(samples, 0.9), 1),
+            "p99": round(percentile(samples, 0.99), 1),
+            "max": round(samples[-1], 1),
+            "statuses": dict(statuses[path]),
+        }
+    return endpoints
+
+
+def captured_summary(records: list[dict]) -> dict:
+    """The same percentiles as the capture recorded them (server-side time to response)."""
+    latencies, statuses = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    for record in records:
+        latencies[record["p"]].append(record["ms"])
+        statuses[record["p"]][str(record["s"])] += 1
+    return summarize(latencies, statuses)
+
+
+def change(old: float, new: float) -> str:
+    if not old:
+        return "      "
+    return f"{(new - old) / old * 100:+5.0f}%"
+
+
+def compare(old: dict, new: dict, title: str):
+    print(title)
+    print(f"{'endpoint':<28} {'count':>6} {'p50 ms':>18} {'p99 ms':>18}")
+    for path in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        a, b = old["endpoints"].get(path), new["endpoints"].get(path)
+        if not a or not b:
+            print(f"{path:<28} only in {'new' if b else 'old'} report")
+            continue
+        print(f"{path:<28} {b['count']:>6} "
+              f"{a['p50']:>7} → {b['p50']:<7}{change(a['p50'], b['p50'])} "
+              f"{a['p99']:>7} → {b['p99']:<7}{change(a['p99'], b['p99'])}")
+    print("database writes:")
+    for statement in sorted(set(old["db_writes"]) | set(new["db_writes"])):
+        a, b = old["db_writes"].get(statement, 0), new["db_writes"].get(statement, 0)
+        print(f"  {statement:<10} {a:>8.0f} → {b:<8.0f}{change(a, b)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("capture")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--webhook-secret", default="replay", help="the instance's CREEM_WEBHOOK_SECRET")
+    parser.add_argument("--report", help="write the report (JSON) here")
+    parser.add_argument("--compare", help="a previous report to compare against")
+    args = parser.parse_args()
+
+    records = load(args.capture, args.limit)
+    if not records:
+        sys.exit("no requests in the capture")
+    span = records[-1]["t"] - records[0]["t"]
+    print(f"replaying {len(records)} requests captured over {span:.0f} s"
+          + (f" at {args.speed:g}x" if args.speed > 0 else " as fast as possible"))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.target, timeout=300, limits=limits) as client:
+        writes_before = await db_writes(client)
+        replayer = Replayer(client, args.webhook_secret)
+        started = time.monotonic()
+        await replayer.run(records, args.speed, args.concurrency)
+        elapsed = time.monotonic() - started
+        writes_after = await db_writes(client)
+
+    report = {
+        "requests": len(records),
+        "seconds": round(elapsed, 1),
+        "endpoints": summarize(replayer.latencies, replayer.statuses),
+        "db_writes": {
+            statement: writes_after[statement] - writes_before.get(statement, 0)
+            for statement in writes_after
+        },
+        "captured": captured_summary(records),
+    }
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, f"{args.compare} → this replay")
+    else:
+        compare({"endpoints": report["captured"], "db_writes": {}}, report, "captured → replayed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,48 +1,140 @@
+import asyncio
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
 import pytest
 import pytest_asyncio
+import uvicorn
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
+import app.models  # noqa: F401  Register every table on Base.metadata
 from app.main import app
-from app.database import Base, get_db
+from app.config import get_settings
+from app.database import Base, get_db, get_sessionmaker
+from app.metrics import stop_metrics_cache
+from app.services import llm_service
+from app.services.kv_store import get_kv_store
+from app.services.similarity import get_concept_index
+from benchmarks.fake_llm_proxy import create_app as create_fake_llm_proxy
+
+
+@pytest.fixture(scope="session")
+def db_template(tmp_path_factory):
+    """
+    A database with the current schema, built once per process.
+
+    Each test gets its own copy in its own directory, so tests share no
+    database state, in one process or across pytest-xdist workers.
+    """
+    path = tmp_path_factory.mktemp("db") / "template.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return path
+
+
+@pytest_asyncio.fixture
+async def db_engine(db_template, tmp_path):
+    """Engine on a fresh copy of the template database."""
+    path = tmp_path / "test.db"
+    with closing(sqlite3.connect(db_template)) as source, closing(sqlite3.connect(path)) as target:
+        source.backup(target)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    yield engine
+    await engine.dispose()
 
-# Test database
-TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-test_engine = create_async_engine(TEST_DATABASE_URL, echo=False)
-test_async_session = async_sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+@pytest.fixture
+def db_sessionmaker(db_engine):
+    """Sessions on the test database, for tests that need several connections."""
+    return async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
 
 
 @pytest_asyncio.fixture
-async def db_session():
+async def db_session(db_sessionmaker):
     """Create test database session."""
-    async with test_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    async with test_async_session() as session:
+    async with db_sessionmaker() as session:
         yield session
-    
-    async with test_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+
+
+@pytest.fixture
+def race(db_sessionmaker):
+    """
+    Run `count` copies of `call(session)`, each on its own connection.
+
+    Every racer opens its session first and they start together, so the
+    calls overlap as much as the database allows. Returns their results
+    (or exceptions) in order.
+    """
+    async def run(count: int, call):
+        barrier = asyncio.Barrier(count)
+
+        async def racer():
+            async with db_sessionmaker() as session:
+                await barrier.wait()
+                return await call(session)
+
+        return await asyncio.gather(*(racer() for _ in range(count)), return_exceptions=True)
+
+    return run
 
 
 @pytest_asyncio.fixture
-async def client(db_session):
+async def client(db_session, db_sessionmaker):
     """Create test client with test database."""
     async def override_get_db():
         yield db_session
-    
+
     app.dependency_overrides[get_db] = override_get_db
-    
+    app.dependency_overrides[get_sessionmaker] = lambda: db_sessionmaker
+    await get_kv_store().clear()
+    get_concept_index().clear()
+    stop_metrics_cache()
+
     async with AsyncClient(
         transport=ASGITransport(app=app),
         base_url="http://test"
     ) as ac:
         yield ac
-    
+
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(scope="session")
+def fake_llm_proxy_url():
+    """The fake LLM proxy (benchmarks/fake_llm_proxy.py) on a local socket, without latency."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    host, port = sock.getsockname()
+    server = uvicorn.Server(uvicorn.Config(create_fake_llm_proxy(latency=0, jitter=0), ws="none", log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("fake LLM proxy failed to start")
+        time.sleep(0.01)
+    yield f"http://{host}:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+    sock.close()
+
+
+@pytest_asyncio.fixture
+async def fake_llm_proxy(fake_llm_proxy_url, monkeypatch):
+    """Point the LLM client at the fake proxy for one test."""
+    monkeypatch.setattr(get_settings(), "llm_proxy_url", fake_llm_proxy_url)
+    monkeypatch.setattr(get_settings(), "llm_proxy_key", "test")
+    # The HTTP client is bound to the event loop it was created on; each test has its own
+    monkeypatch.setattr(llm_service, "_http_client", None)
+    yield fake_llm_proxy_url
+    await llm_service.close_http_client()
+
+
 @pytest.fixture
 def device_id():
     """Test device ID."""
@@ -0,0 +1,60 @@
+import pytest
+
+from app.config import get_settings
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(get_settings(), "admin_api_key", "secret")
+    return {"X-Admin-Key": "secret"}
+
+
+@pytest.mark.asyncio
+async def test_admin_requires_key(client, admin):
+    """Test that admin endpoints reject a missing or wrong key."""
+    response = await client.get("/api/v1/admin/tokens/a")
+    assert response.status_code == 403
+    response = await client.post("/api/v1/admin/grants?batch_id=x", headers={"X-Admin-Key": "nope"}, content=b"a,1")
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_grant_upload_and_history(client, admin):
+    """Test granting from an uploaded CSV and reading a device's ledger back."""
+    body = b"device_id,amount,reason\nsupport-1,5,refund\nsupport-2,2\nsupport-1,5\nbad\n"
+    response = await client.post(
+        "/api/v1/admin/grants?batch_id=ticket-7",
+        headers={**admin, "Content-Type": "text/csv"},
+        content=body,
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["granted"], report["tokens"], report["duplicates"], report["invalid"]) == (2, 7, 1, 1)
+
+    response = await client.get("/api/v1/admin/tokens/support-1", headers=admin)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["tokens_remaining"] == 5
+    assert data["ledger"][0]["kind"] == "grant"
+    assert data["ledger"][0]["batch_id"] == "ticket-7"
+    assert data["ledger"][0]["reason"] == "refund"
+
+    response = await client.get("/api/v1/admin/tokens/nobody", headers=admin)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_archived_vision_lookup(client, admin, monkeypatch, tmp_path):
+    """Test reading an archived vision back by concept."""
+    from app.services import vision_archive
+    
+    monkeypatch.setattr(vision_archive, "_archive", vision_archive.VisionArchive(str(tmp_path), codec="zlib"))
+    vision_archive.get_vision_archive().append("tiktok", "en", b'{"title":"Soon"}')
+    try:
+        response = await client.get("/api/v1/admin/archive/visions?concept=TikTok", headers=admin)
+        assert response.status_code == 200
+        assert response.json()["vision"] == {"title": "Soon"}
+        response = await client.get("/api/v1/admin/archive/visions?concept=TikTok&language=de", headers=admin)
+        assert response.status_code == 404
+    finally:
+        vision_archive.close_vision_archive()
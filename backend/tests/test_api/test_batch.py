@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import orjson
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.api.v1.schemas import VisualizeRequest
+from app.services.batch_service import item_costs, plan_jobs, stream_batch
+from app.services.token_service import add_tokens, get_token_status, reserve_generations, use_generation
+
+
+def parse_ndjson(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_plan_jobs_packs_lite_concepts_per_language():
+    """Test that lite jobs are grouped by language and chunked."""
+    items = [VisualizeRequest(concept=f"c{i}", language="en" if i < 7 else "de") for i in range(9)]
+    
+    assert len(plan_jobs(items, lite=False, pack_size=5)) == 9
+    
+    jobs = plan_jobs(items, lite=True, pack_size=5)
+    assert [len(job) for job in jobs] == [5, 2, 2]
+    assert {item.language for _, item in jobs[2]} == {"de"}
+
+
+@pytest.mark.asyncio
+async def test_batch_requires_device_id(client):
+    """Test that batch requires device ID."""
+    response = await client.post(
+        "/api/v1/visualize/batch",
+        json={"items": [{"concept": "iPhone"}]}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_batch_requires_enough_tokens(client, device_id):
+    """Test that the whole batch must be covered up front."""
+    response = await client.post(
+        "/api/v1/visualize/batch",
+        headers={"X-Device-Id": device_id},
+        json={"items": [{"concept": "iPhone"}, {"concept": "Tesla"}]}
+    )
+    assert response.status_code == 402
+
+
+@pytest.mark.asyncio
+async def test_batch_streams_results_and_refunds_failures(client, db_session, device_id):
+    """Test NDJSON results, one reservation, and one refund for failures."""
+    await use_generation(db_session, device_id)
+    await add_tokens(db_session, device_id, 5)
+    
+    async def generate(concept, language):
+        if concept == "broken":
+            raise Exception("upstream error")
+        return {"title": f"Future {concept}", "sections": {}, "key_changes": []}
+    
+    with patch("app.services.batch_service.generate_future_vision", side_effect=generate):
+        response = await client.post(
+            "/api/v1/visualize/batch",
+            headers={"X-Device-Id": device_id},
+            json={"items": [
+                {"concept": "iPhone", "language": "en"},
+                {"concept": "broken", "language": "en"},
+                {"concept": "Tesla", "language": "de"},
+            ]}
+        )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = parse_ndjson(response.text)
+    results = {line["index"]: line for line in lines[:-1]}
+    assert results[0]["vision"]["title"] == "Future iPhone"
+    assert "error" in results[1]
+    assert results[2]["language"] == "de"
+    assert lines[-1] == {
+        "done": True,
+        "succeeded": 2,
+        "failed": 1,
+        "is_free_trial": False,
+        "remaining_tokens": 3,
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_lite_packs_concepts(client, device_id, db_session):
+    """Test that lite batches make one upstream call per pack."""
+    await add_tokens(db_session, device_id, 10)
+    
+    async def generate_lite(concepts, language):
+        return [{"title": concept, "year": 2036, "summary": "", "key_changes": []} for concept in concepts]
+    
+    with patch("app.services.batch_service.generate_lite_visions", new_callable=AsyncMock) as mock:
+        mock.side_effect = generate_lite
+        response = await client.post(
+            "/api/v1/visualize/batch",
+            headers={"X-Device-Id": device_id},
+            json={"format": "lite", "items": [{"concept": f"c{i}"} for i in range(7)]}
+        )
+    
+    lines = parse_ndjson(response.text)
+    assert mock.await_count == 2
+    assert sorted(line["vision"]["title"] for line in lines[:-1]) == [f"c{i}" for i in range(7)]
+    assert lines[-1]["is_free_trial"] is True
+    assert lines[-1]["remaining_tokens"] == 4
+
+
+@pytest.mark.asyncio
+async def test_batch_failed_free_trial_is_returned(client, db_session, device_id):
+    """Test that a failed item covered by the free trial gives back the trial, not a token."""
+    with patch("app.services.batch_service.generate_future_vision", side_effect=Exception("upstream error")):
+        response = await client.post(
+            "/api/v1/visualize/batch",
+            headers={"X-Device-Id": device_id},
+            json={"items": [{"concept": "iPhone"}]}
+        )
+    
+    assert parse_ndjson(response.text)[-1]["remaining_tokens"] == 0
+    status = await get_token_status(db_session, device_id)
+    assert status["free_trial_available"] is True
+    assert status["tokens_remaining"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_disconnect_refunds_undelivered(db_session, db_sessionmaker, device_id):
+    """Test that a client leaving mid-stream gets back the tokens for what it didn't receive."""
+    await use_generation(db_session, device_id)  # Free trial
+    await add_tokens(db_session, device_id, 3)
+    items = [VisualizeRequest(concept=concept) for concept in ("fast", "slow", "slower")]
+    costs = item_costs(items, lite=False)
+    _, _, remaining = await reserve_generations(db_session, device_id, len(items), costs)
+    assert remaining == 0
+    
+    async def generate(concept, language):
+        if concept != "fast":
+            await asyncio.Event().wait()  # Never finishes
+        return {"title": concept}
+    
+    with patch("app.services.batch_service.generate_future_vision", side_effect=generate):
+        stream = stream_batch(db_sessionmaker, device_id, items, False, costs, False, remaining)
+        first = orjson.loads(await stream.__anext__())
+        await stream.aclose()  # The client disconnected
+    
+    assert first["concept"] == "fast"
+    db_session.expire_all()
+    assert (await get_token_status(db_session, device_id))["tokens_remaining"] == 2
@@ -27,3 +27,155 @@ async def test_metrics(client):
     response = await client.get("/metrics")
     assert response.status_code == 200
     assert "http_requests_total" in response.text
+
+
+@pytest.mark.asyncio
+async def test_metrics_negotiation(client):
+    """Test that scrapers get gzip and OpenMetrics when they ask for them."""
+    response = await client.get("/metrics", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"].startswith("text/plain")
+    
+    response = await client.get(
+        "/metrics",
+        headers={"Accept": "application/openmetrics-text; version=0.0.1", "Accept-Encoding": "gzip"},
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("application/openmetrics-text")
+    # httpx has already gunzipped it
+    assert response.text.rstrip().endswith("# EOF")
+
+
+@pytest.mark.asyncio
+async def test_metrics_served_from_cache(client, monkeypatch):
+    """Test that scrapes are served from the background rendering, refreshed every interval."""
+    import asyncio
+    from app import metrics
+    
+    cache = metrics.MetricsCache(interval=0.05)
+    monkeypatch.setattr(metrics, "_metrics_cache", cache)
+    try:
+        first = (await client.get("/metrics")).text
+        metrics.programmatic_pages.labels(tool=metrics.TOOL_NAME).set(77)
+        assert (await client.get("/metrics")).text == first
+        
+        await asyncio.sleep(0.2)
+        refreshed = (await client.get("/metrics")).text
+        assert 'programmatic_pages_count{tool="future-visualizer"} 77.0' in refreshed
+        assert "metrics_render_seconds_count" in refreshed
+    finally:
+        cache.stop()
+
+
+@pytest.mark.asyncio
+async def test_unknown_paths_share_a_label(client):
+    """Test that paths outside the app's routes don't each get their own series."""
+    await client.get("/wp-login.php")
+    await client.get("/.env")
+    metrics = (await client.get("/metrics")).text
+    assert 'endpoint="/.env"' not in metrics
+    assert 'endpoint="other"' in metrics
+
+
+def test_label_allowlist():
+    """Test that a label admits its listed values and the first few others only."""
+    from app.metrics import LabelAllowlist
+    
+    labels = LabelAllowlist(["Googlebot"], limit=1)
+    assert labels("Googlebot") == "Googlebot"
+    assert labels("/pricing") == "/pricing"
+    assert labels("/pricing") == "/pricing"
+    assert labels("/blog/1") == "other"
+
+
+@pytest.mark.asyncio
+async def test_programmatic_pages_update(client, monkeypatch):
+    """Test that the SEO generator can report its page count with the admin key."""
+    from app.config import get_settings
+    monkeypatch.setattr(get_settings(), "admin_api_key", "secret")
+    
+    response = await client.put("/metrics/programmatic-pages", json={"count": 5123})
+    assert response.status_code == 403
+    
+    response = await client.put(
+        "/metrics/programmatic-pages",
+        json={"count": 5123},
+        headers={"X-Admin-Key": "secret"},
+    )
+    assert response.status_code == 200
+    metrics = (await client.get("/metrics")).text
+    assert 'programmatic_pages_count{tool="future-visualizer"} 5123.0' in metrics
+
+
+def test_programmatic_pages_follow_the_latest_report(tmp_path):
+    """Test that with several workers, a lower page count replaces a higher one."""
+    import os
+    import subprocess
+    import sys
+    from prometheus_client import CollectorRegistry, multiprocess
+    import app
+    
+    backend_dir = os.path.dirname(os.path.dirname(app.__file__))
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    for count in (900, 40):  # Two workers, one after the other
+        subprocess.run(
+            [sys.executable, "-c", f"from app import metrics; metrics.programmatic_pages.labels(tool='t').set({count})"],
+            cwd=backend_dir,
+            env=env,
+            check=True,
+        )
+    
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value("programmatic_pages_count", {"tool": "t"}) == 40
+
+
+@pytest.mark.asyncio
+async def test_ready_requires_current_schema(client, db_session):
+    """Test that readiness waits for a stamped schema, unlike /health."""
+    from app.database import SCHEMA_VERSION, stamp_schema_version
+    
+    response = await client.get("/ready")
+    assert response.status_code == 503
+    
+    await stamp_schema_version(await db_session.connection())
+    await db_session.commit()
+    
+    response = await client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["schema_version"] == SCHEMA_VERSION
+
+
+@pytest.mark.asyncio
+async def test_init_db_skips_current_schema(monkeypatch, tmp_path):
+    """Test that init_db only runs create_all until the schema version is stamped."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app import database
+    
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(database, "_engine", engine)
+    
+    create_all = database.Base.metadata.create_all
+    calls = []
+    
+    def spy(*args, **kwargs):
+        calls.append(1)
+        return create_all(*args, **kwargs)
+    
+    monkeypatch.setattr(database.Base.metadata, "create_all", spy)
+    try:
+        await database.init_db()
+        await database.init_db()
+        assert calls == [1]
+    finally:
+        await engine.dispose()
+
+
+def test_database_url_must_be_sqlite():
+    """Test that a non-SQLite DATABASE_URL is rejected when settings load."""
+    from pydantic import ValidationError
+    from app.config import Settings
+    
+    with pytest.raises(ValidationError, match="SQLite"):
+        Settings(database_url="postgresql+asyncpg://db/app")
+    assert Settings(database_url="sqlite+aiosqlite:///:memory:").database_url == "sqlite+aiosqlite:///:memory:"
@@ -1,5 +1,11 @@
+from datetime import datetime, timedelta
+
 import pytest
 
+from app.models.payment import PaymentTransaction
+from app.services.reconciliation import reconcile_pending_payments
+from app.services.token_service import get_token_status
+
 
 @pytest.mark.asyncio
 async def test_get_products(client):
@@ -41,3 +47,41 @@ async def test_webhook_invalid_signature(client):
     # Should be 401 with invalid signature when secret is set
     # In test mode without secret, it should accept
     assert response.status_code in [200, 401]
+
+
+class CompletedCreemClient:
+    """Stand-in for CreemClient reporting every checkout completed."""
+
+    async def get_checkout_statuses(self, checkout_ids):
+        return dict.fromkeys(checkout_ids, "completed")
+
+
+@pytest.mark.asyncio
+async def test_webhook_after_reconciliation_grants_once(client, db_session, db_sessionmaker):
+    """Test that a webhook for a checkout reconciliation already settled grants nothing."""
+    transaction = PaymentTransaction(
+        checkout_id="chk-1", device_id="buyer", product_sku="starter",
+        amount_cents=499, tokens_granted=5, status="pending",
+        created_at=datetime.utcnow() - timedelta(hours=2),
+    )
+    db_session.add(transaction)
+    await db_session.commit()
+
+    # Reconciliation settles it on another connection, while the webhook's
+    # session still holds the transaction as pending
+    async with db_sessionmaker() as other:
+        report = await reconcile_pending_payments(
+            other, CompletedCreemClient(), older_than_minutes=60, expire_after_hours=48
+        )
+    assert report["completed"] == 1
+
+    for _ in range(2):
+        response = await client.post(
+            "/api/v1/webhook",
+            json={"type": "checkout.completed", "data": {"id": "chk-1", "metadata": {}}},
+        )
+        assert response.status_code == 200
+
+    status = await get_token_status(db_session, "buyer")
+    assert status["tokens_remaining"] == 5
+    assert status["tokens_purchased"] == 5
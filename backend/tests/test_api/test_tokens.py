@@ -41,3 +41,53 @@ async def test_token_status_persists(client, device_id):
     
     # Same data
     assert response1.json() == response2.json()
+
+
+@pytest.mark.asyncio
+async def test_token_status_rate_limited(client, device_id):
+    """Test that a device over its limit gets 429 with Retry-After."""
+    from app.services.rate_limiter import get_rate_limiter, Limit
+    
+    limiter = get_rate_limiter()
+    original = limiter.routes
+    limiter.routes = {"/api/v1/tokens/status": {"device": Limit(rate=1 / 60, burst=1)}}
+    try:
+        response1 = await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id})
+        assert response1.status_code == 200
+        
+        response2 = await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id})
+        assert response2.status_code == 429
+        assert int(response2.headers["Retry-After"]) > 0
+        assert response2.json()["detail"]["code"] == "rate_limited"
+    finally:
+        limiter.routes = original
+
+
+@pytest.mark.asyncio
+async def test_spoofed_forwarding_headers_share_the_ip_bucket(client, monkeypatch):
+    """Test that clients can't get a fresh per-IP bucket by rotating forwarding headers."""
+    from app.config import get_settings
+    from app.services.rate_limiter import get_rate_limiter, Limit
+    
+    limiter = get_rate_limiter()
+    original = limiter.routes
+    limiter.routes = {"/api/v1/tokens/status": {"ip": Limit(rate=1 / 60, burst=1)}}
+    
+    async def status(device, forwarded):
+        response = await client.get(
+            "/api/v1/tokens/status",
+            headers={"X-Device-Id": device, "X-Forwarded-For": forwarded},
+        )
+        return response.status_code
+    
+    try:
+        # Not behind a trusted proxy: the headers are ignored
+        assert await status("a", "198.51.100.1") == 200
+        assert await status("b", "198.51.100.2") == 429
+        
+        # Behind nginx only its own (rightmost) entry counts
+        monkeypatch.setattr(get_settings(), "rate_limit_trust_proxy", True)
+        assert await status("c", "198.51.100.3, 203.0.113.7") == 200
+        assert await status("d", "198.51.100.4, 203.0.113.7") == 429
+    finally:
+        limiter.routes = original
@@ -94,3 +94,289 @@ async def test_visualize_second_request_requires_payment(client, device_id):
             json={"concept": "Twitter", "language": "en"}
         )
         assert response2.status_code == 402
+
+
+@pytest.mark.asyncio
+async def test_visualize_reuses_cached_vision(client):
+    """Test that a cached vision is served with this request's token fields."""
+    mock_result = {
+        "title": "The Future of Netflix",
+        "year": 2036,
+        "summary": "Test",
+        "sections": {},
+        "key_changes": ["Change 1"],
+    }
+    
+    with patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        mock.return_value = mock_result
+        
+        response1 = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": "device-a"},
+            json={"concept": "Netflix", "language": "en"}
+        )
+        response2 = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": "device-b"},
+            json={"concept": "netflix", "language": "en"}
+        )
+        
+        assert mock.await_count == 1
+        assert response2.status_code == 200
+        assert response2.headers["content-type"] == "application/json"
+        assert response2.json() == {**response1.json(), "is_free_trial": True, "remaining_tokens": 0}
+
+
+@pytest.fixture
+def llm_down(monkeypatch):
+    """LLM circuit breaker tripped for the duration of a test."""
+    from app.services import circuit_breaker
+    breaker = circuit_breaker.CircuitBreaker("llm_proxy", failure_threshold=1, cooldown=60)
+    breaker.record_failure()
+    monkeypatch.setattr(circuit_breaker, "_llm_breaker", breaker)
+    return breaker
+
+
+@pytest.mark.asyncio
+async def test_visualize_degraded_serves_template_for_free(client, device_id, llm_down):
+    """Test that with the LLM down, a template vision comes back flagged and uncharged."""
+    with patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Netflix", "language": "en"}
+        )
+        mock.assert_not_called()
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["degraded"] is True
+    assert data["title"] == "The Future of Netflix"
+    
+    status = (await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id})).json()
+    assert status["free_trial_available"] is True
+
+
+@pytest.mark.asyncio
+async def test_visualize_degraded_prefers_cached_vision(client, device_id, llm_down):
+    """Test that a cached vision is served in degraded mode when one exists."""
+    from app.services.vision_cache import encode_vision, store_vision
+    await store_vision("Netflix", "en", encode_vision({"title": "Streaming in 2036"}, "Netflix"))
+    
+    response = await client.post(
+        "/api/v1/visualize",
+        headers={"X-Device-Id": device_id},
+        json={"concept": "netflix app", "language": "en"}
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Streaming in 2036"
+    assert response.json()["degraded"] is True
+
+
+@pytest.mark.asyncio
+async def test_visualize_trips_breaker_and_degrades(client, device_id, monkeypatch):
+    """Test that the failure which trips the breaker is answered in degraded mode and refunded."""
+    from app.services import circuit_breaker, llm_service
+    monkeypatch.setattr(
+        circuit_breaker, "_llm_breaker", circuit_breaker.CircuitBreaker("llm_proxy", failure_threshold=1)
+    )
+    
+    class DownClient:
+        async def post(self, *args, **kwargs):
+            raise ConnectionError("proxy unreachable")
+    
+    monkeypatch.setattr(llm_service, "get_http_client", lambda: DownClient())
+    response = await client.post(
+        "/api/v1/visualize",
+        headers={"X-Device-Id": device_id},
+        json={"concept": "Zoom", "language": "en"}
+    )
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True
+    assert circuit_breaker.get_llm_breaker().is_open
+
+
+@pytest.mark.asyncio
+async def test_visualize_waits_for_slow_generation(client, device_id):
+    """Test that a slow generation isn't mistaken for a client disconnect."""
+    import asyncio
+    
+    async def slow(concept, language):
+        await asyncio.sleep(0.2)
+        return {"title": "Slow"}
+    
+    with patch("app.api.v1.visualize.generate_future_vision", new=slow):
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id, "X-Deadline-Ms": "5000"},
+            json={"concept": "Slack", "language": "en"}
+        )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Slow"
+
+
+@pytest.mark.asyncio
+async def test_visualize_deadline_cancels_and_refunds(client, device_id):
+    """Test that a passed X-Deadline-Ms cancels the generation and gives the trial back."""
+    import asyncio
+    cancelled = asyncio.Event()
+    
+    async def hang(concept, language):
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+    
+    with patch("app.api.v1.visualize.generate_future_vision", new=hang):
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id, "X-Deadline-Ms": "100"},
+            json={"concept": "Figma", "language": "en"}
+        )
+    assert response.status_code == 504
+    await asyncio.wait_for(cancelled.wait(), 1)
+    
+    status = (await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id})).json()
+    assert status["free_trial_available"] is True
+    assert status["tokens_purchased"] == 0
+
+
+@pytest.mark.asyncio
+async def test_visualize_rejects_bad_deadline(client, device_id):
+    """Test that a malformed deadline is rejected before anything is charged."""
+    response = await client.post(
+        "/api/v1/visualize",
+        headers={"X-Device-Id": device_id, "X-Deadline-Ms": "soon"},
+        json={"concept": "Figma", "language": "en"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_visualize_fields_charges_tier(client, db_session, device_id, monkeypatch):
+    """Test that `fields` shapes the prompt and response and sets the token cost."""
+    from app.config import get_settings
+    from app.services.token_service import add_tokens, use_generation
+    
+    monkeypatch.setattr(get_settings(), "generation_tier_costs", '{"brief": 1, "sections": 2, "full": 3}')
+    await use_generation(db_session, device_id)
+    await add_tokens(db_session, device_id, 5)
+    
+    with patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        mock.return_value = {
+            "title": "The Future of Vinyl",
+            "summary": "Test",
+            "sections": {"society": {"title": "S", "content": "C"}},
+        }
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Vinyl", "fields": ["sections.society"]}
+        )
+        assert mock.await_args.kwargs["fields"] == ("society",)
+        assert response.status_code == 200
+        assert response.json() == {
+            "title": "The Future of Vinyl",
+            "year": 2036,
+            "sections": {"society": {"title": "S", "content": "C"}},
+            "is_free_trial": False,
+            "remaining_tokens": 3,
+            "degraded": False,
+        }
+        
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Vinyl", "fields": ["summary", "sections", "key_changes"]}
+        )
+        assert "fields" not in mock.await_args.kwargs
+        assert response.json()["remaining_tokens"] == 0  # Everything is the full tier
+    
+    response = await client.post(
+        "/api/v1/visualize",
+        headers={"X-Device-Id": device_id},
+        json={"concept": "Vinyl", "fields": ["bogus"]}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_visualize_through_llm_proxy(client, fake_llm_proxy, device_id):
+    """Test the prompt, the upstream call and parsing against the fake proxy."""
+    response = await client.post(
+        "/api/v1/visualize",
+        headers={"X-Device-Id": device_id},
+        json={"concept": "Polaroid", "fields": ["summary", "sections.wildcard"]}
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "The Future of Polaroid"
+    assert set(data) == {"title", "year", "summary", "sections", "is_free_trial", "remaining_tokens", "degraded"}
+    assert list(data["sections"]) == ["wildcard"]
+
+
+@pytest.mark.asyncio
+async def test_visualize_reports_the_trial_the_write_used(client, db_session, device_id):
+    """Test that a stale free-trial read doesn't decide the response or the refund."""
+    from app.services.token_service import add_tokens, get_token_status, use_generation
+    
+    await use_generation(db_session, device_id)
+    await add_tokens(db_session, device_id, 5)
+    # Another request from the device took the free trial after this one checked
+    stale_check = AsyncMock(return_value=(True, True, 5))
+    
+    with patch("app.api.v1.visualize.can_use_generation", stale_check), \
+            patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        mock.return_value = {"title": "The Future of Tea", "summary": "Test"}
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Tea", "fields": ["summary"]}
+        )
+        assert response.status_code == 200
+        assert response.json()["is_free_trial"] is False
+        assert response.json()["remaining_tokens"] == 4
+        
+        mock.side_effect = RuntimeError("upstream failed")
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Coffee", "fields": ["summary"]}
+        )
+        assert response.status_code == 500
+    
+    status = await get_token_status(db_session, device_id)
+    assert status["tokens_remaining"] == 4
+    assert status["free_trial_used"] is True
+
+
+@pytest.mark.asyncio
+async def test_visualize_tier_costs_gate_requests(client, db_session, device_id, monkeypatch):
+    """Test that with tiered costs, a balance too small for a full vision still buys a brief one."""
+    from app.config import get_settings
+    from app.services.token_service import add_tokens, get_token_status, use_generation
+    
+    monkeypatch.setattr(get_settings(), "generation_tier_costs", '{"brief": 1, "sections": 2, "full": 3}')
+    await use_generation(db_session, device_id)
+    await add_tokens(db_session, device_id, 2)
+    
+    with patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        mock.return_value = {"title": "The Future of Radio", "summary": "Test"}
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Radio"}
+        )
+        assert response.status_code == 402
+        assert not mock.await_count
+        
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id},
+            json={"concept": "Radio", "fields": ["summary"]}
+        )
+        assert response.status_code == 200
+        assert response.json()["remaining_tokens"] == 1
+    
+    assert (await get_token_status(db_session, device_id))["tokens_remaining"] == 1
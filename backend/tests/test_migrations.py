@@ -0,0 +1,112 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import database, migrations
+from app.models.token import GenerationToken, device_key
+from app.services.ledger_service import rebuild_balance
+
+# The schema before versioning (version 1), as create_all made it
+BASELINE_SCHEMA = [
+    "CREATE TABLE generation_tokens (id INTEGER NOT NULL, device_id VARCHAR(255) NOT NULL,"
+    " tokens_remaining INTEGER, tokens_purchased INTEGER, free_trial_used BOOLEAN,"
+    " created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP),"
+    " PRIMARY KEY (id))",
+    "CREATE INDEX ix_generation_tokens_device_id ON generation_tokens (device_id)",
+    "CREATE TABLE payment_transactions (id INTEGER NOT NULL, checkout_id VARCHAR(255) NOT NULL,"
+    " device_id VARCHAR(255) NOT NULL, product_sku VARCHAR(100) NOT NULL, amount_cents INTEGER NOT NULL,"
+    " currency VARCHAR(10), status VARCHAR(50), tokens_granted INTEGER,"
+    " created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), completed_at DATETIME,"
+    " PRIMARY KEY (id), UNIQUE (checkout_id))",
+    "CREATE INDEX ix_payment_transactions_device_id ON payment_transactions (device_id)",
+    "INSERT INTO generation_tokens (device_id, tokens_remaining, tokens_purchased, free_trial_used)"
+    " VALUES ('a', 3, 5, 0), ('a', 2, 0, 1), ('b', 0, 0, 0), ('c', 1, 1, 1)",
+]
+
+
+@pytest_asyncio.fixture
+async def baseline_engine(monkeypatch, tmp_path):
+    """The app's engine on a version 1 database with server-default timestamps."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_sessionmaker", None)
+    monkeypatch.setattr(migrations, "CHUNK_SIZE", 2)
+    async with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            await conn.exec_driver_sql(statement)
+    yield engine
+    await engine.dispose()
+
+
+async def token_rows(engine):
+    async with engine.connect() as conn:
+        return [tuple(row) for row in (await conn.execute(
+            select(
+                GenerationToken.device_key,
+                GenerationToken.device_id,
+                GenerationToken.tokens_remaining,
+                GenerationToken.tokens_purchased,
+                GenerationToken.free_trial_used,
+            ).order_by(GenerationToken.device_id)
+        )).all()]
+
+
+MERGED = [
+    (device_key("a"), "a", 5, 5, True),
+    (device_key("b"), "b", 0, 0, False),
+    (device_key("c"), "c", 1, 1, True),
+]
+
+
+@pytest.mark.asyncio
+async def test_init_db_upgrades_baseline_database(baseline_engine):
+    """Test that a version 1 database upgrades, merging rows that share a device id."""
+    await database.init_db()
+    
+    async with baseline_engine.connect() as conn:
+        assert await database.get_schema_version(conn) == database.SCHEMA_VERSION
+        created = (await conn.execute(select(GenerationToken.created_at))).scalars().all()
+    assert await token_rows(baseline_engine) == MERGED
+    assert all(created)
+    # Balances from before the ledger are the opening snapshots
+    async with database.get_sessionmaker()() as db:
+        assert await rebuild_balance(db, "a") == {
+            "tokens_remaining": 5, "tokens_purchased": 5, "free_trial_used": True,
+        }
+
+
+@pytest.mark.asyncio
+async def test_failed_migration_rolls_back(baseline_engine, monkeypatch):
+    """Test that a migration failing halfway leaves the old schema, and a retry succeeds."""
+    ledger_snapshots = migrations.MIGRATIONS[5]
+    
+    def fail(conn):
+        raise RuntimeError("disk full")
+    
+    monkeypatch.setitem(migrations.MIGRATIONS, 5, fail)
+    with pytest.raises(RuntimeError):
+        await database.init_db()
+    async with baseline_engine.connect() as conn:
+        assert await database.get_schema_version(conn) == 1
+        assert not await conn.run_sync(lambda c: inspect(c).has_table("generation_tokens_v1"))
+    
+    monkeypatch.setitem(migrations.MIGRATIONS, 5, ledger_snapshots)
+    await database.init_db()
+    assert await token_rows(baseline_engine) == MERGED
+
+
+@pytest.mark.asyncio
+async def test_unique_device_keys_resumes_after_rename(baseline_engine):
+    """Test that a copy interrupted after the rename resumes instead of renaming again."""
+    async with baseline_engine.begin() as conn:
+        await conn.exec_driver_sql("ALTER TABLE generation_tokens RENAME TO generation_tokens_v1")
+        await conn.run_sync(GenerationToken.__table__.create)
+        await conn.exec_driver_sql(
+            "INSERT INTO generation_tokens (device_key, device_id, tokens_remaining, tokens_purchased,"
+            " free_trial_used) VALUES (?, 'a', 5, 5, 1)",
+            (device_key("a"),),
+        )
+    
+    await database.init_db()
+    assert await token_rows(baseline_engine) == MERGED
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from app.services.cancellation import RequestAbandoned, parse_deadline, until_abandoned
+
+
+class FakeRequest:
+    """Request whose client disconnects after `delay` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def receive(self):
+        await asyncio.sleep(self.delay)
+        return {"type": "http.disconnect"}
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_work():
+    """Test that a disconnect cancels the awaited work and reports why."""
+    work = asyncio.ensure_future(asyncio.sleep(10))
+    with pytest.raises(RequestAbandoned) as abandoned:
+        await until_abandoned(FakeRequest(0.01), work)
+    assert abandoned.value.reason == "disconnect"
+    assert work.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_finished_work_wins():
+    """Test that work finishing first returns its result."""
+    async def work():
+        return 42
+    
+    assert await until_abandoned(FakeRequest(10), work(), parse_deadline("1000")) == 42
+
+
+def test_parse_deadline_rejects_nonsense():
+    """Test that only positive millisecond budgets are accepted."""
+    assert parse_deadline(None) is None
+    for header in ("0", "-5", "soon"):
+        with pytest.raises(ValueError):
+            parse_deadline(header)
@@ -0,0 +1,71 @@
+import time
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.degraded import match_industry, template_vision
+from app.services.vision_cache import encode_vision
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """Test that only consecutive failures trip the breaker."""
+    breaker = CircuitBreaker("test", failure_threshold=3, cooldown=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_breaker_probes_once_per_cooldown():
+    """Test that one probe is let through after the cooldown, and its result decides."""
+    breaker = CircuitBreaker("test", failure_threshold=1, cooldown=30)
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 31
+    
+    assert breaker.allow()  # The probe
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    
+    breaker.opened_at = time.monotonic() - 31
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_template_vision_is_a_valid_vision():
+    """Test that the template fills every section and picks an industry from the concept."""
+    vision = template_vision("Peloton")
+    assert set(vision["sections"]) == {"technology", "experience", "society", "wildcard"}
+    assert "Peloton" in vision["sections"]["technology"]["content"]
+    assert match_industry("Peloton") == "healthcare"
+    assert match_industry("Some New Thing") == "tech"
+    encode_vision(vision, "Peloton")
+
+
+def test_stopped_worker_doesnt_hold_the_breaker_open(tmp_path):
+    """Test that with several workers, a stopped worker's open breaker drops out of /metrics."""
+    import os
+    import subprocess
+    import sys
+    from prometheus_client import CollectorRegistry, multiprocess
+    import app
+    
+    backend_dir = os.path.dirname(os.path.dirname(app.__file__))
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    script = (
+        "from app import metrics; metrics.llm_circuit_open.labels(tool='t', upstream='u').set({open}); "
+        "{stop}"
+    )
+    # One worker saw the upstream down, then stopped; another sees it up
+    for code in (script.format(open=1, stop="metrics.mark_worker_stopped()"), script.format(open=0, stop="")):
+        subprocess.run([sys.executable, "-c", code], cwd=backend_dir, env=env, check=True)
+    
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value("llm_circuit_open", {"tool": "t", "upstream": "u"}) == 0
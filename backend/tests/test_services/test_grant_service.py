@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.models.ledger import TokenLedgerEntry
+from app.services import grant_service
+from app.services.grant_service import apply_grants, parse_grant
+from app.services.token_service import add_tokens, get_token_status
+
+
+async def lines(*items: str):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_apply_grants_csv(db_session, monkeypatch):
+    """Test that a CSV batch grants each device once, across chunks."""
+    monkeypatch.setattr(grant_service, "CHUNK_SIZE", 2)
+    await add_tokens(db_session, "paying", 5)
+
+    report = await apply_grants(
+        db_session,
+        "spring",
+        lines("device_id,amount,reason", "paying,3,sorry, outage", "a,2", "b,1", "a,9", "c,zero", ""),
+        "csv",
+    )
+
+    assert report["lines"] == 5
+    assert (report["granted"], report["tokens"]) == (3, 6)
+    assert (report["duplicates"], report["invalid"]) == (1, 1)
+    assert report["errors"] == [{"line": 6, "error": "amount is not an integer: 'zero'"}]
+
+    paying = await get_token_status(db_session, "paying")
+    assert paying["tokens_remaining"] == 8
+    assert paying["tokens_purchased"] == 5  # Grants aren't purchases
+    assert (await get_token_status(db_session, "a"))["tokens_remaining"] == 2
+    reason, account = (await db_session.execute(
+        select(TokenLedgerEntry.reason, TokenLedgerEntry.account).where(
+            TokenLedgerEntry.device_id == "paying", TokenLedgerEntry.batch_id == "spring"
+        )
+    )).one()
+    assert (reason, account) == ("sorry, outage", "promotions")
+
+
+@pytest.mark.asyncio
+async def test_apply_grants_is_idempotent_per_batch(db_session):
+    """Test that re-sending a batch only grants the devices it missed."""
+    await apply_grants(db_session, "b1", lines('{"device_id": "a", "amount": 2}'), "ndjson")
+    report = await apply_grants(
+        db_session, "b1", lines('{"device_id": "a", "amount": 2}', '{"device_id": "b", "amount": 4}'), "ndjson"
+    )
+    assert (report["granted"], report["already_granted"], report["tokens"]) == (1, 1, 4)
+
+    # A new batch id grants again
+    await apply_grants(db_session, "b2", lines('{"device_id": "a", "amount": 1}'), "ndjson")
+    assert (await get_token_status(db_session, "a"))["tokens_remaining"] == 3
+    assert await db_session.scalar(select(func.count()).select_from(TokenLedgerEntry)) == 3
+
+
+@pytest.mark.parametrize("line,format,error", [
+    ("a", "csv", "expected device_id,amount[,reason]"),
+    ("a,0", "csv", "amount must be between 1 and 10000"),
+    (",5", "csv", "device_id must be 1-255 characters"),
+    ("[1]", "ndjson", "expected an object"),
+    ('{"device_id": "a", "amount": true}', "ndjson", "amount is not an integer"),
+    ('{"device_id": "a"', "ndjson", "not valid JSON"),
+])
+def test_parse_grant_rejects(line, format, error):
+    """Test the messages reported for lines that don't parse."""
+    with pytest.raises(ValueError, match=error.replace("[", r"\[").replace("]", r"\]")):
+        parse_grant(line, format)
@@ -0,0 +1,59 @@
+import pytest
+from app.services.kv_store import MemoryKVStore, SQLiteKVStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def kv(request, tmp_path):
+    if request.param == "memory":
+        return MemoryKVStore()
+    return SQLiteKVStore(str(tmp_path / "kv.db"))
+
+
+@pytest.mark.asyncio
+async def test_get_set_delete(kv):
+    """Test basic operations."""
+    assert await kv.get("a") is None
+    await kv.set("a", b"1")
+    assert await kv.get("a") == b"1"
+    await kv.delete("a")
+    assert await kv.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_expiry(kv):
+    """Test that expired keys read as missing."""
+    await kv.set("a", b"1", ttl=-1)
+    assert await kv.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_add_only_sets_missing_keys(kv):
+    """Test set-if-absent, used for single-flight locks."""
+    assert await kv.add("lock", b"1", ttl=60) is True
+    assert await kv.add("lock", b"2", ttl=60) is False
+    assert await kv.get("lock") == b"1"
+
+
+@pytest.mark.asyncio
+async def test_update(kv):
+    """Test atomic read-modify-write."""
+    def increment(raw):
+        value = int(raw or b"0") + 1
+        return str(value).encode(), value
+    
+    assert await kv.update("n", increment) == 1
+    assert await kv.update("n", increment) == 2
+    await kv.clear()
+    assert await kv.get("n") is None
+
+
+@pytest.mark.asyncio
+async def test_memory_store_is_bounded():
+    """Test that the memory store evicts least recently used keys."""
+    kv = MemoryKVStore(max_keys=2)
+    await kv.set("a", b"1")
+    await kv.set("b", b"2")
+    await kv.get("a")
+    await kv.set("c", b"3")
+    assert await kv.get("b") is None
+    assert await kv.get("a") == b"1"
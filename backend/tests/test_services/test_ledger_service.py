@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import select, update
+
+from app.models.ledger import TokenBalanceSnapshot, TokenLedgerEntry
+from app.models.token import GenerationToken
+from app.services import ledger_service
+from app.services.ledger_service import rebuild_balance, take_snapshots, verify_balances
+from app.services.token_service import (
+    add_tokens,
+    get_token_status,
+    refund_generations,
+    reserve_generations,
+    use_generation,
+)
+
+
+def balance(status: dict) -> dict:
+    return {key: status[key] for key in ("tokens_remaining", "tokens_purchased", "free_trial_used")}
+
+
+@pytest.mark.asyncio
+async def test_balance_changes_are_recorded(db_session):
+    """Test that every balance change writes a ledger entry the balance can be rebuilt from."""
+    device_id = "test-device"
+    await use_generation(db_session, device_id)
+    await add_tokens(db_session, device_id, 5, checkout_id="chk_1")
+    await reserve_generations(db_session, device_id, 3)
+    await refund_generations(db_session, device_id, 2)
+    await use_generation(db_session, device_id)
+
+    entries = (await db_session.execute(
+        select(TokenLedgerEntry.kind, TokenLedgerEntry.account, TokenLedgerEntry.amount, TokenLedgerEntry.batch_id)
+        .order_by(TokenLedgerEntry.id)
+    )).all()
+    assert [tuple(e) for e in entries] == [
+        ("trial", "trials", 1, None),
+        ("grant", "sales", 5, "chk_1"),
+        ("consume", "usage", -3, None),
+        ("refund", "usage", 2, None),
+        ("consume", "usage", -1, None),
+    ]
+    status = await get_token_status(db_session, device_id)
+    assert status["tokens_remaining"] == 3
+    assert await rebuild_balance(db_session, device_id) == balance(status)
+
+
+@pytest.mark.asyncio
+async def test_snapshots_roll_forward(db_session, monkeypatch):
+    """Test that snapshots fold the ledger in chunks and rebuilds only read entries after them."""
+    monkeypatch.setattr(ledger_service, "SNAPSHOT_CHUNK", 2)
+    await reserve_generations(db_session, "a", 1)  # Free trial
+    await add_tokens(db_session, "a", 4)
+    await add_tokens(db_session, "b", 2)
+
+    assert await take_snapshots(db_session) == 3
+    assert await take_snapshots(db_session) == 0
+    snapshot = (await db_session.execute(
+        select(TokenBalanceSnapshot).where(TokenBalanceSnapshot.device_id == "a")
+    )).scalar_one()
+    assert (snapshot.tokens_remaining, snapshot.tokens_purchased, snapshot.trials_used) == (4, 4, 1)
+
+    # A returned free trial after the snapshot
+    await refund_generations(db_session, "a", 1, free_trial=True)
+    assert await rebuild_balance(db_session, "a") == balance(await get_token_status(db_session, "a"))
+    assert (await rebuild_balance(db_session, "a"))["free_trial_used"] is False
+
+
+@pytest.mark.asyncio
+async def test_verify_balances_finds_and_repairs_drift(db_session):
+    """Test that a balance changed outside the ledger is reported, and restored with repair."""
+    await add_tokens(db_session, "a", 5)
+    await add_tokens(db_session, "b", 3)
+    await use_generation(db_session, "b")
+    await db_session.execute(
+        update(GenerationToken).where(GenerationToken.device_id == "a").values(tokens_remaining=50)
+    )
+    await db_session.commit()
+
+    report = await verify_balances(db_session)
+    assert report["mismatched"] == 1
+    assert report["devices"][0]["device_id"] == "a"
+    assert report["devices"][0]["ledger"]["tokens_remaining"] == 5
+    # Each account's balance mirrors what the devices were credited
+    assert report["accounts"] == {"sales": -8, "trials": -1}
+
+    await verify_balances(db_session, repair=True)
+    assert (await get_token_status(db_session, "a"))["tokens_remaining"] == 5
+    assert (await verify_balances(db_session))["mismatched"] == 0
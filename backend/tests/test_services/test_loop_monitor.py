@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.metrics import slow_callbacks, TOOL_NAME
+from app.services.loop_monitor import LoopMonitor
+
+
+@pytest.mark.asyncio
+async def test_monitor_logs_blocked_loop(db_session, caplog):
+    """Test that a blocking call on the loop is reported with its stack."""
+    monitor = LoopMonitor(db_session.bind, interval=0.02, slow_threshold=0.05)
+    before = slow_callbacks.labels(tool=TOOL_NAME)._value.get()
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING, logger="app.services.loop_monitor"):
+            time.sleep(0.3)  # Blocks the event loop
+            await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+    
+    assert slow_callbacks.labels(tool=TOOL_NAME)._value.get() == before + 1
+    assert "test_monitor_logs_blocked_loop" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_monitor_counts_database_statements(db_session):
+    """Test that statements are counted while they run, including failed ones."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    
+    monitor = LoopMonitor(db_session.bind, interval=10)
+    seen = []
+    monitor.start()
+    try:
+        def during(conn, cursor, statement, parameters, context, executemany):
+            seen.append(monitor.database_statements())
+        
+        event.listen(db_session.bind.sync_engine, "before_cursor_execute", during)
+        await db_session.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            await db_session.execute(text("SELECT * FROM missing"))
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", during)
+        
+        assert seen == [1, 1]
+        assert monitor.database_statements() == 0
+        monitor.sample()
+    finally:
+        await monitor.stop()
+
+
+@pytest.mark.asyncio
+async def test_http_clients_count_requests_in_flight(fake_llm_proxy):
+    """Test that upstream calls are counted while they run."""
+    from app.services import llm_service
+    
+    seen = []
+    
+    async def observe():
+        while True:
+            seen.append(llm_service.in_flight.count)
+            await asyncio.sleep(0)
+    
+    observer = asyncio.create_task(observe())
+    try:
+        await llm_service.chat_completion("system", "Imagine what 'x' will look like")
+    finally:
+        observer.cancel()
+    assert max(seen) == 1
+    assert llm_service.in_flight.count == 0
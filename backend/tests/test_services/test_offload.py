@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from app.config import get_settings
+from app.services import offload as offload_module
+from app.services.llm_service import parse_vision
+from app.services.offload import offload, text_size
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    """Offload anything over 100 bytes; yields a function switching the executor kind."""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "cpu_offload_min_bytes", 100)
+
+    def use(kind):
+        offload_module.shutdown_executor()
+        monkeypatch.setattr(settings, "cpu_offload_executor", kind)
+
+    yield use
+    offload_module.shutdown_executor()
+
+
+def current_thread_name(_):
+    return threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_offload_by_size(executor):
+    """Test that small payloads run on the event loop and large ones on the thread pool."""
+    executor("thread")
+    loop_thread = threading.current_thread().name
+    assert await offload(current_thread_name, None, size=99) == loop_thread
+    assert (await offload(current_thread_name, None, size=100)).startswith("cpu-offload")
+
+    executor("none")
+    assert await offload(current_thread_name, None, size=10_000) == loop_thread
+
+
+@pytest.mark.asyncio
+async def test_offload_to_process_pool(executor):
+    """Test that module-level parse functions round-trip through a process pool."""
+    executor("process")
+    content = '```json\n{"title": "Ambient", "summary": "%s"}\n```' % ("x" * 200)
+    vision = await offload(parse_vision, content, "Phones", size=len(content))
+    assert vision == {"title": "Ambient", "summary": "x" * 200}
+
+    with pytest.raises(ZeroDivisionError):
+        await offload(divmod, 1, 0, size=1000)
+
+
+def test_parse_vision_falls_back_to_text():
+    """Test that a completion that isn't JSON becomes a vision of the raw text."""
+    vision = parse_vision("Phones will vanish.", "Phones")
+    assert vision["title"] == "The Future of Phones"
+    assert vision["sections"]["technology"]["content"] == "Phones will vanish."
+
+
+def test_text_size():
+    """Test that text size counts string characters at any depth."""
+    assert text_size({"a": "xy", "b": [{"c": "z"}, 3, None], "d": 2036}) == 3
@@ -0,0 +1,70 @@
+import math
+
+import pytest
+from app.services.kv_store import MemoryKVStore, SQLiteKVStore
+from app.services.rate_limiter import (
+    BucketStore,
+    Limit,
+    RateLimiter,
+    parse_limit,
+    parse_route_limits,
+    retry_after_header,
+)
+
+
+def test_parse_limit():
+    """Test parsing limit specs."""
+    assert parse_limit("10/minute") == Limit(rate=10 / 60, burst=10)
+    assert parse_limit("5/seconds") == Limit(rate=5, burst=5)
+    with pytest.raises(ValueError):
+        parse_limit("10/fortnight")
+
+
+def test_parse_route_limits():
+    """Test parsing the per-route settings JSON."""
+    routes = parse_route_limits('{"/api/v1/visualize": {"device": "2/minute"}}')
+    assert routes["/api/v1/visualize"]["device"].burst == 2
+    assert parse_route_limits("not json") == {}
+
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_limits():
+    """Test that a bucket allows its burst and then asks to retry."""
+    store = BucketStore(MemoryKVStore())
+    limit = Limit(rate=1 / 60, burst=2)
+    
+    assert await store.take("k", limit) == 0
+    assert await store.take("k", limit) == 0
+    
+    retry_after = await store.take("k", limit)
+    assert 0 < retry_after <= 60
+    assert retry_after_header(retry_after) == str(math.ceil(retry_after))
+    assert retry_after_header(0.01) == "1"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_buckets_are_shared(tmp_path):
+    """Test that two stores on one file (two workers) share bucket state."""
+    path = str(tmp_path / "kv.db")
+    limit = Limit(rate=1 / 60, burst=1)
+    
+    assert await BucketStore(SQLiteKVStore(path)).take("k", limit) == 0
+    assert await BucketStore(SQLiteKVStore(path)).take("k", limit) > 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_checks_each_scope():
+    """Test that the limiter reports which scope was exhausted."""
+    limiter = RateLimiter(
+        BucketStore(MemoryKVStore()),
+        {"/x": {"device": Limit(rate=1 / 60, burst=1), "ip": Limit(rate=1 / 60, burst=5)}},
+    )
+    
+    assert await limiter.check("/x", {"device": "d1", "ip": "1.2.3.4"}) == (None, 0.0)
+    scope, retry_after = await limiter.check("/x", {"device": "d1", "ip": "1.2.3.4"})
+    assert scope == "device"
+    assert retry_after > 0
+    
+    # Other devices are unaffected, and unconfigured routes are never limited
+    assert (await limiter.check("/x", {"device": "d2", "ip": "1.2.3.4"}))[0] is None
+    assert (await limiter.check("/y", {"device": "d1"}))[0] is None
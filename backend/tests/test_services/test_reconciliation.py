@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.models.payment import PaymentTransaction
+from app.services import reconciliation
+from app.services.creem_client import CreemClient
+from app.services.reconciliation import reconcile_pending_payments
+from app.services.token_service import add_tokens, get_token_status
+
+
+class FakeCreemClient:
+    """Stand-in for CreemClient answering from a dict of checkout statuses."""
+
+    def __init__(self, statuses: dict):
+        self.statuses = statuses
+        self.lookups = []
+
+    async def get_checkout_statuses(self, checkout_ids):
+        self.lookups.append(list(checkout_ids))
+        return {
+            checkout_id: self.statuses[checkout_id]
+            for checkout_id in checkout_ids
+            if checkout_id in self.statuses
+        }
+
+
+def transaction(checkout_id, device_id, created_at, status="pending"):
+    return PaymentTransaction(
+        checkout_id=checkout_id, device_id=device_id, product_sku="starter",
+        amount_cents=499, tokens_granted=5, status=status, created_at=created_at,
+    )
+
+
+@pytest.mark.asyncio
+async def test_reconcile_pending_payments(db_session, monkeypatch):
+    """Test that stale pending checkouts are settled from Creem's status, a page at a time."""
+    monkeypatch.setattr(reconciliation, "PAGE_SIZE", 2)
+    old = datetime.utcnow() - timedelta(hours=3)
+    db_session.add_all([
+        transaction("paid-1", "buyer", old),
+        transaction("paid-2", "buyer", old + timedelta(minutes=1)),
+        transaction("abandoned", "other", old + timedelta(minutes=2)),
+        transaction("in-progress", "other", old + timedelta(minutes=3)),
+        transaction("lookup-failed", "other", old + timedelta(minutes=4)),
+        transaction("recent", "other", datetime.utcnow()),
+        transaction("webhooked", "other", old, status="completed"),
+    ])
+    await db_session.commit()
+    await add_tokens(db_session, "buyer", 1)
+
+    client = FakeCreemClient({
+        "paid-1": "completed",
+        "paid-2": "completed",
+        "abandoned": "expired",
+        "in-progress": "pending",
+        "recent": "completed",
+        "webhooked": "completed",
+    })
+    report = await reconcile_pending_payments(db_session, client, older_than_minutes=60, expire_after_hours=48)
+
+    assert report == {"checked": 5, "completed": 2, "expired": 1, "unchanged": 2}
+    assert client.lookups == [["paid-1", "paid-2"], ["abandoned", "in-progress"], ["lookup-failed"]]
+
+    rows = (await db_session.execute(
+        select(PaymentTransaction.checkout_id, PaymentTransaction.status)
+    )).all()
+    assert dict(rows) == {
+        "paid-1": "completed",
+        "paid-2": "completed",
+        "abandoned": "expired",
+        "in-progress": "pending",
+        "lookup-failed": "pending",
+        "recent": "pending",
+        "webhooked": "completed",
+    }
+
+    status = await get_token_status(db_session, "buyer")
+    assert status["tokens_remaining"] == 11
+    assert status["tokens_purchased"] == 11
+
+    # Nothing left to settle: a second run grants nothing
+    report = await reconcile_pending_payments(db_session, client, older_than_minutes=60, expire_after_hours=48)
+    assert report["completed"] == 0
+    assert (await get_token_status(db_session, "buyer"))["tokens_remaining"] == 11
+
+
+@pytest.mark.asyncio
+async def test_reconcile_expires_stale_unsettled_checkouts(db_session, monkeypatch):
+    """Test that old checkouts Creem reports unsettled or doesn't know expire, but failed lookups don't."""
+    ancient = datetime.utcnow() - timedelta(hours=49)
+    db_session.add_all([
+        transaction("still-pending", "other", ancient),
+        transaction("not-found", "other", ancient),
+        transaction("lookup-failed", "buyer", ancient),
+        transaction("paid-late", "buyer", ancient),
+        transaction("young", "other", datetime.utcnow() - timedelta(hours=3)),
+    ])
+    await db_session.commit()
+
+    answers = {"still-pending": "pending", "not-found": None, "paid-late": "completed", "young": "pending"}
+
+    async def get_checkout_status(checkout_id):
+        if checkout_id == "lookup-failed":
+            raise Exception("Creem API error: 401 - invalid API key")
+        return answers[checkout_id]
+
+    client = CreemClient("http://creem.invalid", "key")
+    monkeypatch.setattr(client, "get_checkout_status", get_checkout_status)
+    try:
+        report = await reconcile_pending_payments(db_session, client, older_than_minutes=60, expire_after_hours=48)
+    finally:
+        await client.aclose()
+
+    assert report == {"checked": 5, "completed": 1, "expired": 2, "unchanged": 2}
+    rows = (await db_session.execute(
+        select(PaymentTransaction.checkout_id, PaymentTransaction.status)
+    )).all()
+    assert dict(rows) == {
+        "still-pending": "expired",
+        "not-found": "expired",
+        "lookup-failed": "pending",
+        "paid-late": "completed",
+        "young": "pending",
+    }
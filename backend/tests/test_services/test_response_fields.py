@@ -0,0 +1,56 @@
+import orjson
+
+from app.config import get_settings
+from app.services.llm_service import vision_max_tokens, vision_structure
+from app.services.response_fields import generation_cost, normalize_fields, shape, tier
+from app.services.vision_cache import encode_vision
+
+
+def test_normalize_fields():
+    """Test that selections have one canonical form, and everything is None."""
+    assert normalize_fields(None) is None
+    assert normalize_fields(["key_changes", "summary", "summary"]) == ("summary", "key_changes")
+    assert normalize_fields(["sections.wildcard", "summary"]) == ("summary", "wildcard")
+    assert normalize_fields(["summary", "key_changes", "sections"]) is None
+    assert normalize_fields([]) == ()
+
+
+def test_tier_costs(monkeypatch):
+    """Test the tier of a selection and its configured price."""
+    assert tier(None) == "full"
+    assert tier(("summary",)) == "brief"
+    assert tier(("technology",)) == "sections"
+    assert generation_cost(None) == 1
+    
+    monkeypatch.setattr(get_settings(), "generation_tier_costs", '{"brief": 1, "sections": 2, "full": 3}')
+    assert generation_cost(()) == 1
+    assert generation_cost(("summary", "society")) == 2
+    assert generation_cost(normalize_fields(["sections", "summary", "key_changes"])) == 3
+
+
+def test_prompt_asks_only_for_selected_parts():
+    """Test that the prompt and the token budget shrink with the selection."""
+    fields = ("summary", "technology")
+    structure = vision_structure(fields)
+    assert '"summary"' in structure and '"technology"' in structure
+    assert '"key_changes"' not in structure and '"society"' not in structure
+    assert vision_max_tokens(fields) < vision_max_tokens(None)
+    assert '"key_changes"' in vision_structure(None)
+
+
+def test_shape_keeps_title_and_year():
+    """Test that shaped visions keep only the selected parts."""
+    vision = {
+        "title": "T",
+        "year": 2036,
+        "summary": "S",
+        "sections": {"technology": {"title": "a", "content": "b"}, "society": {"title": "c", "content": "d"}},
+        "key_changes": ["k"],
+    }
+    assert shape(vision, ("society",)) == {
+        "title": "T",
+        "year": 2036,
+        "sections": {"society": {"title": "c", "content": "d"}},
+    }
+    assert shape(vision, None) is vision
+    assert orjson.loads(encode_vision(vision, "x", ("summary",))) == {"title": "T", "year": 2036, "summary": "S"}
@@ -0,0 +1,48 @@
+from app.services.similarity import ConceptIndex, canonical_concept
+
+
+def test_canonical_concept_drops_filler():
+    """Test that filler words and spacing don't change the concept."""
+    assert canonical_concept("TikTok") == "tiktok"
+    assert canonical_concept("tiktok app") == "tiktok"
+    assert canonical_concept("Tik Tok in 10 years") == "tiktok"
+    assert canonical_concept("The future of TikTok") == "tiktok"
+    assert canonical_concept("The App") == "theapp"
+
+
+def test_lookup_matches_near_duplicates():
+    """Test that variants of a stored concept are found."""
+    index = ConceptIndex()
+    index.add("TikTok", "en")
+    index.add("Google Search", "en")
+    
+    assert index.lookup("tiktok app", "en", 0.75) == ("TikTok", 1.0)
+    match = index.lookup("google searchh", "en", 0.75)
+    assert match[0] == "Google Search"
+    assert 0.75 <= match[1] < 1.0
+
+
+def test_lookup_rejects_unrelated_and_other_languages():
+    """Test that different concepts and languages don't match."""
+    index = ConceptIndex()
+    index.add("iPhone 14", "en")
+    index.add("TikTok", "en")
+    
+    assert index.lookup("iPhone 15", "en", 0.75) is None
+    assert index.lookup("Instagram", "en", 0.75) is None
+    assert index.lookup("TikTok", "de", 0.75) is None
+
+
+def test_index_evicts_oldest():
+    """Test that a full index forgets the concept stored longest ago."""
+    index = ConceptIndex(max_entries=2)
+    index.add("a1", "en")
+    index.add("b2", "en")
+    index.add("a1", "en")  # Stored again
+    index.add("c3", "en")
+    assert len(index) == 2
+    assert index.lookup("b2", "en", 1.0) is None
+    assert index.lookup("a1", "en", 1.0) == ("a1", 1.0)
+    assert index.lookup("c3", "en", 1.0) == ("c3", 1.0)
+    index.clear()
+    assert len(index) == 0
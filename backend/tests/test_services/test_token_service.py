@@ -37,8 +37,9 @@ async def test_use_generation_consumes_free_trial(db_session):
     device_id = "test-device"
     
     # Use free trial
-    success, remaining = await use_generation(db_session, device_id)
+    success, used_free_trial, remaining = await use_generation(db_session, device_id)
     assert success is True
+    assert used_free_trial is True
     
     # Check free trial is used
     can_use, is_free_trial, _ = await can_use_generation(db_session, device_id)
@@ -73,8 +74,9 @@ async def test_use_generation_with_tokens(db_session):
     await add_tokens(db_session, device_id, 5)
     
     # Use paid token
-    success, remaining = await use_generation(db_session, device_id)
+    success, used_free_trial, remaining = await use_generation(db_session, device_id)
     assert success is True
+    assert used_free_trial is False
     assert remaining == 4
 
 
@@ -88,3 +90,57 @@ async def test_get_token_status(db_session):
     assert status["device_id"] == device_id
     assert status["tokens_remaining"] == 0
     assert status["free_trial_available"] is True
+
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_requests_share_one_record(race, db_session):
+    """Test that racing inserts for a new device leave a single row."""
+    from sqlalchemy import func, select
+    from app.models.token import GenerationToken
+    
+    tokens = await race(5, lambda db: get_or_create_token_record(db, "racer"))
+    
+    assert len({token.id for token in tokens}) == 1
+    assert await db_session.scalar(select(func.count()).select_from(GenerationToken)) == 1
+
+
+@pytest.mark.asyncio
+async def test_racing_generations_spend_each_token_once(race, db_session, device_id):
+    """Test that concurrent generations can't spend the same token twice."""
+    from app.services.ledger_service import rebuild_balance
+    
+    await use_generation(db_session, device_id)  # Free trial
+    await add_tokens(db_session, device_id, 3)
+    
+    results = await race(6, lambda db: use_generation(db, device_id))
+    
+    assert sorted(success for success, _, _ in results) == [False] * 3 + [True] * 3
+    status = await get_token_status(db_session, device_id)
+    assert status["tokens_remaining"] == 0
+    assert (await rebuild_balance(db_session, device_id))["tokens_remaining"] == 0
+
+
+@pytest.mark.asyncio
+async def test_racing_purchases_and_generations_match_the_ledger(race, db_session, device_id):
+    """Test that purchases racing generations don't overwrite the tokens they spend."""
+    from itertools import count
+    from app.services.ledger_service import rebuild_balance
+    
+    await use_generation(db_session, device_id)  # Free trial
+    await add_tokens(db_session, device_id, 6)
+    
+    turns = count()
+    
+    async def purchase_or_generate(db):
+        if next(turns) % 2:
+            return await add_tokens(db, device_id, 1)
+        return await use_generation(db, device_id)
+    
+    results = await race(6, purchase_or_generate)
+    
+    assert not [result for result in results if isinstance(result, Exception)]
+    status = await get_token_status(db_session, device_id)
+    assert status["tokens_remaining"] == 6
+    assert status["tokens_purchased"] == 9
+    assert (await rebuild_balance(db_session, device_id))["tokens_remaining"] == 6
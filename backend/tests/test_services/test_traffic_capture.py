@@ -0,0 +1,101 @@
+from unittest.mock import AsyncMock, patch
+
+import orjson
+import pytest
+
+from app.services import traffic_capture
+from app.services.traffic_capture import TrafficRecorder
+
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    """Capture requests to a temporary log; yields a function reading it back."""
+    path = tmp_path / "capture.ndjson"
+    recorder = TrafficRecorder(str(path), salt="test")
+    monkeypatch.setattr(traffic_capture, "_recorder", recorder)
+
+    def records():
+        return [orjson.loads(line) for line in path.read_bytes().splitlines()]
+
+    yield records
+    recorder.close()
+
+
+@pytest.mark.asyncio
+async def test_capture_records_sanitized_requests(client, device_id, capture):
+    """Test that captured requests keep the traffic shape but no identifiers or concepts."""
+    with patch("app.api.v1.visualize.generate_future_vision", new_callable=AsyncMock) as mock:
+        mock.return_value = {"title": "Soon"}
+        response = await client.post(
+            "/api/v1/visualize",
+            headers={"X-Device-Id": device_id, "User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1)"},
+            json={"concept": "  TikTok ", "language": "de"},
+        )
+    # The middleware read the body; the endpoint still got it
+    assert response.status_code == 200
+    await client.post("/api/v1/visualize", headers={"X-Device-Id": device_id}, json={"concept": "tiktok"})
+    await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id, "X-Real-IP": "203.0.113.9"})
+
+    first, second, status = capture()
+    assert first["m"] == "POST" and first["p"] == "/api/v1/visualize" and first["s"] == 200
+    assert first["ua"] == "Googlebot"
+    assert first["dev"] == second["dev"] and device_id not in first["dev"]
+    assert first["body"]["language"] == "de"
+    # Hashed the way the cache normalizes, so repeats of a concept still line up
+    assert first["body"]["concept"] == second["body"]["concept"]
+    assert first["body"]["concept"].startswith("concept-")
+    assert second["s"] == 402
+    assert "body" not in status and status["ip"] and "203.0.113.9" not in orjson.dumps(status).decode()
+
+
+@pytest.mark.asyncio
+async def test_capture_keeps_webhook_shape(client, capture, tmp_path):
+    """Test that webhooks are captured as event type, hashed device and token count."""
+    await client.post(
+        "/api/v1/webhook",
+        json={
+            "type": "checkout.completed",
+            "data": {"id": "chk_1", "metadata": {"device_id": "buyer", "tokens": "5"}},
+        },
+    )
+    (webhook,) = capture()
+    assert webhook["body"]["type"] == "checkout.completed"
+    assert webhook["body"]["tokens"] == "5"
+    assert webhook["body"]["device"] == TrafficRecorder(str(tmp_path / "other"), salt="test").pseudonym("buyer")
+    assert "chk_1" not in orjson.dumps(webhook).decode()
+
+
+@pytest.mark.asyncio
+async def test_capture_write_errors_dont_fail_requests(client, device_id, capture, monkeypatch, caplog):
+    """Test that a failing capture log is logged and the request still succeeds."""
+    def full_disk(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+    
+    monkeypatch.setattr(traffic_capture._recorder, "record", full_disk)
+    response = await client.get("/api/v1/tokens/status", headers={"X-Device-Id": device_id})
+    
+    assert response.status_code == 200
+    assert "Writing the traffic capture failed" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_capture_times_streamed_bodies(client, device_id, capture, db_session):
+    """Test that a streamed batch is timed until its last line, not its headers."""
+    import asyncio
+    from app.services.token_service import add_tokens
+    
+    await add_tokens(db_session, device_id, 2)
+    
+    async def generate(concept, language):
+        await asyncio.sleep(0.2)
+        return {"title": concept}
+    
+    with patch("app.services.batch_service.generate_future_vision", side_effect=generate):
+        response = await client.post(
+            "/api/v1/visualize/batch",
+            headers={"X-Device-Id": device_id},
+            json={"items": [{"concept": "slow"}]},
+        )
+    
+    assert response.status_code == 200
+    assert capture()[0]["ms"] >= 200
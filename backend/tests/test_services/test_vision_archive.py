@@ -0,0 +1,71 @@
+import os
+
+import orjson
+import pytest
+
+from app.config import get_settings
+from app.services import vision_archive
+from app.services.vision_archive import VisionArchive, export
+from app.services.vision_cache import encode_vision, get_or_generate
+
+
+def body(i: int) -> bytes:
+    section = {"title": "Technology Evolution", "content": f"Paragraph {i} about what changes. " * 20}
+    return encode_vision({"title": f"The Future of c{i}", "summary": "Soon", "sections": {"technology": section}}, "c")
+
+
+def test_archive_lookup_across_segments(tmp_path, monkeypatch):
+    """Test that sealed segments are found by concept and language, newest first, with a trained dictionary."""
+    monkeypatch.setattr(vision_archive, "MIN_TRAINING_SAMPLES", 5)
+    archive = VisionArchive(str(tmp_path), segment_bytes=1024, codec="zlib")
+    for i in range(30):
+        archive.append(f"c{i}", "en", body(i))
+    archive.append("c3", "de", body(100))
+    archive.append("c3", "en", body(200))  # Still in the open segment
+
+    assert archive.get("c3", "en")["vision"] == orjson.loads(body(200))
+    archive.close()
+
+    archive = VisionArchive(str(tmp_path), codec="zlib")
+    segments = archive.sealed_segments()
+    assert len(segments) > 2
+    assert (segments[0].dictionary_id, segments[-1].dictionary_id) == (0, 1)
+    assert archive.get("c3", "en")["vision"] == orjson.loads(body(200))
+    assert archive.get("c3", "de")["vision"] == orjson.loads(body(100))
+    assert archive.get("c29", "en")["concept"] == "c29"
+    assert archive.get("c3", "fr") is None
+    archive.close()
+
+
+def test_archive_recovers_torn_segment(tmp_path):
+    """Test that a segment left open by a dead worker is cut at its last whole record and sealed."""
+    archive = VisionArchive(str(tmp_path), codec="zlib")
+    archive.append("a", "en", body(1))
+    archive.append("b", "en", body(2))
+    os.write(archive._fd, b"\x10\x00\x00\x00partial")
+    os.close(archive._fd)  # Dies without sealing
+    archive._fd = None
+
+    archive = VisionArchive(str(tmp_path), codec="zlib")
+    assert archive.get("b", "en")["vision"] == orjson.loads(body(2))
+    out = tmp_path / "export.ndjson"
+    assert export(archive, str(out)) == 2
+    assert [orjson.loads(line)["concept"] for line in out.read_bytes().splitlines()] == ["a", "b"]
+    archive.close()
+
+
+@pytest.mark.asyncio
+async def test_generated_visions_are_archived(tmp_path, monkeypatch):
+    """Test that a generation is archived under its normalized concept."""
+    monkeypatch.setattr(get_settings(), "vision_archive_dir", str(tmp_path))
+    monkeypatch.setattr(get_settings(), "vision_cache_enabled", False)
+    monkeypatch.setattr(vision_archive, "_archive", None)
+
+    async def generate(concept, language):
+        return {"title": "Soon"}
+
+    try:
+        await get_or_generate("  TikTok ", "de", generate)
+        assert vision_archive.get_vision_archive().get("tiktok", "de")["vision"]["title"] == "Soon"
+    finally:
+        vision_archive.close_vision_archive()
@@ -0,0 +1,258 @@
+import asyncio
+
+import orjson
+import pytest
+import pytest_asyncio
+from app.services.kv_store import get_kv_store
+from app.services.vision_cache import (
+    cache_key,
+    encode_vision,
+    get_cached_vision,
+    get_or_generate,
+    render_response,
+)
+
+
+@pytest_asyncio.fixture
+async def kv():
+    """Empty shared store."""
+    store = get_kv_store()
+    await store.clear()
+    yield store
+
+
+def test_cache_key_normalizes_concept():
+    """Test that case and whitespace don't split the cache."""
+    assert cache_key("  TikTok ", "en") == cache_key("tiktok", "en")
+    assert cache_key("tiktok", "en") != cache_key("tiktok", "de")
+
+
+def test_encode_vision_fills_defaults():
+    """Test that missing fields get the endpoint defaults."""
+    vision = orjson.loads(encode_vision({"summary": "Soon"}, "Tesla"))
+    assert vision == {
+        "title": "The Future of Tesla",
+        "year": 2036,
+        "summary": "Soon",
+        "sections": {},
+        "key_changes": [],
+    }
+
+
+def test_render_response_matches_model():
+    """Test that the spliced bytes equal a normal VisualizeResponse."""
+    from app.api.v1.schemas import VisualizeResponse
+    
+    body = encode_vision({"title": "T", "sections": {"technology": {"title": "Tech", "content": "ü"}}}, "x")
+    rendered = orjson.loads(render_response(body, True, 3))
+    assert rendered == VisualizeResponse(
+        **orjson.loads(body), is_free_trial=True, remaining_tokens=3
+    ).model_dump()
+
+
+@pytest.mark.asyncio
+async def test_get_or_generate_caches(kv):
+    """Test that a generated vision is served from the cache next time."""
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(concept)
+        return {"title": f"Tomorrow's {concept}"}
+    
+    first = await get_or_generate("iPhone", "en", generate)
+    assert orjson.loads(first)["title"] == "Tomorrow's iPhone"
+    assert await get_or_generate("iphone", "en", generate) == first
+    assert calls == ["iPhone"]
+    assert await get_cached_vision("IPHONE", "en") is not None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_generation(kv):
+    """Test single-flight: identical concurrent requests call upstream once."""
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(concept)
+        await asyncio.sleep(0.01)
+        return {"title": concept}
+    
+    results = await asyncio.gather(*[get_or_generate("Tesla", "en", generate) for _ in range(5)])
+    assert len(set(results)) == 1
+    assert calls == ["Tesla"]
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_is_not_cached(kv):
+    """Test that errors propagate to every waiter and nothing is cached."""
+    async def generate(concept, language):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+    
+    results = await asyncio.gather(
+        *[get_or_generate("Uber", "en", generate) for _ in range(3)],
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await get_cached_vision("Uber", "en") is None
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_concept_reuses_vision(kv):
+    """Test that "TikTok in 10 years" is served the cached "TikTok" vision."""
+    from app.services.similarity import get_concept_index
+    get_concept_index().clear()
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(concept)
+        return {"title": concept}
+    
+    first = await get_or_generate("TikTok", "en", generate)
+    assert await get_or_generate("TikTok in 10 years", "en", generate) == first
+    assert await get_or_generate("tiktok app", "en", generate) == first
+    await get_or_generate("Instagram", "en", generate)
+    assert calls == ["TikTok", "Instagram"]
+
+
+@pytest.mark.asyncio
+async def test_similar_vision_skips_expired_matches(kv, monkeypatch):
+    """Test that a best match whose vision left the cache gives way to the next one."""
+    from app.config import get_settings
+    from app.services.similarity import get_concept_index
+    from app.services.vision_cache import get_similar_vision, store_vision
+    
+    monkeypatch.setattr(get_settings(), "similar_concept_threshold", 0.7)
+    index = get_concept_index()
+    index.clear()
+    index.add("Google Searchh", "en")  # Its vision has expired
+    body = encode_vision({"title": "Search"}, "Google Searchhh")
+    await store_vision("Google Searchhh", "en", body)
+    
+    assert await get_similar_vision("google search", "en") == body
+    assert index.lookup("Google Searchh", "en", 1.0) is None
+
+
+@pytest.mark.asyncio
+async def test_other_language_vision_is_translated(kv, monkeypatch):
+    """Test that a vision cached in English is translated rather than regenerated."""
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(language)
+        return {"title": "The Future of TikTok"}
+    
+    async def translate(vision, language):
+        return {**vision, "title": f"[{language}] {vision['title']}"}
+    
+    monkeypatch.setattr("app.services.vision_cache.translate_vision", translate)
+    await get_or_generate("TikTok", "en", generate)
+    body = await get_or_generate("TikTok", "ja", generate)
+    assert orjson.loads(body)["title"] == "[ja] The Future of TikTok"
+    assert await get_cached_vision("TikTok", "ja") == body
+    assert calls == ["en"]
+
+
+@pytest.mark.asyncio
+async def test_failed_translation_falls_back_to_generation(kv, monkeypatch):
+    """Test that a translation error still produces a freshly generated vision."""
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(language)
+        return {"title": language}
+    
+    async def translate(vision, language):
+        raise Exception("Translation changed the vision structure")
+    
+    monkeypatch.setattr("app.services.vision_cache.translate_vision", translate)
+    await get_or_generate("TikTok", "en", generate)
+    body = await get_or_generate("TikTok", "de", generate)
+    assert orjson.loads(body)["title"] == "de"
+    assert calls == ["en", "de"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_leaves_shared_generation_running(kv):
+    """Test that one caller going away doesn't cancel a generation another caller waits on."""
+    release = asyncio.Event()
+    
+    async def generate(concept, language):
+        await release.wait()
+        return {"title": concept}
+    
+    leaving = asyncio.create_task(get_or_generate("Zoom", "en", generate))
+    staying = asyncio.create_task(get_or_generate("Zoom", "en", generate))
+    await asyncio.sleep(0.01)
+    leaving.cancel()
+    await asyncio.sleep(0.01)
+    release.set()
+    
+    assert orjson.loads(await staying)["title"] == "Zoom"
+    assert await get_cached_vision("Zoom", "en")
+
+
+@pytest.mark.asyncio
+async def test_last_cancelled_caller_cancels_generation(kv):
+    """Test that the upstream call stops once nobody is waiting on it."""
+    cancelled = asyncio.Event()
+    
+    async def generate(concept, language):
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+    
+    callers = [asyncio.create_task(get_or_generate("Zoom", "en", generate)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert await get_kv_store().get(f"{cache_key('Zoom', 'en')}:lock") is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_generate_shapes_fields(kv):
+    """Test that a cached full vision is cut down, and a shaped one cached apart."""
+    calls = []
+    
+    async def generate(concept, language):
+        calls.append(concept)
+        return {"title": concept, "summary": "S", "key_changes": ["k"]}
+    
+    shaped = await get_or_generate("Kindle", "en", generate, ("summary",))
+    assert orjson.loads(shaped) == {"title": "Kindle", "year": 2036, "summary": "S"}
+    assert await get_cached_vision("Kindle", "en") is None
+    assert await get_or_generate("kindle", "en", generate, ("summary",)) == shaped
+    
+    full = orjson.loads(await get_or_generate("Kindle", "en", generate))
+    assert full["key_changes"] == ["k"]
+    assert orjson.loads(await get_or_generate("Kindle", "en", generate, ("key_changes",))) == {
+        "title": "Kindle",
+        "year": 2036,
+        "key_changes": ["k"],
+    }
+    assert calls == ["Kindle", "Kindle"]
+
+
+@pytest.mark.asyncio
+async def test_only_full_visions_are_archived(kv, monkeypatch, tmp_path):
+    """Test that a vision generated for a `fields` subset doesn't replace the archived full one."""
+    from app.config import get_settings
+    from app.services import vision_archive
+    
+    monkeypatch.setattr(get_settings(), "vision_archive_dir", str(tmp_path))
+    monkeypatch.setattr(vision_archive, "_archive", vision_archive.VisionArchive(str(tmp_path), codec="zlib"))
+    
+    async def generate(concept, language):
+        return {"title": concept, "summary": "S", "key_changes": ["k"]}
+    
+    try:
+        await get_or_generate("Walkman", "en", generate)
+        await get_or_generate("Walkman", "de", generate, ("summary",))
+        await kv.clear()
+        await get_or_generate("Walkman", "en", generate, ("summary",))
+        
+        assert vision_archive.get_archived("walkman", "en")["vision"]["key_changes"] == ["k"]
+        assert vision_archive.get_archived("walkman", "de") is None
+    finally:
+        vision_archive.close_vision_archive()
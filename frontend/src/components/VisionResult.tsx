@@ -15,6 +15,7 @@ interface VisionResultProps {
     key_changes: string[]
     is_free_trial: boolean
     remaining_tokens: number
+    degraded?: boolean
   }
 }
 
@@ -41,6 +42,9 @@ export default function VisionResult({ result }: VisionResultProps) {
           {result.is_free_trial && (
             <span className="status-badge trial">{t('result.freeTrial')}</span>
           )}
+          {result.degraded && (
+            <span className="status-badge degraded">{t('result.degraded')}</span>
+          )}
           <span className="status-tokens">
             {t('result.tokensRemaining')}: {result.remaining_tokens}
           </span>
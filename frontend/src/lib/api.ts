@@ -8,6 +8,7 @@ interface VisualizeResponse {
   key_changes: string[]
   is_free_trial: boolean
   remaining_tokens: number
+  degraded?: boolean
 }
 
 interface TokenStatusResponse {
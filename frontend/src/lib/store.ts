@@ -20,6 +20,7 @@ interface VisionResult {
   key_changes: string[]
   is_free_trial: boolean
   remaining_tokens: number
+  degraded?: boolean
 }
 
 interface AppState {
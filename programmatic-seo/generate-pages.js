@@ -2,16 +2,37 @@
 /**
  * Programmatic SEO Page Generator for AI Future Visualizer
  * Generates 5,000+ landing pages for long-tail keywords
+ *
+ * Incremental: a manifest records a hash of each page's inputs, so a run only
+ * rewrites pages whose inputs changed and sitemap chunks whose pages changed.
+ * Pass --full to rebuild everything.
+ *
+ * Set SEO_METRICS_URL (e.g. https://host/metrics/programmatic-pages) and
+ * ADMIN_API_KEY to report the page count to the backend.
  */
 
+const crypto = require('crypto');
 const fs = require('fs');
+const os = require('os');
 const path = require('path');
+const { Worker, isMainThread, parentPort, workerData } = require('worker_threads');
 
 const dimensions = require('./dimensions.json');
-const OUTPUT_DIR = path.join(__dirname, '../frontend/public/p');
-const SITEMAP_PATH = path.join(__dirname, '../frontend/public/sitemap-programmatic.xml');
-const SITEMAP_MAIN_PATH = path.join(__dirname, '../frontend/public/sitemap-main.xml');
-const SITEMAP_INDEX_PATH = path.join(__dirname, '../frontend/public/sitemap.xml');
+const PUBLIC_DIR = path.join(__dirname, '../frontend/public');
+const OUTPUT_DIR = path.join(PUBLIC_DIR, 'p');
+const LEGACY_SITEMAP_PATH = path.join(PUBLIC_DIR, 'sitemap-programmatic.xml');
+const SITEMAP_MAIN_PATH = path.join(PUBLIC_DIR, 'sitemap-main.xml');
+const SITEMAP_INDEX_PATH = path.join(PUBLIC_DIR, 'sitemap.xml');
+const MANIFEST_PATH = path.join(__dirname, '.manifest.json');
+const MANIFEST_VERSION = 1;
+
+// Pages are assigned to a chunk by a hash of their slug, so adding or changing
+// a page only touches its own chunk
+const SITEMAP_CHUNKS = 16;
+const SITEMAP_CHUNK_PREFIX = 'sitemap-p-';
+
+// Changed pages per worker thread below which spawning another isn't worth it
+const PAGES_PER_WORKER = 250;
 
 // Content templates for different focus areas
 const focusAreaContent = {
@@ -233,16 +254,32 @@ function generateRelatedLinks(currentCombo, dimValues) {
   return links.slice(0, 6).join('\n      ');
 }
 
-function generateAllPages() {
-  console.log('🚀 Starting Programmatic SEO generation...');
-  
-  // Clean output directory
-  if (fs.existsSync(OUTPUT_DIR)) {
-    fs.rmSync(OUTPUT_DIR, { recursive: true });
-  }
-  fs.mkdirSync(OUTPUT_DIR, { recursive: true });
+function sha1(text) {
+  return crypto.createHash('sha1').update(text).digest('hex');
+}
+
+// The templates live in this file, so any edit to it invalidates every page
+const TEMPLATE_HASH = sha1(fs.readFileSync(__filename));
+
+function today() {
+  return new Date().toISOString().split('T')[0];
+}
+
+function cartesianProduct(arrays) {
+  if (arrays.length === 0) return [[]];
   
-  const allUrls = [];
+  return arrays.reduce((acc, curr) => {
+    const result = [];
+    for (const a of acc) {
+      for (const c of curr) {
+        result.push([...a, c]);
+      }
+    }
+    return result;
+  }, [[]]);
+}
+
+function planPages() {
   const dimMap = {};
   
   // Build dimension map for quick lookup
@@ -250,119 +287,269 @@ function generateAllPages() {
     dimMap[dim.name] = dim.values_en;
   }
   
-  // Generate pages for each combination type
+  const pages = [];
   for (const combo of dimensions.combinations) {
-    console.log(`  Generating: ${combo.join(' × ')}`);
-    
     const arrays = combo.map(dimName => dimMap[dimName] || []);
-    const cartesian = cartesianProduct(arrays);
     
-    for (const values of cartesian) {
+    for (const values of cartesianProduct(arrays)) {
       const dimValues = {};
       combo.forEach((dimName, i) => {
         dimValues[dimName] = values[i];
       });
       
-      const page = generatePageContent(values, dimValues);
-      const pageDir = path.join(OUTPUT_DIR, page.slug);
-      
-      fs.mkdirSync(pageDir, { recursive: true });
-      fs.writeFileSync(path.join(pageDir, 'index.html'), page.html);
-      
-      allUrls.push(page.url);
+      // Everything the page renders from: templates, site URL, its own values,
+      // and the pages its related links point to
+      const hash = sha1(JSON.stringify([
+        TEMPLATE_HASH,
+        dimensions.tool_url,
+        dimValues,
+        generateRelatedLinks(values, dimValues),
+      ]));
+      pages.push({ slug: values.join('-'), values, dimValues, hash });
     }
   }
-  
-  console.log(`\n📄 Generated ${allUrls.length} pages`);
-  
-  // Generate sitemap-programmatic.xml
-  generateSitemap(allUrls);
-  
-  // Generate sitemap-main.xml
-  generateMainSitemap();
-  
-  // Generate sitemap.xml (sitemapindex)
-  generateSitemapIndex();
-  
-  console.log('✅ Programmatic SEO generation complete!');
-  return allUrls.length;
+  return pages;
 }
 
-function cartesianProduct(arrays) {
-  if (arrays.length === 0) return [[]];
+function loadManifest(full) {
+  if (full || !fs.existsSync(MANIFEST_PATH)) {
+    return { pages: {} };
+  }
+  const manifest = JSON.parse(fs.readFileSync(MANIFEST_PATH, 'utf8'));
+  if (manifest.version !== MANIFEST_VERSION || manifest.tool_url !== dimensions.tool_url) {
+    return { pages: {} };
+  }
+  return manifest;
+}
+
+function saveManifest(manifest) {
+  const tmp = `${MANIFEST_PATH}.tmp`;
+  fs.writeFileSync(tmp, JSON.stringify(manifest));
+  fs.renameSync(tmp, MANIFEST_PATH);
+}
+
+function writeIfChanged(filePath, content) {
+  if (fs.existsSync(filePath) && fs.readFileSync(filePath, 'utf8') === content) {
+    return false;
+  }
+  fs.writeFileSync(filePath, content);
+  return true;
+}
+
+function renderPages(pages) {
+  for (const { values, dimValues } of pages) {
+    const page = generatePageContent(values, dimValues);
+    const pageDir = path.join(OUTPUT_DIR, page.slug);
+    
+    fs.mkdirSync(pageDir, { recursive: true });
+    fs.writeFileSync(path.join(pageDir, 'index.html'), page.html);
+  }
+}
+
+function renderInWorkers(pages) {
+  const workerCount = Math.min(os.cpus().length, Math.ceil(pages.length / PAGES_PER_WORKER));
+  if (workerCount <= 1) {
+    renderPages(pages);
+    return Promise.resolve();
+  }
   
-  return arrays.reduce((acc, curr) => {
-    const result = [];
-    for (const a of acc) {
-      for (const c of curr) {
-        result.push([...a, c]);
-      }
-    }
-    return result;
-  }, [[]]);
+  const slices = Array.from({ length: workerCount }, () => []);
+  pages.forEach((page, i) => slices[i % workerCount].push(page));
+  
+  console.log(`  Rendering on ${workerCount} worker threads`);
+  return Promise.all(slices.map(slice => new Promise((resolve, reject) => {
+    const worker = new Worker(__filename, { workerData: { pages: slice } });
+    worker.on('message', resolve);
+    worker.on('error', reject);
+    worker.on('exit', code => {
+      if (code !== 0) reject(new Error(`Render worker exited with code ${code}`));
+    });
+  })));
 }
 
-function generateSitemap(urls) {
-  const today = new Date().toISOString().split('T')[0];
+function sitemapChunk(slug) {
+  return parseInt(sha1(slug).slice(0, 8), 16) % SITEMAP_CHUNKS;
+}
+
+function generateSitemaps(manifest) {
+  const chunks = Array.from({ length: SITEMAP_CHUNKS }, () => []);
+  for (const slug of Object.keys(manifest.pages).sort()) {
+    chunks[sitemapChunk(slug)].push(slug);
+  }
   
-  let xml = `<?xml version="1.0" encoding="UTF-8"?>
+  const index = [];
+  let written = 0;
+  chunks.forEach((slugs, i) => {
+    const name = `${SITEMAP_CHUNK_PREFIX}${i}.xml`;
+    let lastmod = '';
+    let xml = `<?xml version="1.0" encoding="UTF-8"?>
 <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
 `;
-  
-  for (const url of urls) {
-    xml += `  <url>
-    <loc>${url}</loc>
-    <lastmod>${today}</lastmod>
+    
+    for (const slug of slugs) {
+      const page = manifest.pages[slug];
+      if (page.lastmod > lastmod) lastmod = page.lastmod;
+      xml += `  <url>
+    <loc>${dimensions.tool_url}/p/${slug}/</loc>
+    <lastmod>${page.lastmod}</lastmod>
     <changefreq>monthly</changefreq>
     <priority>0.6</priority>
   </url>
 `;
+    }
+    
+    xml += `</urlset>`;
+    
+    written += writeIfChanged(path.join(PUBLIC_DIR, name), xml);
+    index.push({ name, lastmod });
+  });
+  
+  // Chunks from a run with a larger SITEMAP_CHUNKS, and the old single sitemap
+  for (const file of fs.readdirSync(PUBLIC_DIR)) {
+    const match = file.match(new RegExp(`^${SITEMAP_CHUNK_PREFIX}(\\d+)\\.xml$`));
+    if (match && Number(match[1]) >= SITEMAP_CHUNKS) {
+      fs.rmSync(path.join(PUBLIC_DIR, file));
+    }
+  }
+  if (fs.existsSync(LEGACY_SITEMAP_PATH)) {
+    fs.rmSync(LEGACY_SITEMAP_PATH);
   }
   
-  xml += `</urlset>`;
-  
-  fs.writeFileSync(SITEMAP_PATH, xml);
-  console.log(`📍 Generated sitemap-programmatic.xml with ${urls.length} URLs`);
+  console.log(`📍 Rewrote ${written} of ${SITEMAP_CHUNKS} programmatic sitemap chunks`);
+  return index;
 }
 
-function generateMainSitemap() {
-  const today = new Date().toISOString().split('T')[0];
+function generateMainSitemap(manifest) {
+  // Only the tool URL goes into this sitemap, and a new tool URL resets the manifest
+  manifest.main_lastmod = manifest.main_lastmod || today();
+  const lastmod = manifest.main_lastmod;
   
   const xml = `<?xml version="1.0" encoding="UTF-8"?>
 <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
   <url>
     <loc>${dimensions.tool_url}</loc>
-    <lastmod>${today}</lastmod>
+    <lastmod>${lastmod}</lastmod>
     <changefreq>weekly</changefreq>
     <priority>1.0</priority>
   </url>
   <url>
     <loc>${dimensions.tool_url}/pricing</loc>
-    <lastmod>${today}</lastmod>
+    <lastmod>${lastmod}</lastmod>
     <changefreq>monthly</changefreq>
     <priority>0.8</priority>
   </url>
 </urlset>`;
   
-  fs.writeFileSync(SITEMAP_MAIN_PATH, xml);
-  console.log('📍 Generated sitemap-main.xml');
+  if (writeIfChanged(SITEMAP_MAIN_PATH, xml)) {
+    console.log('📍 Generated sitemap-main.xml');
+  }
 }
 
-function generateSitemapIndex() {
-  const xml = `<?xml version="1.0" encoding="UTF-8"?>
+function generateSitemapIndex(chunks) {
+  let xml = `<?xml version="1.0" encoding="UTF-8"?>
 <sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
   <sitemap>
     <loc>${dimensions.tool_url}/sitemap-main.xml</loc>
   </sitemap>
-  <sitemap>
-    <loc>${dimensions.tool_url}/sitemap-programmatic.xml</loc>
+`;
+  
+  for (const { name, lastmod } of chunks) {
+    xml += `  <sitemap>
+    <loc>${dimensions.tool_url}/${name}</loc>${lastmod ? `
+    <lastmod>${lastmod}</lastmod>` : ''}
   </sitemap>
-</sitemapindex>`;
+`;
+  }
+  
+  xml += `</sitemapindex>`;
   
-  fs.writeFileSync(SITEMAP_INDEX_PATH, xml);
-  console.log('📍 Generated sitemap.xml (sitemapindex)');
+  if (writeIfChanged(SITEMAP_INDEX_PATH, xml)) {
+    console.log('📍 Generated sitemap.xml (sitemapindex)');
+  }
+}
+
+async function reportPageCount(count) {
+  const url = process.env.SEO_METRICS_URL;
+  if (!url) return;
+  
+  try {
+    const response = await fetch(url, {
+      method: 'PUT',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Admin-Key': process.env.ADMIN_API_KEY || '',
+      },
+      body: JSON.stringify({ count }),
+    });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    console.log(`📈 Reported ${count} pages to ${url}`);
+  } catch (error) {
+    // The pages are already written; a missed metric shouldn't fail the build
+    console.warn(`⚠️  Could not report page count: ${error.message}`);
+  }
+}
+
+async function generateAllPages({ full = false } = {}) {
+  console.log(`🚀 Starting Programmatic SEO generation${full ? ' (full rebuild)' : ''}...`);
+  
+  if (full && fs.existsSync(OUTPUT_DIR)) {
+    fs.rmSync(OUTPUT_DIR, { recursive: true });
+  }
+  fs.mkdirSync(OUTPUT_DIR, { recursive: true });
+  
+  const previous = loadManifest(full);
+  const manifest = {
+    version: MANIFEST_VERSION,
+    tool_url: dimensions.tool_url,
+    main_lastmod: previous.main_lastmod,
+    pages: {},
+  };
+  
+  const pages = planPages();
+  const changed = [];
+  const date = today();
+  for (const page of pages) {
+    const old = previous.pages[page.slug];
+    const unchanged = old && old.hash === page.hash
+      && fs.existsSync(path.join(OUTPUT_DIR, page.slug, 'index.html'));
+    manifest.pages[page.slug] = { hash: page.hash, lastmod: unchanged ? old.lastmod : date };
+    if (!unchanged) changed.push(page);
+  }
+  
+  await renderInWorkers(changed);
+  
+  // Pages no longer produced by dimensions.json
+  let removed = 0;
+  for (const slug of Object.keys(previous.pages)) {
+    if (!manifest.pages[slug]) {
+      fs.rmSync(path.join(OUTPUT_DIR, slug), { recursive: true, force: true });
+      removed++;
+    }
+  }
+  
+  console.log(`\n📄 ${pages.length} pages: ${changed.length} written, ${removed} removed`);
+  
+  const chunks = generateSitemaps(manifest);
+  generateMainSitemap(manifest);
+  generateSitemapIndex(chunks);
+  
+  saveManifest(manifest);
+  console.log('✅ Programmatic SEO generation complete!');
+  return pages.length;
 }
 
 // Run
-const pageCount = generateAllPages();
-console.log(`\n🎉 Total: ${pageCount} programmatic SEO pages generated!`);
+if (isMainThread) {
+  generateAllPages({ full: process.argv.includes('--full') })
+    .then(async pageCount => {
+      console.log(`\n🎉 Total: ${pageCount} programmatic SEO pages generated!`);
+      await reportPageCount(pageCount);
+    })
+    .catch(error => {
+      console.error(error);
+      process.exit(1);
+    });
+} else {
+  renderPages(workerData.pages);
+  parentPort.postMessage(workerData.pages.length);
+}